@@ -0,0 +1,194 @@
+import collections
+import struct
+
+from .nrf24 import RF24_PAYLOAD, RF24_RX_ADDR
+from .rpc import RPC_STATUS
+
+
+#
+# Request/reply where replies travel inside the acknowledgement payload.
+#
+# The server never leaves RX mode and the client never leaves TX mode, so neither side pays for the PLL settle time
+# and SPI traffic of switching the radio around (compare "rr-client.py" and "rr-server.py"). The price is that a reply
+# must be staged in the ACK payload FIFO before the frame it is returned with arrives. A reply to request N is
+# therefore returned with the acknowledgement of the next frame sent by the client, which is either its next request
+# or a POLL frame sent by fetch(). Replies carry the request id they answer, so the client can tell them apart.
+#
+# The ACK payload FIFO of the NRF24L01 holds 3 payloads shared between all pipes. The server stages at most one reply
+# per pipe at any time, and keeps further replies queued until the staged one has been collected.
+#
+# When a request is lost, request() raises ConnectionError and the next request reuses its request id. The request may
+# have reached the server even so, when only the acknowledgement was lost. The server keeps the last request and reply
+# of each pipe, and answers a request with the same request id and body from there instead of calling the handler
+# again.
+#
+# Replies carry an RPC_STATUS: ERROR when the handler raised an exception or returned a reply that does not fit in an
+# acknowledgement payload.
+#
+#   Request:  <BB  protocol (0xE2), request id> + body
+#   Poll:     <B   protocol (0xE4)>
+#   Reply:    <BBB protocol (0xE3), request id, status> + body
+#
+
+REQUEST = 0xE2
+REPLY = 0xE3
+POLL = 0xE4
+
+_HEADER = struct.Struct('<BB')
+_REPLY = struct.Struct('<BBB')
+
+MAX_BODY = RF24_PAYLOAD.MAX - _REPLY.size
+
+_ACK_FIFO_SIZE = 3
+
+
+class AckReplyServer:
+    """
+    Serves requests by staging replies in the ACK payload FIFO. The handler is called with the pipe (0..5) and the
+    body of a request and returns the body of the reply, of at most MAX_BODY bytes. A default reply can be set for a
+    pipe with set_default(); it is staged whenever no other reply is waiting, so state can be returned without a
+    request round trip.
+    """
+
+    def __init__(self, nrf, handler=None):
+        self._nrf = nrf
+        self._handler = handler
+
+        self._queued = collections.defaultdict(collections.deque)   # pipe -> replies waiting to be staged.
+        self._staged = {}                                           # pipe -> True if a reply is in the ACK FIFO.
+        self._defaults = {}                                         # pipe -> default reply.
+        self._last = {}                                             # pipe -> (request, reply) handled last.
+        self._statistics = dict.fromkeys(('handled', 'replayed', 'errors'), 0)
+
+
+    def open_reading_pipe(self, pipe, address):
+        # Opens a reading pipe with acknowledgement payloads enabled.
+        self._nrf.open_reading_pipe(pipe, address, RF24_PAYLOAD.ACK)
+        self._stage(self._pipe_number(pipe))
+
+
+    def set_default(self, pipe, body):
+        pipe = self._pipe_number(pipe)
+        if len(body) > MAX_BODY:
+            raise ValueError(f'Reply too long ({len(body)} > {MAX_BODY} bytes).')
+        self._defaults[pipe] = _REPLY.pack(REPLY, 0xFF, RPC_STATUS.OK) + bytes(body)
+        self._stage(pipe)
+
+
+    def get_statistics(self):
+        return dict(self._statistics)
+
+
+    def poll(self):
+        # Handle received requests and stage their replies. Returns the number of frames received.
+        nrf = self._nrf
+        count = 0
+
+        while nrf.data_ready():
+            pipe = nrf.data_pipe()
+            frame = bytes(nrf.get_payload())
+            count += 1
+
+            # The frame was acknowledged with whatever was staged for the pipe.
+            self._staged.pop(pipe, None)
+
+            if len(frame) >= _HEADER.size and frame[0] == REQUEST and self._handler is not None:
+                last = self._last.get(pipe)
+                if last is not None and last[0] == frame:
+                    # The request was retransmitted after its acknowledgement was lost.
+                    self._statistics['replayed'] += 1
+                    if last[1] not in self._queued[pipe]:
+                        self._queued[pipe].append(last[1])
+                    continue
+
+                reply = self._handle(pipe, frame)
+                self._last[pipe] = (frame, reply)
+                self._queued[pipe].append(reply)
+
+        for pipe in list(self._queued) + list(self._defaults):
+            self._stage(pipe)
+
+        return count
+
+
+    def _handle(self, pipe, frame):
+        request_id = frame[1]
+        self._statistics['handled'] += 1
+        try:
+            body = bytes(self._handler(pipe, frame[_HEADER.size:]) or b'')
+        except Exception:
+            body = None
+
+        if body is None or len(body) > MAX_BODY:
+            self._statistics['errors'] += 1
+            return _REPLY.pack(REPLY, request_id, RPC_STATUS.ERROR)
+
+        return _REPLY.pack(REPLY, request_id, RPC_STATUS.OK) + body
+
+
+    def _stage(self, pipe):
+        if pipe in self._staged or len(self._staged) >= _ACK_FIFO_SIZE:
+            return
+
+        queued = self._queued.get(pipe)
+        if queued:
+            reply = queued.popleft()
+        elif pipe in self._defaults:
+            reply = self._defaults[pipe]
+        else:
+            return
+
+        self._nrf.ack_payload(pipe, reply)
+        self._staged[pipe] = True
+
+
+    @staticmethod
+    def _pipe_number(pipe):
+        if RF24_RX_ADDR.P0 <= pipe <= RF24_RX_ADDR.P5:
+            pipe -= RF24_RX_ADDR.P0
+        assert 0 <= pipe <= 5, "Pipe should be in range 0..5 or RF24_RX_ADDR.P0..RF24_RX_ADDR.P5."
+        return pipe
+
+
+class AckReplyClient:
+    """
+    Sends requests and collects replies from acknowledgement payloads. Replies are returned as (request id, status,
+    body) tuples, where a request id of 0xFF denotes a default reply set by the server, and status is RPC_STATUS.OK or
+    RPC_STATUS.ERROR.
+    """
+
+    def __init__(self, nrf, server):
+        self._nrf = nrf
+        self._next_id = 0
+        nrf.open_writing_pipe(server, RF24_PAYLOAD.ACK)
+
+
+    def request(self, body=b''):
+        # Send a request. Returns the request id and the reply carried by its acknowledgement (which answers an
+        # earlier request) or None. Raises ConnectionError if the request is lost, in which case the next request
+        # reuses the request id.
+        request_id = self._next_id
+
+        frame = _HEADER.pack(REQUEST, request_id) + bytes(body)
+        if len(frame) > RF24_PAYLOAD.MAX:
+            raise ValueError(f'Request too long ({len(body)} bytes).')
+
+        reply = self._exchange(frame)
+        self._next_id = (request_id + 1) % 0xFF
+        return request_id, reply
+
+
+    def fetch(self):
+        # Send a POLL frame to collect a staged reply. Returns a (request id, status, body) tuple or None.
+        return self._exchange(bytes([POLL]))
+
+
+    def _exchange(self, frame):
+        ack = self._nrf.exchange(frame)
+        if ack is None:
+            raise ConnectionError('Package lost.')
+
+        if len(ack) >= _REPLY.size and ack[0] == REPLY:
+            return ack[1], RPC_STATUS(ack[2]), bytes(ack[_REPLY.size:])
+
+        return None
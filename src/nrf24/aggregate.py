@@ -0,0 +1,146 @@
+import struct
+import time
+
+from .nrf24 import RF24_PAYLOAD
+
+
+#
+# Coalescing of small messages into full frames (Nagle style).
+#
+# Every frame sent by the NRF24L01 carries a fixed overhead of preamble, address, packet control field, CRC, and the
+# acknowledgement turnaround. For messages of 5 to 9 bytes most of the airtime goes to the overhead. The Coalescer
+# packs several length-prefixed records into a single frame, and sends the frame when the next record would not fit,
+# when the oldest record has waited for the configured delay, or when flush() is called.
+#
+# With a fixed payload size the frame is padded up to the payload size, so the number of records is sent in the header
+# and the receiver stops there rather than reading the padding as records.
+#
+#   Frame:  <BB protocol (0xC0), records> + records, each record being <B length> + bytes
+#
+
+AGGREGATE = 0xC0
+
+_HEADER = struct.Struct('<BB')
+
+MAX_RECORD = RF24_PAYLOAD.MAX - _HEADER.size - 1
+
+
+def pack_records(records, size=RF24_PAYLOAD.MAX):
+    # Pack as many length-prefixed records as will fit into size bytes. Returns the packed bytes and the number of
+    # records packed.
+    packed = bytearray()
+    count = 0
+    for record in records:
+        if len(packed) + 1 + len(record) > size:
+            break
+        packed.append(len(record))
+        packed += record
+        count += 1
+    return packed, count
+
+
+def iter_records(packed, count=None):
+    # Iterate over the length-prefixed records in packed, or over the first count of them. Stops at a record that
+    # runs past the end of packed.
+    i = 0
+    end = len(packed)
+    while i < end and count != 0:
+        length = packed[i]
+        if i + 1 + length > end:
+            return
+        yield bytes(packed[i + 1:i + 1 + length])
+        i += 1 + length
+        if count is not None:
+            count -= 1
+
+
+def unpack(payload):
+    # Iterate over the records of an aggregated frame. Payloads that are not aggregated frames are returned as a
+    # single record, so receivers can handle both kinds of frames the same way.
+    payload = bytes(payload)
+    if len(payload) >= _HEADER.size and payload[0] == AGGREGATE:
+        return iter_records(payload[_HEADER.size:], payload[1])
+    return iter((payload,))
+
+
+class Coalescer:
+    """
+    Packs records into frames of the payload size of the NRF24 (RF24_PAYLOAD.MAX with dynamic payloads).
+    """
+
+    def __init__(self, nrf, delay=0.01):
+        self._nrf = nrf
+        self._delay = delay
+        size = nrf.get_payload_size()
+        self._size = size if size >= RF24_PAYLOAD.MIN else RF24_PAYLOAD.MAX
+        assert self._size > _HEADER.size + 1, 'Payload size too small for aggregated frames.'
+
+        self._buffer = bytearray(_HEADER.size)
+        self._records = 0
+        self._first = None                          # Time the oldest buffered record was added.
+
+        self._frames = 0
+        self._lost = 0
+
+
+    def send(self, record):
+        # Add a record to the frame being built. The frame is sent first if the record does not fit.
+        record = bytes(record)
+        max_record = self._size - _HEADER.size - 1
+        if len(record) > max_record:
+            raise ValueError(f'Record too long ({len(record)} > {max_record} bytes).')
+
+        if len(self._buffer) + 1 + len(record) > self._size:
+            self.flush()
+
+        if self._first is None:
+            self._first = time.monotonic()
+        self._buffer.append(len(record))
+        self._buffer += record
+        self._records += 1
+
+        if len(self._buffer) == self._size:
+            self.flush()
+        else:
+            self.poll()
+
+
+    def poll(self):
+        # Send the frame if the oldest record has waited for the delay. Call this regularly when records are sent
+        # infrequently.
+        if self._first is not None and time.monotonic() - self._first >= self._delay:
+            self.flush()
+
+
+    def pending(self):
+        return self._records
+
+
+    def flush(self):
+        # Send the frame being built. Returns False if the frame was lost.
+        if not self._records:
+            return True
+
+        nrf = self._nrf
+        nrf.reset_packages_lost()
+        _HEADER.pack_into(self._buffer, 0, AGGREGATE, self._records)
+        nrf.send(self._buffer)
+
+        self._buffer = bytearray(_HEADER.size)
+        self._records = 0
+        self._first = None
+        self._frames += 1
+
+        try:
+            nrf.wait_until_sent()
+            if nrf.get_packages_lost() == 0:
+                return True
+        except TimeoutError:
+            pass
+
+        self._lost += 1
+        return False
+
+
+    def get_statistics(self):
+        return {'frames': self._frames, 'lost': self._lost}
@@ -0,0 +1,165 @@
+import math
+
+from .nrf24 import RF24_CRC, RF24_DATA_RATE, RF24_PAYLOAD, RF24_RX_ADDR
+
+
+#
+# Airtime and channel capacity estimates.
+#
+# An Enhanced ShockBurst packet consists of a 1 byte preamble, the address, a 9 bit packet control field, the payload
+# and the CRC. Before each transmission the module spends 130µs settling the PLL, and when an acknowledgement is
+# requested it spends another 130µs turning around to receive it. A lost packet is retransmitted after the auto
+# retransmit delay (ARD), which is counted from the end of one transmission to the start of the next, up to the auto
+# retransmit count (ARC) times.
+#
+# The figures are the timings given in the nRF24L01+ product specification (chapter 7). They do not include the time
+# spent on SPI transfers, which on a Raspberry PI is usually much longer than the time on air.
+#
+
+BITRATE = {
+    RF24_DATA_RATE.RATE_250KBPS: 250000,
+    RF24_DATA_RATE.RATE_1MBPS: 1000000,
+    RF24_DATA_RATE.RATE_2MBPS: 2000000,
+}
+
+PREAMBLE = 1                                        # Preamble in bytes.
+PCF_BITS = 9                                        # Packet control field in bits.
+T_SETTLE = 130e-6                                   # TX/RX settling time (Tstby2a).
+
+# Fraction of time a channel carries useful traffic when nodes transmit at random times (pure ALOHA, 1 / 2e).
+ALOHA = 1 / (2 * math.e)
+
+
+class AirtimeConfig:
+    """
+    The radio settings that decide the airtime of a packet. Use AirtimeConfig.from_nrf(nrf) to read them from a live
+    NRF24 instance. The functions below accept either an AirtimeConfig or an NRF24 instance.
+    """
+
+    def __init__(self, data_rate=RF24_DATA_RATE.RATE_1MBPS, address_bytes=5, crc_bytes=RF24_CRC.BYTES_2,
+                 payload_size=RF24_PAYLOAD.MAX, delay=1, retries=15, ack=True):
+        assert 3 <= address_bytes <= 5
+        assert RF24_PAYLOAD.ACK <= payload_size <= RF24_PAYLOAD.MAX
+        assert 0 <= delay < 16
+        assert 0 <= retries < 16
+
+        self.data_rate = RF24_DATA_RATE.from_value(data_rate)
+        self.address_bytes = address_bytes
+        self.crc_bytes = RF24_CRC.from_value(crc_bytes)
+        self.payload_size = payload_size            # Fixed payload size, or RF24_PAYLOAD.DYNAMIC/ACK.
+        self.delay = delay                          # ARD, (delay + 1) * 250µs.
+        self.retries = retries                      # ARC.
+        self.ack = ack                              # Auto acknowledgement.
+
+
+    @staticmethod
+    def from_nrf(nrf):
+        delay, retries = nrf.get_retransmission()
+        return AirtimeConfig(nrf.get_data_rate(), nrf.get_address_bytes(), nrf.get_crc_bytes(), nrf.get_payload_size(),
+                             delay, retries, nrf.get_auto_ack(RF24_RX_ADDR.P0))
+
+
+    def __repr__(self):
+        return f'AirtimeConfig(data_rate={self.data_rate.name}, address_bytes={self.address_bytes}, ' \
+               f'crc_bytes={self.crc_bytes.name}, payload_size={self.payload_size}, delay={self.delay}, ' \
+               f'retries={self.retries}, ack={self.ack})'
+
+
+def _config(config):
+    if isinstance(config, AirtimeConfig):
+        return config
+    return AirtimeConfig.from_nrf(config)
+
+
+def _length(config, length):
+    # Fixed size payloads are padded to the payload size.
+    if config.payload_size >= RF24_PAYLOAD.MIN:
+        return config.payload_size
+    if length is None:
+        return RF24_PAYLOAD.MAX
+    assert 0 <= length <= RF24_PAYLOAD.MAX
+    return length
+
+
+def _on_air(config, length):
+    bits = 8 * (PREAMBLE + config.address_bytes + length + int(config.crc_bytes)) + PCF_BITS
+    return bits / BITRATE[config.data_rate]
+
+
+def packet_time(config, length=None):
+    # Time on air in seconds of a packet with a payload of length bytes (default: the maximum payload).
+    config = _config(config)
+    return _on_air(config, _length(config, length))
+
+
+def ack_time(config, ack_length=0):
+    # Time on air in seconds of an acknowledgement carrying ack_length bytes of acknowledgement payload.
+    assert 0 <= ack_length <= RF24_PAYLOAD.MAX
+    return _on_air(_config(config), ack_length)
+
+
+def retransmit_delay(config):
+    # The auto retransmit delay (ARD) in seconds.
+    return (_config(config).delay + 1) * 250e-6
+
+
+def irq_delay(config):
+    # Time from the end of the last bit received until the IRQ is raised (Tirq).
+    return 6e-6 if _config(config).data_rate == RF24_DATA_RATE.RATE_250KBPS else 8.2e-6
+
+
+def exchange_time(config, length=None, ack_length=0):
+    # Time in seconds from the start of a transmission until TX_DS, when the first attempt is acknowledged. The
+    # acknowledgement carries ack_length bytes of acknowledgement payload.
+    config = _config(config)
+    t = T_SETTLE + packet_time(config, length)
+    if config.ack:
+        t += T_SETTLE + ack_time(config, ack_length) + irq_delay(config)
+    return t
+
+
+def attempt_time(config, length=None):
+    # Time in seconds taken by a transmission that is not acknowledged, until the retransmission starts. The PLL is
+    # settled once, before the first attempt.
+    config = _config(config)
+    return packet_time(config, length) + retransmit_delay(config)
+
+
+def failure_time(config, length=None):
+    # Time in seconds until MAX_RT, when no attempt is acknowledged.
+    config = _config(config)
+    if not config.ack:
+        return T_SETTLE + packet_time(config, length)
+    return T_SETTLE + (config.retries + 1) * attempt_time(config, length)
+
+
+def expected_time(config, length=None, ack_length=0, loss=0.0):
+    # Expected time in seconds to deliver a packet (or give up) when each attempt is lost with the probability given.
+    config = _config(config)
+    assert 0.0 <= loss <= 1.0
+    if not config.ack or loss == 0.0:
+        return exchange_time(config, length, ack_length)
+
+    attempts = config.retries + 1
+    t = 0.0
+    for i in range(attempts):
+        # Probability that attempt i is the first one to succeed.
+        t += (loss ** i) * (1 - loss) * (i * attempt_time(config, length) + exchange_time(config, length, ack_length))
+    return t + (loss ** attempts) * failure_time(config, length)
+
+
+def max_packet_rate(config, length=None, ack_length=0, loss=0.0):
+    # The maximum number of packets per second on a channel, when a single sender transmits back to back.
+    return 1 / expected_time(config, length, ack_length, loss)
+
+
+def duty_cycle(config, rate, length=None, ack_length=0, loss=0.0):
+    # Fraction of the time a node sending rate packets per second occupies the channel.
+    return rate * expected_time(config, length, ack_length, loss)
+
+
+def max_nodes(config, interval, length=None, ack_length=0, loss=0.0, efficiency=ALOHA):
+    # Estimate the number of nodes a channel can carry when each node sends a packet every interval seconds. The
+    # efficiency is the usable fraction of the channel: ALOHA for nodes sending at random times, close to 1.0 for
+    # scheduled access such as polling or TDMA.
+    return int(efficiency / duty_cycle(config, 1 / interval, length, ack_length, loss))
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import zlib
+
+import pigpio
+
+from .nrf24 import RF24_PAYLOAD, RF24_RX_ADDR
+
+
+#
+# Channel bonding: several radios of an NRF24Pool listening on the same address on different channels.
+#
+# A single channel carries at most one packet at a time, so a gateway with one radio is limited to the airtime of one
+# channel (see nrf24.airtime). With the radios of a pool each on their own channel, the senders are spread over the
+# channels by a hash of their identity, using assign_channel() on both sides, and the gateway receives on all
+# channels at once.
+#
+# The packets received by the radios are merged into one stream in order of the pigpio tick at which they were
+# received. By default that is the tick at which the RX FIFO of a radio was read. If the IRQ pins of the radios are
+# wired, pass their GPIOs and the tick of the falling edge of the IRQ is used instead, which is when the first packet
+# of the batch arrived. Packets from one radio keep their order. Packets are held back for a short time (latency)
+# before they are returned, so a packet read from one radio can still be ordered before a packet read earlier from
+# another radio. A packet that arrives after a later one has already been returned is returned right away, and counted
+# as late.
+#
+# Bonding adds airtime, not host time. Every payload read takes a few round trips to pigpiod, so the aggregate
+# throughput is bounded by the host well before a few channels at 2 Mbps are saturated.
+#
+
+def assign_channel(sender, channels):
+    # The channel a sender uses, from its identity (node id, address, or any bytes). Stable across processes and
+    # platforms, so senders and the gateway agree without any exchange.
+    if isinstance(sender, int):
+        sender = sender.to_bytes(8, 'little', signed=True)
+    elif isinstance(sender, str):
+        sender = sender.encode('utf-8')
+    return channels[zlib.crc32(bytes(sender)) % len(channels)]
+
+
+class BondedReceiver:
+    """
+    Receives on one address on the channels given, one radio of the pool per channel. Call process() as often as
+    possible; it returns the payloads received as a list of (tick, channel, payload) tuples in tick order.
+    """
+
+    def __init__(self, pool, address, channels, pipe=RF24_RX_ADDR.P1, size=RF24_PAYLOAD.DYNAMIC, irq=None,
+                 latency=0.002):
+        assert len(channels) == len(pool), 'One channel per radio of the pool.'
+        assert len(set(channels)) == len(channels), 'Channels must be distinct.'
+
+        self._pool = pool
+        self._pi = pool.get_pi()
+        self._channels = list(channels)
+        self._latency_us = int(latency * 1000000)
+        self._pending = []                          # Heap of (time, order, tick, radio, payload).
+        self._order = itertools.count()
+        self._tick = None                           # Last tick seen, and the time in µs it corresponds to.
+        self._time = 0
+        self._released = None                       # Time of the last packet returned.
+        self._late = 0
+        self._received = [0] * len(channels)
+        self._irq_ticks = [None] * len(channels)
+        self._callbacks = []
+
+        for radio, channel in enumerate(channels):
+            nrf = pool.get_radio(radio)
+            with pool.lock(radio):
+                nrf.set_channel(channel)
+                nrf.open_reading_pipe(pipe, address, size)
+
+        if irq is not None:
+            for radio, gpio in enumerate(irq):
+                if gpio is not None:
+                    self._callbacks.append(self._pi.callback(gpio, pigpio.FALLING_EDGE, self._irq(radio)))
+
+
+    def _irq(self, radio):
+        def callback(gpio, level, tick):
+            if self._irq_ticks[radio] is None:
+                self._irq_ticks[radio] = tick
+        return callback
+
+
+    def close(self):
+        # Cancel the IRQ callbacks.
+        for callback in self._callbacks:
+            callback.cancel()
+        self._callbacks = []
+
+
+    def get_channels(self):
+        return list(self._channels)
+
+
+    def get_statistics(self):
+        # The number of payloads received on each channel and their share of the total, and the number of payloads
+        # returned out of order.
+        total = sum(self._received)
+        channels = {channel: {'received': count, 'share': count / total if total else 0.0}
+                    for channel, count in zip(self._channels, self._received)}
+        return {'channels': channels, 'late': self._late}
+
+
+    def pending(self):
+        return len(self._pending)
+
+
+    def process(self):
+        received = self._pool.process()
+
+        first = {}
+        for tick, radio, _, payload in received:
+            self._received[radio] += 1
+            if radio not in first:
+                first[radio] = self._irq_ticks[radio]
+                self._irq_ticks[radio] = None
+                # An IRQ tick more than a second old is from a packet that was read with an earlier batch.
+                if first[radio] is None or pigpio.tickDiff(first[radio], tick) > 1000000:
+                    first[radio] = tick
+            heapq.heappush(self._pending, (self._unwrap(first[radio]), next(self._order), first[radio], radio,
+                                           payload))
+
+        now = self._unwrap(received[-1][0] if received else self._pi.get_current_tick())
+        released = []
+        channels = self._channels
+        while self._pending and (self._pending[0][0] <= now - self._latency_us or len(self._pending) > 256):
+            t, _, tick, radio, payload = heapq.heappop(self._pending)
+            if self._released is not None and t < self._released:
+                self._late += 1
+            else:
+                self._released = t
+            released.append((tick, channels[radio], payload))
+        return released
+
+
+    def _unwrap(self, tick):
+        # Time in µs of a tick, not wrapping around like the tick does every 72 minutes.
+        if self._tick is None:
+            self._tick = tick
+        d = (tick - self._tick) & 0xFFFFFFFF
+        if d >= 0x80000000:
+            d -= 0x100000000
+        t = self._time + d
+        if d > 0:
+            self._tick = tick
+            self._time = t
+        return t
@@ -0,0 +1,183 @@
+import itertools
+import struct
+
+from .nrf24 import RF24_PAYLOAD
+
+
+#
+# Compact encoding of slowly changing sensor readings.
+#
+# A reading is a tuple of values, for example (temperature, humidity). Each value is scaled to a fixed-point integer
+# (temperature * 100 keeps two decimals), and the difference to the previous reading of the same stream is written as
+# a zigzag varint. A difference between -64 and 63 takes a single byte, so a reading that costs 8 bytes with
+# struct.pack('<ff', ...) usually costs 2 bytes.
+#
+# Frames are self contained: the first reading in a frame is encoded relative to zero, so a lost frame does not affect
+# the decoding of the next one. Encoded frames fit in a single payload, and can also be used as records with the
+# Coalescer (see nrf24.aggregate).
+#
+# Decoding a frame reads all of its varints in one pass, looking most of them up in a table, and then adds up the
+# differences of each field with itertools.accumulate(). A frame that ends before its last reading raises ValueError.
+#
+#   Frame:  <BBB protocol (0xC1), stream, count> + readings
+#
+
+SERIES = 0xC1
+
+_HEADER = struct.Struct('<BBB')
+
+
+def _varint(n):
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+# Varint encodings of the most common (small) zigzag values, so that encoding is a table lookup for most values.
+_VARINT = [_varint(n) for n in range(1 << 14)]
+
+
+def _unzigzag(z):
+    return (z >> 1) ^ -(z & 1)
+
+
+# Zigzag decoded values of the single byte varints, so that decoding is a table lookup for most values.
+_DELTA = [_unzigzag(z) for z in range(0x80)]
+
+
+def zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def unzigzag(n):
+    return _unzigzag(n)
+
+
+def encode_varint(n):
+    return _VARINT[n] if n < 16384 else _varint(n)
+
+
+def decode_varint(data, offset):
+    # Return the value and the offset following it. Raises ValueError if the data ends within the varint.
+    result = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError('Truncated varint.')
+        b = data[offset]
+        offset += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, offset
+        shift += 7
+
+
+def _decode_deltas(data, offset, count):
+    # Decode count zigzag varints starting at offset. Returns the values and the offset following them.
+    deltas = []
+    append = deltas.append
+    table = _DELTA
+    end = len(data)
+    for _ in range(count):
+        if offset >= end:
+            raise ValueError('Truncated frame.')
+        b = data[offset]
+        if b < 0x80:
+            append(table[b])
+            offset += 1
+        else:
+            z, offset = decode_varint(data, offset)
+            append((z >> 1) ^ -(z & 1))
+    return deltas, offset
+
+
+class SeriesEncoder:
+
+    def __init__(self, scales, stream=0):
+        assert 0 <= stream <= 255
+        self._scales = tuple(scales)
+        self._stream = stream
+        self._previous = [0] * len(self._scales)
+
+
+    def reset(self):
+        self._previous = [0] * len(self._scales)
+
+
+    def encode(self, values):
+        # Encode a reading relative to the previous one and return the bytes.
+        out = bytearray()
+        previous = self._previous
+        table = _VARINT
+        for i, scale in enumerate(self._scales):
+            q = int(round(values[i] * scale))
+            z = ((q - previous[i]) << 1) ^ ((q - previous[i]) >> 63)
+            out += table[z] if z < 16384 else _varint(z)
+            previous[i] = q
+        return bytes(out)
+
+
+    def encode_frame(self, readings, size=RF24_PAYLOAD.MAX):
+        # Encode as many readings as will fit into size bytes. Returns the frame and the number of readings encoded.
+        self.reset()
+        body = bytearray()
+        count = 0
+        for values in readings:
+            if count == 255:
+                break
+            previous = list(self._previous)
+            encoded = self.encode(values)
+            if _HEADER.size + len(body) + len(encoded) > size:
+                self._previous = previous
+                break
+            body += encoded
+            count += 1
+        return _HEADER.pack(SERIES, self._stream, count) + body, count
+
+
+class SeriesDecoder:
+
+    def __init__(self, scales):
+        self._scales = tuple(scales)
+        self._previous = [0] * len(self._scales)
+
+
+    def reset(self):
+        self._previous = [0] * len(self._scales)
+
+
+    def decode(self, data, offset=0):
+        # Decode a reading starting at offset. Returns the values and the offset following the reading.
+        deltas, offset = _decode_deltas(data, offset, len(self._scales))
+        previous = self._previous
+        values = []
+        for i, scale in enumerate(self._scales):
+            q = previous[i] + deltas[i]
+            previous[i] = q
+            values.append(q / scale if scale != 1 else q)
+        return tuple(values), offset
+
+
+    def decode_frame(self, frame):
+        # Decode a frame created by SeriesEncoder.encode_frame(). Returns the stream and a list of readings.
+        frame = bytes(frame)
+        if len(frame) < _HEADER.size or frame[0] != SERIES:
+            raise ValueError('Not a series frame.')
+
+        _, stream, count = _HEADER.unpack_from(frame)
+        self.reset()
+        if not count:
+            return stream, []
+
+        # The deltas are interleaved by field. Each field is rebuilt from its deltas in one go.
+        fields = len(self._scales)
+        deltas, _ = _decode_deltas(frame, _HEADER.size, count * fields)
+        columns = []
+        for i, scale in enumerate(self._scales):
+            column = list(itertools.accumulate(deltas[i::fields]))
+            self._previous[i] = column[-1]
+            columns.append(column if scale == 1 else [q / scale for q in column])
+        return stream, list(zip(*columns))
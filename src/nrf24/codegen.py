@@ -0,0 +1,180 @@
+import argparse
+import json
+import re
+import struct
+import sys
+
+
+#
+# Code generation of message layouts shared by Python and the Arduino sketches.
+#
+# Message layouts are described once in a JSON schema file:
+#
+#   {
+#     "messages": [
+#       {"name": "dht22", "protocol": 1, "fields": [["temperature", "float"], ["humidity", "float"]]}
+#     ]
+#   }
+#
+# From this the generator writes a Python module with a Schema (see nrf24.schema) for each message registered in a
+# SchemaRegistry, and a C header with a packed struct for each message. The C header includes static_assert checks of
+# the size and field offsets computed on the Python side, so a sketch that does not agree with the Python layout
+# fails to compile instead of sending garbled payloads. The layout always starts with the protocol byte.
+#
+# Usage: python -m nrf24.codegen schema.json --python messages.py --header messages.h
+#
+
+# Field type -> (struct format, C type)
+TYPES = {
+    'uint8': ('B', 'uint8_t'),
+    'int8': ('b', 'int8_t'),
+    'uint16': ('H', 'uint16_t'),
+    'int16': ('h', 'int16_t'),
+    'uint32': ('I', 'uint32_t'),
+    'int32': ('i', 'int32_t'),
+    'float': ('f', 'float'),
+    'bool': ('?', 'bool'),
+}
+
+_BYTES = re.compile(r'^bytes\[(\d+)\]$')
+_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class Message:
+
+    def __init__(self, name, protocol, fields):
+        if not _NAME.match(name):
+            raise ValueError(f'Invalid message name "{name}".')
+        if not (0 <= protocol <= 255):
+            raise ValueError(f'Protocol of message "{name}" must be between 0 and 255.')
+
+        self.name = name
+        self.protocol = protocol
+        self.fields = []                            # (name, type, struct format, C type, C array length)
+
+        for field_name, field_type in fields:
+            if not _NAME.match(field_name) or field_name == 'protocol':
+                raise ValueError(f'Invalid field name "{field_name}" in message "{name}".')
+
+            m = _BYTES.match(field_type)
+            if m:
+                length = int(m.group(1))
+                self.fields.append((field_name, field_type, f'{length}s', 'uint8_t', length))
+            elif field_type in TYPES:
+                fmt, c_type = TYPES[field_type]
+                self.fields.append((field_name, field_type, fmt, c_type, None))
+            else:
+                raise ValueError(f'Unknown type "{field_type}" of field "{field_name}" in message "{name}".')
+
+        self.format = '<B' + ''.join(f[2] for f in self.fields)
+        self.size = struct.calcsize(self.format)
+
+        if self.size > 32:
+            raise ValueError(f'Message "{name}" is {self.size} bytes, which is more than the 32 bytes of a payload.')
+
+
+    def offsets(self):
+        # Return the offset of each field, the protocol byte first.
+        offsets = [('protocol', 0)]
+        offset = 1
+        for field_name, _, fmt, _, _ in self.fields:
+            offsets.append((field_name, offset))
+            offset += struct.calcsize('<' + fmt)
+        return offsets
+
+
+def load(path):
+    # Load messages from a JSON schema file.
+    with open(path, 'r') as f:
+        document = json.load(f)
+
+    messages = [Message(m['name'], m['protocol'], m['fields']) for m in document['messages']]
+
+    protocols = [m.protocol for m in messages]
+    for protocol in set(protocols):
+        if protocols.count(protocol) > 1:
+            raise ValueError(f'Protocol {protocol} is used by more than one message.')
+
+    return messages
+
+
+def generate_python(messages, source='schema'):
+    lines = [
+        f'# Generated by nrf24.codegen from {source}. Do not edit.',
+        'from nrf24.schema import Schema, SchemaRegistry',
+        '',
+        'registry = SchemaRegistry()',
+        '',
+    ]
+    for m in messages:
+        names = ', '.join(repr(f[0]) for f in m.fields)
+        lines.append(f'{m.name.upper()} = registry.register(Schema(0x{m.protocol:02x}, {m.format!r}, [{names}], {m.name!r}))')
+        lines.append(f'assert {m.name.upper()}.size == {m.size}')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def generate_c(messages, source='schema', guard='NRF24_MESSAGES_H'):
+    lines = [
+        f'// Generated by nrf24.codegen from {source}. Do not edit.',
+        f'#ifndef {guard}',
+        f'#define {guard}',
+        '',
+        '#include <assert.h>',
+        '#include <stddef.h>',
+        '#include <stdint.h>',
+        '#include <stdbool.h>',
+        '',
+    ]
+    for m in messages:
+        upper = m.name.upper()
+        lines.append(f'#define {upper}_PROTOCOL 0x{m.protocol:02x}')
+        lines.append(f'#define {upper}_SIZE {m.size}')
+        lines.append('')
+        lines.append(f'typedef struct __attribute__((packed)) {{')
+        lines.append('  uint8_t protocol;')
+        for field_name, _, _, c_type, length in m.fields:
+            if length is None:
+                lines.append(f'  {c_type} {field_name};')
+            else:
+                lines.append(f'  {c_type} {field_name}[{length}];')
+        lines.append(f'}} {m.name}_t;')
+        lines.append('')
+        lines.append(f'static_assert(sizeof({m.name}_t) == {m.size}, "{m.name}_t does not match the Python layout.");')
+        for field_name, offset in m.offsets():
+            lines.append(f'static_assert(offsetof({m.name}_t, {field_name}) == {offset}, "{m.name}_t.{field_name} does not match the Python layout.");')
+        lines.append('')
+    lines.append(f'#endif // {guard}')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m nrf24.codegen', description='Generate Python and C code for NRF24 message layouts.')
+    parser.add_argument('schema', type=str, help='JSON schema file describing the messages.')
+    parser.add_argument('--python', type=str, help='Python module to write.')
+    parser.add_argument('--header', type=str, help='C header to write.')
+    args = parser.parse_args(argv)
+
+    try:
+        messages = load(args.schema)
+    except (OSError, ValueError, KeyError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+
+    if args.python:
+        with open(args.python, 'w') as f:
+            f.write(generate_python(messages, args.schema))
+
+    if args.header:
+        with open(args.header, 'w') as f:
+            f.write(generate_c(messages, args.schema))
+
+    if not (args.python or args.header):
+        print(generate_python(messages, args.schema))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+import collections
+import time
+
+from .nrf24 import NRF24
+
+
+#
+# Downlink dispatch: sending to many nodes, on several channels, with the radios of an NRF24Pool.
+#
+# Sending to one node after the other with open_writing_pipe() and send() waits for every packet to be acknowledged
+# before the next one is started, and opens the writing pipe (and changes the channel) for every packet. The
+# Dispatcher keeps a queue per radio, and per destination (channel and address) within it, and runs all radios at the
+# same time from process():
+#
+#   - A destination stays on the radio it was given while it has packets queued or in flight, so its packets are sent
+#     in order. A new destination is given to the radio with the fewest packets queued, preferring on a tie a radio
+#     already tuned to its channel, so destinations on the same channel tend to share a radio.
+#   - A radio sends up to burst packets to the same destination before it moves on to the next one, changing channel
+#     and writing pipe only when the destination changes, and only when its TX FIFO is empty.
+#   - Packets to the same destination are loaded into the TX FIFO back to back, up to 3 at a time, so the radio
+#     sends the next packet as soon as the previous one is acknowledged.
+#
+# When MAX_RT occurs, the packet at the head of the TX FIFO failed and the packets after it were never sent, but the
+# ones before it may have been. All packets in flight are queued again, and the radio continues with one packet at a
+# time until a packet has been acknowledged, so that a packet that fails on its own can be given up (see get_failed()).
+# A node may therefore receive a packet twice, as it does when an acknowledgement is lost.
+#
+# The radios are left in RX mode when they have nothing to send. Do not use send() of the pool together with a
+# Dispatcher.
+#
+
+# Packets in the TX FIFO of the NRF24L01.
+FIFO_DEPTH = 3
+
+
+class _Transmitter:
+
+    def __init__(self, nrf, lock):
+        self.nrf = nrf
+        self.lock = lock
+        self.destinations = collections.OrderedDict()   # (channel, address) -> deque of (payload, time queued).
+        self.queued = 0
+        self.current = None                         # Destination being sent to.
+        self.burst = 0                              # Packets sent to it since it became current.
+        self.channel = None                         # Channel and writing address the radio is set to.
+        self.address = None
+        self.in_flight = []                         # (payload, time queued) loaded into the TX FIFO.
+        self.window = FIFO_DEPTH
+        self.loaded_at = None
+        self.transmitting = False
+        self.sent = 0
+        self.lost = 0
+        self.retransmitted = 0
+        self.switches = 0                           # Times the writing pipe was opened.
+        self.retunes = 0                            # Times the channel was changed.
+
+
+class Dispatcher:
+    """
+    Sends payloads to (channel, address) destinations with all radios of the pool. Queue payloads with send(), and
+    call process() as often as possible, or flush() to wait until everything has been sent.
+    """
+
+    def __init__(self, pool, burst=16, timeout=0.05, queue_size=256):
+        assert burst > 0
+        self._pool = pool
+        self._burst = burst
+        self._timeout = timeout
+        self._queue_size = queue_size
+        self._transmitters = [_Transmitter(pool.get_radio(radio), pool.lock(radio)) for radio in range(len(pool))]
+        self._assigned = {}                         # (channel, address) -> radio.
+        self._failed = []
+        self._latency = 0.0                         # Sum of the latency of the packets sent.
+
+
+    def send(self, channel, address, payload):
+        # Queue a payload for the node listening on address and channel. Returns the index of the radio that will
+        # send it, or None if its queue is full.
+        assert 0 <= channel <= 125
+        transmitters = self._transmitters
+        key = (channel, bytes(transmitters[0].nrf.make_address(address)))
+
+        radio = self._assigned.get(key)
+        if radio is None:
+            radio = min(range(len(transmitters)),
+                        key=lambda i: (transmitters[i].queued + len(transmitters[i].in_flight),
+                                       transmitters[i].channel != channel))
+        t = transmitters[radio]
+        if t.queued >= self._queue_size:
+            return None
+
+        queue = t.destinations.get(key)
+        if queue is None:
+            queue = t.destinations[key] = collections.deque()
+        queue.append((bytes(payload), time.monotonic()))
+        t.queued += 1
+        self._assigned[key] = radio
+        return radio
+
+
+    def pending(self, radio=None):
+        # The number of packets queued or in flight.
+        if radio is None:
+            return sum(t.queued + len(t.in_flight) for t in self._transmitters)
+        t = self._transmitters[radio]
+        return t.queued + len(t.in_flight)
+
+
+    def process(self):
+        # Advance transmission on every radio. Returns True while packets are in flight.
+        busy = False
+        for t in self._transmitters:
+            with t.lock:
+                busy |= self._advance(t)
+        return busy
+
+
+    def flush(self, timeout=None):
+        # Process until all packets have been sent or have failed. Returns True if nothing is pending.
+        start = time.monotonic()
+        while self.pending():
+            if timeout is not None and time.monotonic() - start > timeout:
+                return False
+            self.process()
+            time.sleep(0.00025)
+
+        self.process()
+        return True
+
+
+    def get_failed(self):
+        # Return the (channel, address, payload) of packets given up since the last call.
+        failed = self._failed
+        self._failed = []
+        return failed
+
+
+    def get_statistics(self, radio=None):
+        # The number of packets sent, lost and retransmitted, the number of times the writing pipe was opened and the
+        # channel changed, and the mean time from send() until the packet was acknowledged.
+        transmitters = self._transmitters if radio is None else [self._transmitters[radio]]
+        sent = sum(t.sent for t in transmitters)
+        statistics = {'sent': sent, 'lost': sum(t.lost for t in transmitters),
+                      'retransmitted': sum(t.retransmitted for t in transmitters),
+                      'switches': sum(t.switches for t in transmitters),
+                      'retunes': sum(t.retunes for t in transmitters),
+                      'queued': sum(t.queued + len(t.in_flight) for t in transmitters)}
+        if radio is None:
+            statistics['latency'] = self._latency / sent if sent else 0.0
+        return statistics
+
+
+    def _advance(self, t):
+        nrf = t.nrf
+
+        if t.in_flight:
+            status = nrf.get_status()
+
+            if status & NRF24.MAX_RT:
+                # The packet at the head of the TX FIFO failed. Clear MAX_RT so the radio sends again.
+                nrf.flush_tx()
+                nrf.power_up_rx()
+                self._requeue(t)
+            elif nrf.is_tx_empty():
+                # Everything loaded into the TX FIFO has been acknowledged.
+                now = time.monotonic()
+                for _, queued_at in t.in_flight:
+                    self._latency += now - queued_at
+                t.sent += len(t.in_flight)
+                t.in_flight = []
+                t.window = FIFO_DEPTH
+            elif time.monotonic() - t.loaded_at > self._timeout:
+                nrf.flush_tx()
+                nrf.power_up_rx()
+                self._requeue(t)
+
+        if not t.in_flight:
+            # Only change destination when the TX FIFO is empty.
+            key = self._next_destination(t)
+            if key is None:
+                if t.transmitting:
+                    # Leave TX mode once the last packet has been acknowledged.
+                    nrf.power_up_rx()
+                    t.transmitting = False
+                return False
+
+            channel, address = key
+            if t.channel != channel:
+                nrf.set_channel(channel)
+                t.channel = channel
+                t.retunes += 1
+            if t.address != address:
+                nrf.open_writing_pipe(address)
+                t.address = address
+                t.switches += 1
+
+        # Fill the TX FIFO with packets to the current destination.
+        queue = t.destinations.get(t.current)
+        while queue and len(t.in_flight) < t.window and t.burst < self._burst:
+            if t.in_flight and nrf.is_tx_full():
+                break
+            entry = queue.popleft()
+            nrf.load_payload(entry[0])
+            t.in_flight.append(entry)
+            t.queued -= 1
+            t.burst += 1
+            t.loaded_at = time.monotonic()
+            t.transmitting = True
+
+        return bool(t.in_flight)
+
+
+    def _next_destination(self, t):
+        # Stay with the current destination for up to burst packets, then move on to the next destination with
+        # packets queued, in round-robin order. Destinations without packets are forgotten.
+        destinations = t.destinations
+        current = t.current
+        if current is not None and destinations.get(current) and t.burst < self._burst:
+            return current
+
+        t.burst = 0
+        for key in list(destinations):
+            destinations.move_to_end(key)
+            if destinations[key]:
+                t.current = key
+                return key
+            del destinations[key]
+            del self._assigned[key]
+
+        t.current = None
+        return None
+
+
+    def _requeue(self, t):
+        # Put the packets in flight back at the front of the queue of the destination in their original order. A
+        # packet that failed on its own is given up.
+        in_flight = t.in_flight
+        t.in_flight = []
+
+        if len(in_flight) == 1:
+            t.lost += 1
+            self._failed.append(t.current + (in_flight[0][0],))
+            in_flight = []
+
+        t.window = 1
+        t.destinations[t.current].extendleft(reversed(in_flight))
+        t.queued += len(in_flight)
+        t.retransmitted += len(in_flight)
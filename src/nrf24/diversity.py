@@ -0,0 +1,96 @@
+import collections
+import time
+
+from .nrf24 import RF24_PAYLOAD, RF24_RX_ADDR
+
+
+#
+# Diversity reception: two or more radios of an NRF24Pool listening on the same channel and address, for example with
+# their antennas a quarter wavelength or more apart, so that a packet lost to multipath at one of them is usually
+# received by another.
+#
+# Every packet is delivered once: the first copy read from any radio is returned, and copies read from the other radios
+# within the window are dropped. Copies are recognised by the pipe and the payload, so a sender that sends the same
+# payload twice within the window must make the payloads differ, for example with a sequence number. The window must
+# also cover the time a copy can wait in the RX FIFO of a radio before process() reads it.
+#
+# Only the first radio of the pool acknowledges packets. The others have auto acknowledgement disabled, so the sender
+# never sees acknowledgements from more than one radio colliding on the air. Packets the first radio misses are still
+# delivered by the others, but the sender sees them as lost and retransmits them; the retransmissions are dropped as
+# copies. The statistics give the share of the packets received by each radio, and how often each radio delivered a
+# packet first.
+#
+
+class DiversityReceiver:
+    """
+    Receives on one channel and address with all radios of the pool. Call process() as often as possible; it returns
+    the payloads received as a list of (pipe, payload) tuples, without duplicates.
+    """
+
+    def __init__(self, pool, address, channel=76, pipe=RF24_RX_ADDR.P1, size=RF24_PAYLOAD.DYNAMIC, window=0.05):
+        assert len(pool) >= 2, 'Diversity needs at least two radios.'
+        assert window > 0
+
+        self._pool = pool
+        self._window = window
+        self._seen = {}                             # (pipe, payload) -> time last seen.
+        self._expiry = collections.deque()          # (time, (pipe, payload)) in the order seen.
+
+        count = len(pool)
+        self._copies = [0] * count
+        self._wins = [0] * count
+        self._delivered = 0
+        self._duplicates = 0
+
+        for radio in range(count):
+            nrf = pool.get_radio(radio)
+            with pool.lock(radio):
+                nrf.set_channel(channel)
+                nrf.open_reading_pipe(pipe, address, size)
+                if radio > 0:
+                    nrf.set_auto_ack(False)
+
+
+    def get_statistics(self):
+        # The number of packets delivered and of copies dropped. For each radio, the number of copies it received
+        # and their share of the packets delivered (its reception rate), and how often it delivered a packet first.
+        delivered = self._delivered
+        radios = [{'copies': copies, 'reception': copies / delivered if delivered else 0.0, 'wins': wins,
+                   'win_rate': wins / delivered if delivered else 0.0}
+                  for copies, wins in zip(self._copies, self._wins)]
+        return {'delivered': delivered, 'duplicates': self._duplicates, 'radios': radios}
+
+
+    def reset_statistics(self):
+        self._copies = [0] * len(self._copies)
+        self._wins = [0] * len(self._wins)
+        self._delivered = 0
+        self._duplicates = 0
+
+
+    def process(self):
+        now = time.monotonic()
+        seen = self._seen
+        expiry = self._expiry
+
+        # Forget packets seen before the window.
+        while expiry and expiry[0][0] <= now - self._window:
+            t, key = expiry.popleft()
+            if seen.get(key) == t:
+                del seen[key]
+
+        received = []
+        for _, radio, pipe, payload in self._pool.process():
+            self._copies[radio] += 1
+            key = (pipe, payload)
+            if key in seen:
+                self._duplicates += 1
+            else:
+                self._wins[radio] += 1
+                self._delivered += 1
+                received.append(key)
+            # A copy extends the window, so retransmissions arriving over a longer time are all dropped.
+            seen[key] = now
+            expiry.append((now, key))
+
+        return received
@@ -0,0 +1,163 @@
+import collections
+import random
+
+import pigpio
+
+
+#
+# Fault injection for the simulator (see nrf24.simulator).
+#
+# A Faults instance is attached to a Simulator with sim.set_faults(faults). It decides, packet by packet and receiver
+# by receiver, whether a packet is lost, lost in a burst (Gilbert-Elliott), or hit by bit errors. Bit errors make the
+# CRC fail, so the packet is dropped, unless CRC is disabled in which case the payload is delivered with the bits
+# flipped. Acknowledgements can be lost on their own. Impairments apply to all links by default, and can be set per
+# link (sender radio, receiver radio) with set_link().
+#
+# On the host side, SimulatedPi instances of the simulator ask the Faults instance whether an SPI transfer fails
+# (raises pigpio.error), returns garbage (MISO stuck high or low, so STATUS reads 0xFF or 0x00), or whether pigpiod is
+# disconnected. During a disconnect every call raises ConnectionError. When the connection comes back, pigpiod has
+# restarted: SPI handles opened before are invalid, and the GPIO modes are reset, which drops CE.
+#
+# Faults use their own random generator, so a scenario is reproducible from its seed regardless of the traffic.
+#
+
+class GilbertElliott:
+    """
+    Two state burst loss model. In the good state packets are lost with probability loss_good, in the bad state with
+    probability loss_bad. Before each packet the state changes from good to bad with probability p, and from bad to
+    good with probability r. The mean burst length is 1 / r packets.
+    """
+
+    def __init__(self, p=0.01, r=0.25, loss_good=0.0, loss_bad=1.0):
+        assert 0.0 <= p <= 1.0 and 0.0 < r <= 1.0
+        self.p = p
+        self.r = r
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+
+
+    def loss(self):
+        # The average loss ratio.
+        bad = self.p / (self.p + self.r)
+        return (1 - bad) * self.loss_good + bad * self.loss_bad
+
+
+class _Link:
+
+    def __init__(self, loss=0.0, burst=None, ber=0.0, ack_loss=0.0):
+        assert 0.0 <= loss <= 1.0 and 0.0 <= ber < 1.0 and 0.0 <= ack_loss <= 1.0
+        self.loss = loss
+        self.burst = burst
+        self.ber = ber
+        self.ack_loss = ack_loss
+
+
+class Faults:
+
+    def __init__(self, seed=None, loss=0.0, burst=None, ber=0.0, ack_loss=0.0, spi_error=0.0, spi_garbage=0.0):
+        self.random = random.Random(seed)
+        self._default = _Link(loss, burst, ber, ack_loss)
+        self._links = {}
+        self._bad = set()                           # Links in the bad state of their burst model.
+        self._spi_error = spi_error
+        self._spi_garbage = spi_garbage
+        self._disconnects = []                      # (start, end, pi or None)
+        self._statistics = collections.Counter()
+
+
+    def set_link(self, sender, receiver, loss=0.0, burst=None, ber=0.0, ack_loss=0.0, symmetric=True):
+        # Set the impairments of the link from sender to receiver (both Radio instances), and the other way round
+        # unless symmetric=False. Burst state is kept per direction.
+        self._links[(sender, receiver)] = _Link(loss, burst, ber, ack_loss)
+        if symmetric:
+            self._links[(receiver, sender)] = _Link(loss, burst, ber, ack_loss)
+
+
+    def set_spi(self, error=0.0, garbage=0.0):
+        # Probability of an SPI transfer raising pigpio.error, and of it returning garbage.
+        self._spi_error = error
+        self._spi_garbage = garbage
+
+
+    def disconnect(self, start, duration, pi=None):
+        # Disconnect pigpiod from start (virtual time) for duration seconds, for one SimulatedPi or for all of them.
+        self._disconnects.append((start, start + duration, pi))
+
+
+    def random_disconnects(self, until, interval, duration, pi=None):
+        # Disconnect at random times until the virtual time given, on average every interval seconds, each disconnect
+        # lasting duration seconds on average.
+        t = self.random.expovariate(1 / interval)
+        while t < until:
+            length = self.random.expovariate(1 / duration)
+            self.disconnect(t, length, pi)
+            t += length + self.random.expovariate(1 / interval)
+
+
+    def get_statistics(self):
+        return dict(self._statistics)
+
+
+    # Simulator hooks.
+
+    def deliver(self, packet, receiver):
+        # Return the packet as the receiver gets it, or None if it is lost.
+        link = self._links.get((packet.sender, receiver), self._default)
+        draw = self.random.random
+
+        if packet.ack and link.ack_loss and draw() < link.ack_loss:
+            self._statistics['ack_lost'] += 1
+            return None
+
+        if link.loss and draw() < link.loss:
+            self._statistics['lost'] += 1
+            return None
+
+        if link.burst is not None:
+            burst = link.burst
+            key = (packet.sender, receiver)
+            if key in self._bad:
+                if draw() < burst.r:
+                    self._bad.discard(key)
+            elif draw() < burst.p:
+                self._bad.add(key)
+            if draw() < (burst.loss_bad if key in self._bad else burst.loss_good):
+                self._statistics['burst_lost'] += 1
+                return None
+
+        if link.ber:
+            bits = packet.bits()
+            if draw() < 1 - (1 - link.ber) ** bits:
+                if packet.crc_bytes:
+                    self._statistics['crc_failed'] += 1
+                    return None
+                # Without CRC the errors go unnoticed. Flip a bit of the payload (errors elsewhere in the packet would
+                # most likely make the address not match).
+                if packet.payload:
+                    payload = bytearray(packet.payload)
+                    bit = self.random.randrange(len(payload) * 8)
+                    payload[bit >> 3] ^= 1 << (bit & 7)
+                    packet = packet.copy(bytes(payload))
+                    self._statistics['corrupted'] += 1
+
+        return packet
+
+
+    def is_disconnected(self, pi, now):
+        for start, end, target in self._disconnects:
+            if start <= now < end and (target is None or target is pi):
+                return True
+        return False
+
+
+    def spi_xfer(self, data, out):
+        # Return the bytes the host reads for an SPI transfer, or raise pigpio.error.
+        if self._spi_error and self.random.random() < self._spi_error:
+            self._statistics['spi_error'] += 1
+            raise pigpio.error('SPI transfer failed.')
+
+        if self._spi_garbage and self.random.random() < self._spi_garbage:
+            self._statistics['spi_garbage'] += 1
+            return [0xFF if self.random.random() < 0.5 else 0x00] * len(out)
+
+        return out
@@ -0,0 +1,186 @@
+import collections
+import struct
+import time
+
+from .reliable import ReliableChannel, MAX_PAYLOAD as _RELIABLE_PAYLOAD
+
+
+#
+# Multi-hop tree networking on top of NRF24, in the style of RF24Network.
+#
+# Nodes are addressed with octal numbers where each digit is one level in the tree. The master is 0, its children are
+# 1 to 4, the children of node 2 are 012, 022, 032, and 042 (written octal, read right to left), and so on for up to
+# 4 levels. A node listens for its children on pipes 1 to 4 (pipe = the child's digit) and for its parent on pipe 5.
+# The pipe addresses of a node only differ in the first byte, so they satisfy the P2-P5 prefix rule.
+#
+# Frames are routed one hop at a time: down the tree if the destination is below the node, otherwise up towards the
+# master. Each hop is a ReliableChannel, so frames are pipelined through the TX FIFO, retransmitted when lost, and
+# duplicates are dropped by the next hop. Frames waiting for a hop are queued per hop (store-and-forward).
+#
+#   Frame:  <HHBB from node, to node, id, type> + payload
+#
+
+_HEADER = struct.Struct('<HHBB')
+
+MAX_PAYLOAD = _RELIABLE_PAYLOAD - _HEADER.size
+
+MAX_LEVELS = 4
+MAX_CHILDREN = 4
+PARENT_PIPE = 5
+
+_PIPE_BYTES = (0x3C, 0x5A, 0x69, 0x96, 0xA5, 0xC3)
+
+
+def level(node):
+    # Return the number of octal digits of the node address, the master being level 0.
+    n = 0
+    while node:
+        node >>= 3
+        n += 1
+    return n
+
+
+def parent(node):
+    return node & ((1 << (3 * (level(node) - 1))) - 1)
+
+
+def digit(node):
+    # Return the last digit of the node address, that is the position of the node among its siblings.
+    return node >> (3 * (level(node) - 1))
+
+
+def is_valid(node):
+    if level(node) > MAX_LEVELS:
+        return False
+    while node:
+        if not (1 <= node & 7 <= MAX_CHILDREN):
+            return False
+        node >>= 3
+    return True
+
+
+def is_descendant(node, ancestor):
+    depth = level(ancestor)
+    return level(node) > depth and node & ((1 << (3 * depth)) - 1) == ancestor
+
+
+def pipe_address(node, pipe, width=5):
+    # Return the address a node listens on for the pipe given.
+    return bytes([_PIPE_BYTES[pipe], node & 0xFF, node >> 8, 0xCE, 0xCC][:width])
+
+
+class MeshMessage:
+
+    def __init__(self, from_node, to_node, message_id, message_type, payload):
+        self.from_node = from_node
+        self.to_node = to_node
+        self.message_id = message_id
+        self.message_type = message_type
+        self.payload = payload
+        self.received = time.monotonic()
+
+
+class MeshNode:
+
+    def __init__(self, nrf, node, window=8, timeout=0.05, max_attempts=5):
+        if not is_valid(node):
+            raise ValueError(f'Invalid node address 0{node:o}.')
+
+        self._nrf = nrf
+        self._node = node
+        self._width = nrf.get_address_bytes()
+        self._next_id = 0
+
+        self._routes = {}                           # destination -> address of next hop.
+        self._inbox = collections.deque()
+        self._forwarded = 0
+
+        # The source id given to the reliable channel must be unique among the neighbours of the next hop. The
+        # parent and the children of a node are on different levels, so the level and digit together are unique.
+        source = (level(node) << 3) | (digit(node) if node else 0)
+        self._channel = ReliableChannel(nrf, source, window=window, timeout=timeout, max_attempts=max_attempts)
+
+        # Listen for children on pipes 1..4, and for the parent on pipe 5.
+        pipes = {pipe: pipe_address(node, pipe, self._width) for pipe in range(1, MAX_CHILDREN + 1)}
+        if node:
+            pipes[PARENT_PIPE] = pipe_address(node, PARENT_PIPE, self._width)
+        nrf.open_reading_pipes(pipes)
+
+
+    def get_node(self):
+        return self._node
+
+
+    def send(self, to_node, payload, message_type=0):
+        # Queue a message for the node given. Returns the message id.
+        payload = bytes(payload)
+        if len(payload) > MAX_PAYLOAD:
+            raise ValueError(f'Payload too long ({len(payload)} > {MAX_PAYLOAD} bytes).')
+        if to_node == self._node or not is_valid(to_node):
+            raise ValueError(f'Invalid destination 0{to_node:o}.')
+
+        message_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xFF
+        self._route(_HEADER.pack(self._node, to_node, message_id, message_type) + payload, to_node)
+        return message_id
+
+
+    def update(self):
+        # Receive frames, deliver those for this node, queue the rest for their next hop, and advance transmission.
+        # Call this often; relay nodes should call it in a tight loop.
+        for _, frame in self._channel.receive():
+            if len(frame) < _HEADER.size:
+                continue
+
+            from_node, to_node, message_id, message_type = _HEADER.unpack_from(frame)
+            if to_node == self._node:
+                self._inbox.append(MeshMessage(from_node, to_node, message_id, message_type, frame[_HEADER.size:]))
+            elif is_valid(to_node):
+                self._route(frame, to_node)
+                self._forwarded += 1
+
+        self._channel.process()
+
+
+    def available(self):
+        return len(self._inbox)
+
+
+    def read(self):
+        # Return the next message received for this node, or None.
+        return self._inbox.popleft() if self._inbox else None
+
+
+    def pending(self):
+        return self._channel.pending()
+
+
+    def get_failed(self):
+        return self._channel.get_failed()
+
+
+    def get_statistics(self):
+        statistics = self._channel.get_statistics()
+        statistics['forwarded'] = self._forwarded
+        return statistics
+
+
+    def _route(self, frame, to_node):
+        address = self._routes.get(to_node)
+        if address is None:
+            address = self._routes[to_node] = self._next_hop(to_node)
+        self._channel.send(address, frame)
+
+
+    def _next_hop(self, to_node):
+        node = self._node
+        if is_descendant(to_node, node):
+            # Down the tree: to the child of this node on the path to the destination.
+            child = to_node & ((1 << (3 * (level(node) + 1))) - 1)
+            return pipe_address(child, PARENT_PIPE, self._width)
+
+        if node == 0:
+            raise ValueError(f'No route to 0{to_node:o}.')
+
+        # Up the tree: to the pipe of the parent reserved for this node.
+        return pipe_address(parent(node), digit(node), self._width)
@@ -0,0 +1,259 @@
+import collections
+import struct
+import time
+
+from .nrf24 import RF24_RX_ADDR
+
+
+#
+# Coordinated channel migration between a gateway and its nodes.
+#
+# The gateway announces a channel switch by placing an announcement in the acknowledgement payload returned to every
+# node that sends to it. The announcement holds the target channel, an epoch number, and the number of milliseconds
+# until the switch takes place. Both sides switch when the countdown expires, and nodes then send a HELLO frame on the
+# new channel so the gateway knows who has arrived. Nodes that missed the announcement will notice that their messages
+# are lost, and will search the channel plan until the gateway answers.
+#
+# All nodes write to the gateway address, so a node keeps its P0 closed except while sending. Otherwise it would
+# acknowledge the frames of the other nodes, and the acknowledgements would collide with those of the gateway.
+#
+# Control frames use protocol bytes at the top of the range (0xF0..0xFF) so that they can share the pipe with ordinary
+# application payloads that carry their own protocol byte in payload[0] (see "simple-sender.py").
+#
+
+MIGRATE = 0xF0                  # Gateway -> node: <BBBH protocol, epoch, channel, switch in ms.
+HELLO = 0xF1                    # Node -> gateway: <B protocol followed by the node id.
+
+_MIGRATE = struct.Struct('<BBBH')
+_HELLO = struct.Struct('<B')
+
+
+def is_control(payload):
+    return len(payload) > 0 and payload[0] in (MIGRATE, HELLO)
+
+
+class MigrationGateway:
+    """
+    Gateway side of the channel migration protocol.
+
+    The reading pipe used by the gateway must be opened with RF24_PAYLOAD.ACK so that announcements can be returned
+    in the acknowledgement payloads.
+    """
+
+    def __init__(self, nrf, pipe=RF24_RX_ADDR.P1, switch_delay=2.0):
+        self._nrf = nrf
+        self._pipe = pipe
+        self._switch_delay = switch_delay
+
+        self._epoch = 0                     # Epoch of the last announcement.
+        self._generation = 0                # Incremented every time the gateway changes channel.
+        self._target = None                 # Target channel of a pending migration.
+        self._switch_at = None              # Monotonic time at which the pending migration takes place.
+
+        self._received = collections.deque()
+        self._nodes = {}                    # node id -> generation of last HELLO received.
+
+
+    def get_epoch(self):
+        return self._epoch
+
+
+    def is_migrating(self):
+        return self._target is not None
+
+
+    def migrate(self, channel, switch_delay=None):
+        # Start a migration to the channel given. The switch takes place when the delay has passed and poll() is
+        # called.
+        assert 0 <= channel <= 125
+
+        if switch_delay is None:
+            switch_delay = self._switch_delay
+
+        self._epoch = (self._epoch + 1) & 0xFF
+        self._target = channel
+        self._switch_at = time.monotonic() + switch_delay
+        self._stage_announcement()
+
+
+    def confirmed_nodes(self):
+        # Return the id of the nodes that have checked in on the current channel.
+        return [node for node, generation in self._nodes.items() if generation == self._generation]
+
+
+    def poll(self):
+        # Receive pending payloads, refresh the announcement, and carry out the switch when it is due. Application
+        # payloads are returned as a list of (pipe, payload) tuples.
+        self._drain()
+
+        if self._target is not None:
+            if time.monotonic() >= self._switch_at:
+                self._switch()
+            else:
+                self._stage_announcement()
+
+        received = list(self._received)
+        self._received.clear()
+        return received
+
+
+    def _drain(self):
+        nrf = self._nrf
+        while nrf.data_ready():
+            pipe = nrf.data_pipe()
+            payload = nrf.get_payload()
+
+            if len(payload) >= _HELLO.size and payload[0] == HELLO:
+                self._nodes[bytes(payload[_HELLO.size:])] = self._generation
+            else:
+                self._received.append((pipe, payload))
+
+            # The acknowledgement payload was consumed by the node, so we need a fresh one.
+            if self._target is not None:
+                self._stage_announcement()
+
+
+    def _stage_announcement(self):
+        remaining = max(0, int((self._switch_at - time.monotonic()) * 1000))
+        remaining = min(remaining, 0xFFFF)
+
+        # Replace any stale announcement with one carrying an updated countdown.
+        self._nrf.flush_tx()
+        self._nrf.ack_payload(self._pipe, _MIGRATE.pack(MIGRATE, self._epoch, self._target, remaining))
+
+
+    def _switch(self):
+        # Make sure nothing is left in the RX FIFO before leaving the current channel.
+        self._drain()
+        self._nrf.flush_tx()
+        self._nrf.set_channel(self._target)
+        self._generation += 1
+        self._target = None
+        self._switch_at = None
+
+
+class MigrationNode:
+    """
+    Node side of the channel migration protocol.
+
+    Messages are queued and are only removed from the queue once the gateway has acknowledged them, so that messages
+    are not lost while the node changes channel or searches for the gateway. When the queue is full, queue() returns
+    False and the message is not queued. The writing pipe must be opened with RF24_PAYLOAD.ACK before the node is
+    created.
+    """
+
+    def __init__(self, nrf, node_id, channels, max_failures=3, queue_size=64):
+        self._nrf = nrf
+        self._node_id = nrf.make_address(node_id)
+        self._channels = list(channels)
+        self._max_failures = max_failures
+
+        self._queue = collections.deque()
+        self._queue_size = queue_size
+        self._failures = 0
+        self._epoch = None
+        self._target = None
+        self._switch_at = None
+        self._hello = True                  # Announce ourselves on the first successful contact.
+
+        nrf.close_reading_pipe(RF24_RX_ADDR.P0)
+
+
+    def queue(self, payload):
+        # Queue a message. Returns False if the queue is full.
+        if len(self._queue) >= self._queue_size:
+            return False
+        self._queue.append(payload)
+        return True
+
+
+    def pending(self):
+        return len(self._queue)
+
+
+    def get_epoch(self):
+        return self._epoch
+
+
+    def process(self):
+        # Send queued messages until the queue is empty or a message fails. Returns the number of messages sent.
+        self._check_switch()
+
+        if self._hello:
+            if not self._transmit(_HELLO.pack(HELLO) + bytes(self._node_id)):
+                return 0
+            self._hello = False
+
+        sent = 0
+        while self._queue:
+            if not self._transmit(self._queue[0]):
+                break
+            self._queue.popleft()
+            sent += 1
+
+        return sent
+
+
+    def search(self):
+        # Look for the gateway on each channel of the channel plan, starting with the current one. Returns True
+        # when the gateway answered.
+        current = self._nrf.get_channel()
+        candidates = [current] + [c for c in self._channels if c != current]
+
+        for channel in candidates:
+            self._nrf.set_channel(channel)
+            if self._send(_HELLO.pack(HELLO) + bytes(self._node_id)):
+                self._failures = 0
+                self._hello = False
+                return True
+
+        self._nrf.set_channel(current)
+        return False
+
+
+    def _transmit(self, payload):
+        if self._send(payload):
+            self._failures = 0
+            return True
+
+        self._failures += 1
+        if self._failures >= self._max_failures:
+            self.search()
+        return False
+
+
+    def _send(self, payload):
+        nrf = self._nrf
+        nrf.enable_reading_pipe(RF24_RX_ADDR.P0)
+        nrf.reset_packages_lost()
+        nrf.send(payload)
+        try:
+            nrf.wait_until_sent()
+            lost = nrf.get_packages_lost() != 0
+        except TimeoutError:
+            lost = True
+        nrf.close_reading_pipe(RF24_RX_ADDR.P0)
+
+        if lost:
+            return False
+
+        # Check the acknowledgement payload for an announcement.
+        while nrf.data_ready():
+            ack = nrf.get_payload()
+            if len(ack) >= _MIGRATE.size and ack[0] == MIGRATE:
+                _, epoch, channel, remaining = _MIGRATE.unpack_from(bytes(ack))
+                if epoch != self._epoch:
+                    self._target = channel
+                    self._switch_at = time.monotonic() + remaining / 1000
+                    self._epoch = epoch
+
+        self._check_switch()
+        return True
+
+
+    def _check_switch(self):
+        if self._target is not None and time.monotonic() >= self._switch_at:
+            self._nrf.set_channel(self._target)
+            self._target = None
+            self._switch_at = None
+            self._hello = True
@@ -1,6 +1,9 @@
 import pigpio
+from array import array
 from enum import Enum, IntEnum
 from os import environ as env
+import random
+import sys
 import time
 
 
@@ -168,6 +171,108 @@ class RF24_RX_ADDR(IntEnum):
     P5 = 0x0f
 
 
+class FlightRecorder:
+    """
+    Ring buffer of the last SPI transfers made by an NRF24 instance: the opcode (first byte), the length, the STATUS
+    returned, the CE level, and the time.monotonic() timestamp of each transfer. The buffer is preallocated, so
+    recording a transfer does not allocate any objects. Use dump() to write it to a file for post-mortem analysis.
+    """
+
+    FAILED = -1                                     # Status recorded when the transfer raised an exception.
+
+    def __init__(self, size=256, path=None):
+        assert size > 0
+        self.size = size
+        self.path = path                            # File written by failed(), or None.
+        self._opcode = array('B', bytes(size))
+        self._length = array('B', bytes(size))
+        self._status = array('h', bytes(2 * size))
+        self._ce = array('B', bytes(size))
+        self._time = array('d', bytes(8 * size))
+        self._index = 0
+        self._count = 0
+
+
+    def __len__(self):
+        return min(self._count, self.size)
+
+
+    def record(self, opcode, length, status, ce):
+        i = self._index
+        self._opcode[i] = opcode
+        self._length[i] = length if length < 256 else 255
+        self._status[i] = status
+        self._ce[i] = ce
+        self._time[i] = time.monotonic()
+        i += 1
+        self._index = 0 if i == self.size else i
+        self._count += 1
+
+
+    def clear(self):
+        self._index = 0
+        self._count = 0
+
+
+    def get_count(self):
+        # The number of transfers recorded since the recorder was created or cleared, including those overwritten.
+        return self._count
+
+
+    def get_entries(self):
+        # Returns the transfers in the buffer, oldest first, as (timestamp, opcode, length, status, ce) tuples.
+        n = len(self)
+        start = (self._index - n) % self.size
+        return [(self._time[i], self._opcode[i], self._length[i], self._status[i], self._ce[i])
+                for i in ((start + k) % self.size for k in range(n))]
+
+
+    def format(self, reason=None):
+        lines = [f'# NRF24 flight recorder: last {len(self)} of {self._count} SPI transfers'
+                 + (f', dumped on {reason}' if reason else '') + '.',
+                 '# time (s)          ago (ms)  ce  len  status  opcode']
+        entries = self.get_entries()
+        last = entries[-1][0] if entries else 0.0
+        for timestamp, opcode, length, status, ce in entries:
+            status = 'FAILED' if status == self.FAILED else f'0x{status:02x}'
+            lines.append(f'{timestamp:<18.6f} {1000 * (last - timestamp):9.3f}  {ce:>2}  {length:>3}  {status:>6}  '
+                         f'{FlightRecorder.opcode_name(opcode)}')
+        return '\n'.join(lines) + '\n'
+
+
+    def dump(self, path=None, reason=None):
+        # Write the buffer to the file given (default: the path of the recorder), or to stderr if there is none.
+        # Returns the path written.
+        path = path or self.path
+        text = self.format(reason)
+        if path is None:
+            sys.stderr.write(text)
+        else:
+            with open(path, 'w') as f:
+                f.write(text)
+        return path
+
+
+    def failed(self, reason):
+        # Called by NRF24 when an SPI transfer raises or a send times out. Dumps the buffer if a path is set.
+        if self.path is not None:
+            try:
+                self.dump(reason=reason)
+            except OSError:
+                pass
+
+
+    @staticmethod
+    def opcode_name(opcode):
+        if opcode < NRF24.W_REGISTER:
+            return f'R_REGISTER {_REGISTER_NAMES.get(opcode, f"0x{opcode:02x}")}'
+        if opcode < NRF24.R_RX_PL_WID:
+            return f'W_REGISTER {_REGISTER_NAMES.get(opcode & 0x1F, f"0x{opcode & 0x1F:02x}")}'
+        if NRF24.W_ACK_PAYLOAD <= opcode < NRF24.W_ACK_PAYLOAD + 6:
+            return f'W_ACK_PAYLOAD P{opcode - NRF24.W_ACK_PAYLOAD}'
+        return _COMMAND_NAMES.get(opcode, f'0x{opcode:02x}')
+
+
 class NRF24:
     """
     Note that RX and TX addresses must match
@@ -234,6 +339,33 @@ class NRF24:
 
         self._pi = pi
 
+        # W_TX_PAYLOAD_NO_ACK is disabled until set_dynamic_ack(True) is called.
+        self._dynamic_ack = 0
+
+        # Listen before talk is disabled until set_csma(True) is called.
+        self._csma = False
+        self._csma_backoff = 0.0005
+        self._csma_max_backoff = 0.016
+        self._csma_attempts = 5
+        self._csma_samples = 0
+        self._csma_deferrals = 0
+        self._csma_busy = 0
+
+        # The last SPI transfers are kept in a flight recorder (see set_flight_recorder()).
+        self._recorder = FlightRecorder()
+        self._ce_level = 0
+
+        # Values last written to each register, used by the watchdog to restore the configuration (see
+        # set_watchdog()). The watchdog is disabled until set_watchdog(True) is called.
+        self._shadow = {}
+        self._watchdog = False
+        self._watchdog_interval = 1.0
+        self._watchdog_callback = None
+        self._watchdog_checked = 0.0
+        self._wedged = False
+        self._recovering = False
+        self._watchdog_statistics = dict.fromkeys(('checks', 'faults', 'flushes', 'recoveries', 'failures'), 0)
+
         # Chip Enable can be any PIN (~).
         assert 0 <= ce <= 31
         self._ce_pin = ce
@@ -247,12 +379,9 @@ class NRF24:
         assert 32000 <= spi_speed <= 10e6
 
         # Access SPI on the Raspberry PI.
-        if spi_channel < SPI_CHANNEL.AUX_CE0: # WAS: NRF24.SPI_AUX_CE0:
-            # Main SPI
-            self._spi_handle = pi.spi_open(spi_channel, int(spi_speed))
-        else:
-            # Aux SPI.
-            self._spi_handle = pi.spi_open(spi_channel - SPI_CHANNEL.AUX_CE0, int(spi_speed), NRF24._AUX_SPI)
+        self._spi_channel = spi_channel
+        self._spi_speed = spi_speed
+        self._spi_handle = self._open_spi()
 
         # NRF channel (0-125)
         self.set_channel(channel)
@@ -383,13 +512,13 @@ class NRF24:
             if crc_bytes == RF24_CRC.BYTES_1:
                 config = self._nrf_read_reg(self.CONFIG, 1)[0]
                 mask = ~self.CRCO & 0xFF
-                new_config = config & mask
+                new_config = (config & mask) | self.EN_CRC
                 self.unset_ce()
                 self._nrf_write_reg(self.CONFIG, new_config)
                 self.set_ce()
             else:
                 config = self._nrf_read_reg(self.CONFIG, 1)[0]
-                mask = self.CRCO
+                mask = self.CRCO | self.EN_CRC
                 new_config = config | mask
                 self.unset_ce()
                 self._nrf_write_reg(self.CONFIG, new_config)
@@ -398,7 +527,7 @@ class NRF24:
 
     def get_crc_bytes(self):    
         config = self._nrf_read_reg(self.CONFIG, 1)[0]
-        if config & self.EN_CRC:
+        if not config & self.EN_CRC:
             return RF24_CRC.DISABLED
         else:
             if config & self.CRCO:
@@ -435,7 +564,7 @@ class NRF24:
         rf_setup = self._nrf_read_reg(self.RF_SETUP, 1)[0]
 
         # Calculate rate from 2 bits.
-        rate = ((rf_setup & NRF24.RF_DR_LOW) >> 4) & ((rf_setup & NRF24.RF_DR_HIGH) >> 3)
+        rate = ((rf_setup & NRF24.RF_DR_LOW) >> 4) | ((rf_setup & NRF24.RF_DR_HIGH) >> 3)
 
         # Return the corresponding enumeration value.
         return RF24_DATA_RATE.from_value(rate)
@@ -471,6 +600,10 @@ class NRF24:
         return self._spi_handle
 
 
+    def get_spi_channel(self):
+        return SPI_CHANNEL.from_value(self._spi_channel)
+
+
     def show_registers(self):
         print("Registers:")
         print("----------")
@@ -506,7 +639,7 @@ class NRF24:
             return msg
 
 
-    def send(self, data):
+    def _make_payload(self, data):
         # We expect a list of byte values to be sent.  However, popular types
         # such as string, integer, bytes, and bytearray are handled automatically using
         # this conversion code.
@@ -517,7 +650,12 @@ class NRF24:
                 data = list(data.to_bytes(-(-data.bit_length() // 8), 'little'))              
             else:
                 data = list(data)
-        
+        return data
+
+
+    def send(self, data):
+        data = self._make_payload(data)
+
         # Flush TX if buffers are full or max retries is set.
         status = self.get_status()
         if status & (self.TX_FULL | self.MAX_RT):
@@ -526,10 +664,296 @@ class NRF24:
         if self._payload_size >= RF24_PAYLOAD.MIN:  # fixed payload
             data = self._make_fixed_width(data, self._payload_size, self._padding)
 
+        if self._csma:
+            self._listen_before_talk()
+
         self._nrf_command([self.W_TX_PAYLOAD] + data)
         self.power_up_tx()
 
 
+    def set_csma(self, enable, backoff=0.0005, max_backoff=0.016, attempts=5):
+        # Enable or disable listen before talk in send(). Before each send the received power detector (RPD) is
+        # sampled in RX mode. If the channel is busy, the send is deferred by a random time up to backoff seconds,
+        # doubling for every busy sample up to max_backoff. After attempts busy samples the package is sent anyway.
+        assert 0 < backoff <= max_backoff
+        assert attempts > 0
+        self._csma = bool(enable)
+        self._csma_backoff = backoff
+        self._csma_max_backoff = max_backoff
+        self._csma_attempts = attempts
+
+
+    def get_csma_statistics(self):
+        # Returns the number of times the channel was sampled, the number of times a send was deferred, and the
+        # number of sends made on a busy channel after all attempts.
+        return {'samples': self._csma_samples, 'deferrals': self._csma_deferrals, 'busy': self._csma_busy}
+
+
+    def reset_csma_statistics(self):
+        self._csma_samples = 0
+        self._csma_deferrals = 0
+        self._csma_busy = 0
+
+
+    def is_carrier(self):
+        # Sample the received power detector. RPD is latched when RX mode is left, so RX mode is (re)entered and
+        # held for 170µs (130µs settling + 40µs detection) before it is read. The NRF24 is left in RX mode. Toggling
+        # CE is enough when the radio is powered up as a receiver; otherwise, for example after power_down(), it is
+        # powered up in RX mode first.
+        rx = NRF24.PWR_UP | NRF24.PRIM_RX
+        if self._power_tx or self._shadow.get(NRF24.CONFIG, [0])[0] & rx != rx:
+            self.power_up_rx()
+        else:
+            self.unset_ce()
+            self.set_ce()
+        time.sleep(0.000170)
+        return (self._nrf_read_reg(NRF24.RPD, 1)[0] & 1) != 0
+
+
+    def _listen_before_talk(self):
+        backoff = self._csma_backoff
+        for _ in range(self._csma_attempts):
+            self._csma_samples += 1
+            if not self.is_carrier():
+                return True
+
+            self._csma_deferrals += 1
+            time.sleep(random.uniform(0, backoff))
+            backoff = min(backoff * 2, self._csma_max_backoff)
+
+        self._csma_busy += 1
+        return False
+
+
+    def set_watchdog(self, enable, interval=1.0, callback=None):
+        # Enable or disable the lockup watchdog. STATUS and FIFO_STATUS values read by data_ready(), data_ready_pipe()
+        # and get_status() are checked for impossible values, and so is the width of dynamic payloads in get_payload().
+        # Every interval seconds data_ready() also reads CONFIG and TX_ADDR back and compares them with the values
+        # last written, which catches a module that has browned out and reset to its defaults.
+        # A payload width above 32 is handled by flushing the RX FIFO. Any other fault re-initialises the radio from
+        # the values last written to its registers, after which it is left in RX mode. The callback, if given, is
+        # called with a description of the fault and whether the radio is working again. While the radio cannot be
+        # recovered, data_ready() returns False and recovery is retried every interval seconds.
+        assert interval > 0
+        self._watchdog = bool(enable)
+        self._watchdog_interval = interval
+        self._watchdog_callback = callback
+        self._watchdog_checked = time.monotonic()
+        self._wedged = False
+
+
+    def get_watchdog_statistics(self):
+        # Returns the number of periodic checks, the number of faults found, the number of RX FIFO flushes, the number
+        # of times the radio was re-initialised, and the number of times that failed.
+        return dict(self._watchdog_statistics)
+
+
+    def reset_watchdog_statistics(self):
+        for key in self._watchdog_statistics:
+            self._watchdog_statistics[key] = 0
+
+
+    def check_radio(self):
+        # Read CONFIG and TX_ADDR back and compare them with the values last written. If they differ the radio is
+        # re-initialised. Returns True if the radio is working.
+        self._watchdog_checked = time.monotonic()
+        self._watchdog_statistics['checks'] += 1
+        reason = self._verify()
+        if reason is None:
+            if self._wedged:
+                self._wedged = False
+                self._watchdog_statistics['recoveries'] += 1
+                if self._watchdog_callback is not None:
+                    self._watchdog_callback('radio answering again', True)
+            return True
+        self._watchdog_statistics['faults'] += 1
+        return self._recover(reason)
+
+
+    def _verify(self):
+        # Returns a description of the first register that does not hold the value last written, or None.
+        config = self._nrf_read_reg(self.CONFIG, 1)[0]
+        expected = self._shadow.get(self.CONFIG, [config])[0]
+        if config != expected:
+            return f'CONFIG is 0x{config:02x}, expected 0x{expected:02x}'
+
+        expected = self._shadow.get(self.TX_ADDR)
+        if expected is not None:
+            address = list(self._nrf_read_reg(self.TX_ADDR, 5))[:len(expected)]
+            if address != expected:
+                return f'TX_ADDR is {bytes(address).hex()}, expected {bytes(expected).hex()}'
+        return None
+
+
+    def _watchdog_ok(self):
+        # Called by data_ready(). Checks the radio when the interval has passed; returns False while it is wedged.
+        if time.monotonic() - self._watchdog_checked >= self._watchdog_interval:
+            return self.check_radio()
+        return not self._wedged
+
+
+    def _watchdog_fault(self, reason):
+        # A value read on a hot path cannot be right. If the configuration is intact the RX FIFO is flushed, otherwise
+        # the radio is re-initialised. Returns True if the radio is working.
+        if self._recovering:
+            return False
+        if self._wedged and time.monotonic() - self._watchdog_checked < self._watchdog_interval:
+            return False
+        self._watchdog_statistics['faults'] += 1
+        self._watchdog_checked = time.monotonic()
+        fault = self._verify()
+        if fault is None:
+            self._flush_rx_fifo(reason)
+            return True
+        return self._recover(f'{reason} ({fault})')
+
+
+    def _flush_rx_fifo(self, reason):
+        self.flush_rx()
+        self._nrf_write_reg(self.STATUS, self.RX_DR)
+        self._watchdog_statistics['flushes'] += 1
+        if self._watchdog_callback is not None:
+            self._watchdog_callback(reason, True)
+
+
+    def _recover(self, reason):
+        self._recovering = True
+        try:
+            self._restore()
+            recovered = self._verify() is None
+        finally:
+            self._recovering = False
+
+        self._wedged = not recovered
+        self._watchdog_checked = time.monotonic()
+        self._watchdog_statistics['recoveries' if recovered else 'failures'] += 1
+        if self._watchdog_callback is not None:
+            self._watchdog_callback(reason, recovered)
+        return recovered
+
+
+    def _restore(self):
+        # Write every register back in one go, CONFIG last, flush the FIFOs, and enter RX mode once the oscillator
+        # has started (1.5ms from power down).
+        shadow = dict(self._shadow)
+        self.unset_ce()
+        for reg in sorted(shadow):
+            if reg != self.CONFIG:
+                self._nrf_write_reg(reg, shadow[reg])
+        self.flush_tx()
+        self.flush_rx()
+        self._nrf_write_reg(self.STATUS, self.RX_DR | self.TX_DS | self.MAX_RT)
+        config = shadow.get(self.CONFIG, [0])[0]
+        self._nrf_write_reg(self.CONFIG, config)
+        if config & self.PWR_UP:
+            # Not power_up_rx(), which would take CONFIG from the radio.
+            time.sleep(0.0015)
+            self._power_tx = 0
+            self._nrf_write_reg(self.CONFIG, config | self.PRIM_RX)
+            self.set_ce()
+
+
+    def reconnect(self, pi):
+        # Continue on a new pigpio connection, for example after pigpiod has been restarted: set up the CE GPIO, open
+        # the SPI channel again, and write the configuration last written back to the radio, which is left in RX
+        # mode. Payloads in the FIFOs are lost.
+        self._pi = pi
+        pi.set_mode(self._ce_pin, pigpio.OUTPUT)
+        self.unset_ce()
+        self._spi_handle = self._open_spi()
+        self._restore()
+
+
+    def _open_spi(self):
+        if self._spi_channel < SPI_CHANNEL.AUX_CE0: # WAS: NRF24.SPI_AUX_CE0:
+            # Main SPI
+            return self._pi.spi_open(self._spi_channel, int(self._spi_speed))
+        else:
+            # Aux SPI.
+            return self._pi.spi_open(self._spi_channel - SPI_CHANNEL.AUX_CE0, int(self._spi_speed), NRF24._AUX_SPI)
+
+
+    def set_flight_recorder(self, size=256, path=None):
+        # Keep the last size SPI transfers in a ring buffer, or disable the flight recorder with size 0. If a path is
+        # given, the buffer is written to it when an SPI transfer raises an exception or a send times out.
+        self._recorder = FlightRecorder(size, path) if size else None
+
+
+    def get_flight_recorder(self):
+        return self._recorder
+
+
+    def dump_flight_recorder(self, path=None, reason=None):
+        # Write the last SPI transfers to a file (default: the path given to set_flight_recorder(), or stderr).
+        if self._recorder is not None:
+            return self._recorder.dump(path, reason)
+
+
+    def load_payload(self, data, ack=True):
+        # Write a payload to the TX FIFO without flushing it first, so that up to 3 payloads can be queued for
+        # transmission back to back. Use is_tx_full() before loading and is_tx_empty() to see when all payloads
+        # have been sent. Unlike send(), a MAX_RT condition is left for the caller to handle.
+        # With ack=False the payload is sent without requesting an acknowledgement, which requires
+        # set_dynamic_ack(True).
+        data = self._make_payload(data)
+
+        if self._payload_size >= RF24_PAYLOAD.MIN:  # fixed payload
+            data = self._make_fixed_width(data, self._payload_size, self._padding)
+
+        if ack:
+            self._nrf_command([self.W_TX_PAYLOAD] + data)
+        else:
+            assert self._dynamic_ack, "set_dynamic_ack(True) must be called before sending without acknowledgement."
+            self._nrf_command([self.W_TX_PAYLOAD_NO_ACK] + data)
+        if self._power_tx == 0:
+            self.power_up_tx()
+
+
+    def set_dynamic_ack(self, enable):
+        # Enable or disable the W_TX_PAYLOAD_NO_ACK command used by load_payload(data, ack=False).
+        self._dynamic_ack = NRF24.EN_DYN_ACK if enable else 0
+        feature = self._nrf_read_reg(NRF24.FEATURE, 1)[0]
+        feature = (feature & (~NRF24.EN_DYN_ACK & 0xFF)) | self._dynamic_ack
+        self.unset_ce()
+        self._nrf_write_reg(NRF24.FEATURE, feature)
+        self.set_ce()
+
+
+    def set_auto_ack(self, enable, pipe=None):
+        # Enable or disable auto acknowledgement on a pipe (0..5 or RF24_RX_ADDR.P0..RF24_RX_ADDR.P5), or on all pipes.
+        # Note that open_reading_pipe() and open_writing_pipe() enable it for the pipe they open.
+        if pipe is None:
+            mask = 0x3F
+        else:
+            if RF24_RX_ADDR.P0 <= pipe <= RF24_RX_ADDR.P5:
+                pipe -= RF24_RX_ADDR.P0
+            assert 0 <= pipe <= 5, "Pipe should be in range 0..5 or RF24_RX_ADDR.P0..RF24_RX_ADDR.P5."
+            mask = 1 << pipe
+        en_aa = self._nrf_read_reg(NRF24.EN_AA, 1)[0]
+        en_aa = en_aa | mask if enable else en_aa & (~mask & 0xFF)
+        self.unset_ce()
+        self._nrf_write_reg(NRF24.EN_AA, en_aa)
+        self.set_ce()
+
+
+    def get_auto_ack(self, pipe=RF24_RX_ADDR.P0):
+        # Return True if auto acknowledgement is enabled on a pipe (0..5 or RF24_RX_ADDR.P0..RF24_RX_ADDR.P5). When
+        # sending, pipe 0 decides whether the NRF24 waits for an acknowledgement.
+        if RF24_RX_ADDR.P0 <= pipe <= RF24_RX_ADDR.P5:
+            pipe -= RF24_RX_ADDR.P0
+        assert 0 <= pipe <= 5, "Pipe should be in range 0..5 or RF24_RX_ADDR.P0..RF24_RX_ADDR.P5."
+        return (self._nrf_read_reg(NRF24.EN_AA, 1)[0] & (1 << pipe)) != 0
+
+
+    def is_tx_full(self):
+        return (self.get_status() & self.TX_FULL) != 0
+
+
+    def is_tx_empty(self):
+        fifo_status = self._nrf_read_reg(self.FIFO_STATUS, 1)[0]
+        return (fifo_status & self.FTX_EMPTY) != 0
+
+
     def get_retries(self):
         v = self._nrf_read_reg(NRF24.OBSERVE_TX, 1)[0]
         arc = v & 15
@@ -554,16 +978,7 @@ class NRF24:
 
 
     def ack_payload(self, pipe, data):
-        # We expect a list of byte values to be sent.  However, popular types
-        # such as string, integer, bytes, and bytearray are handled automatically using
-        # this conversion code.
-        if not isinstance(data, list):
-            if isinstance(data, str):
-                data = list(map(ord, data))
-            elif isinstance(data, int):
-                data = list(data.to_bytes(-(-data.bit_length() // 8), 'little'))              
-            else:
-                data = list(data)
+        data = self._make_payload(data)
 
         # If a pipe is given as 0..5 add the 0x0a value corresponding to RX_ADDR_P0
         if (0 <= pipe <= 5):
@@ -644,9 +1059,9 @@ class NRF24:
             self._nrf_write_reg(NRF24.RX_PW_P0 + (pipe - NRF24.RX_ADDR_P0), 0)      # Set size of payload to 0.
             self._nrf_write_reg(NRF24.DYNPD, dynpd | enable)                        # Enable dynamic payload.
             if size == RF24_PAYLOAD.DYNAMIC:
-                self._nrf_write_reg(NRF24.FEATURE, NRF24.EN_DPL)                    # Enable dynamic payload.
+                self._nrf_write_reg(NRF24.FEATURE, NRF24.EN_DPL | self._dynamic_ack)                    # Enable dynamic payload.
             else:
-                self._nrf_write_reg(NRF24.FEATURE, NRF24.EN_DPL | NRF24.EN_ACK_PAY) # Enable dynamic payload and acknowledgement payload feature.
+                self._nrf_write_reg(NRF24.FEATURE, NRF24.EN_DPL | NRF24.EN_ACK_PAY | self._dynamic_ack) # Enable dynamic payload and acknowledgement payload feature.
 
         self._nrf_write_reg(pipe, address)                                          # Set address for pipe.
         self._nrf_write_reg(NRF24.EN_AA, en_aa | enable)                            # Enable auto-acknowledgement.
@@ -677,6 +1092,61 @@ class NRF24:
         self._open_reading_pipe(pipe, addr, size)
         self.set_ce()
 
+
+    def open_reading_pipes(self, addresses, size=None):
+        # Open several reading pipes in one go. The addresses argument is a dict mapping pipes (0..5 or
+        # RF24_RX_ADDR.P0..RF24_RX_ADDR.P5) to addresses, and pipes mapped to None are closed. The registers shared
+        # by all pipes (EN_RXADDR, EN_AA, DYNPD, and FEATURE) are only read and written once.
+        if not size:
+            size = self._payload_size
+        else:
+            assert RF24_PAYLOAD.ACK <= size <= RF24_PAYLOAD.MAX, "Payload size must be between RF24_PAYLOAD.ACK and RF24_PAYLOAD.MAX"
+
+        en_rxaddr = self._nrf_read_reg(NRF24.EN_RXADDR, 1)[0]
+        dynpd = self._nrf_read_reg(NRF24.DYNPD, 1)[0]
+        en_aa = self._nrf_read_reg(NRF24.EN_AA, 1)[0]
+
+        enable = 0
+        disable = 0
+
+        self.unset_ce()
+        for pipe, address in addresses.items():
+            if RF24_RX_ADDR.P0 <= pipe <= RF24_RX_ADDR.P5:
+                pipe -= RF24_RX_ADDR.P0
+            assert 0 <= pipe <= 5, "Pipe should be in range 0..5 or RF24_RX_ADDR.P0..RF24_RX_ADDR.P5."
+
+            if address is None:
+                disable |= 1 << pipe
+                continue
+
+            addr = self.make_address(address)
+            assert len(addr) == self._address_width, f"Invalid address length {len(addr)} of address {address} ({addr})."
+
+            # Pipes above P1 only have the first byte of the address.
+            if pipe > 1:
+                addr = addr[:1]
+
+            self._nrf_write_reg(NRF24.RX_ADDR_P0 + pipe, addr)
+            if RF24_PAYLOAD.MIN <= size <= RF24_PAYLOAD.MAX:
+                self._nrf_write_reg(NRF24.RX_PW_P0 + pipe, size)
+            else:
+                self._nrf_write_reg(NRF24.RX_PW_P0 + pipe, 0)
+            enable |= 1 << pipe
+
+        if enable:
+            if RF24_PAYLOAD.MIN <= size <= RF24_PAYLOAD.MAX:
+                self._nrf_write_reg(NRF24.DYNPD, dynpd & (~enable & 0xFF))
+            else:
+                self._nrf_write_reg(NRF24.DYNPD, dynpd | enable)
+                if size == RF24_PAYLOAD.DYNAMIC:
+                    self._nrf_write_reg(NRF24.FEATURE, NRF24.EN_DPL | self._dynamic_ack)
+                else:
+                    self._nrf_write_reg(NRF24.FEATURE, NRF24.EN_DPL | NRF24.EN_ACK_PAY | self._dynamic_ack)
+            self._nrf_write_reg(NRF24.EN_AA, en_aa | enable)
+
+        self._nrf_write_reg(NRF24.EN_RXADDR, (en_rxaddr | enable) & (~disable & 0xFF))
+        self.set_ce()
+
         
     def close_reading_pipe(self, pipe):        
         # We accept pipe addresses 0..5 or RX_ADDR_P0..RX_ADDR_P5
@@ -698,6 +1168,21 @@ class NRF24:
         self.set_ce()
 
 
+    def enable_reading_pipe(self, pipe):
+        # Enable a pipe closed by close_reading_pipe() again, with the address and payload size it had. A node that
+        # shares the writing address with other nodes keeps P0 closed while listening, so that it does not acknowledge
+        # their packages, and enables it while sending to receive its own acknowledgements.
+        if RF24_RX_ADDR.P0 <= pipe <= RF24_RX_ADDR.P5:
+            pipe -= RF24_RX_ADDR.P0
+
+        assert 0 <= pipe <= 5, "Pipe should be in range 0..5 or RF24_RX_ADDR.P0..RF24_RX_ADDR.P5."
+
+        en_rxaddr = self._nrf_read_reg(NRF24.EN_RXADDR, 1)[0]
+        self.unset_ce()
+        self._nrf_write_reg(NRF24.EN_RXADDR, en_rxaddr | (1 << pipe))
+        self.set_ce()
+
+
     def close_all_reading_pipes(self):
         # Close all reading pipes. 
         # PLEASE NOTE: This will disable acknowledgements for transmission on P0.
@@ -735,13 +1220,22 @@ class NRF24:
 
 
     def data_ready_pipe(self):
+        if self._watchdog and not self._watchdog_ok():
+            return False, 7
+
         status = self.get_status()
         pipe = (status >> 1) & 0x07
+        if self._wedged:
+            return False, 7
 
         if status & self.RX_DR:
             return True, pipe
 
         fifo_status = self._nrf_read_reg(self.FIFO_STATUS, 1)[0]
+        if self._watchdog and fifo_status & _FIFO_STATUS_RESERVED:
+            self._watchdog_fault(f'invalid FIFO_STATUS 0x{fifo_status:02x}')
+            return False, 7
+
         if fifo_status & self.FRX_EMPTY:
             return False, pipe
         else:            
@@ -755,11 +1249,21 @@ class NRF24:
 
 
     def data_ready(self):        
+        if self._watchdog and not self._watchdog_ok():
+            return False
+
         status = self.get_status()
+        if self._wedged:
+            return False
+
         if status & self.RX_DR:
             return True
 
         fifo_status = self._nrf_read_reg(self.FIFO_STATUS, 1)[0]
+        if self._watchdog and fifo_status & _FIFO_STATUS_RESERVED:
+            self._watchdog_fault(f'invalid FIFO_STATUS 0x{fifo_status:02x}')
+            return False
+
         if fifo_status & self.FRX_EMPTY:
             return False
         else:            
@@ -773,11 +1277,43 @@ class NRF24:
             
             if time.monotonic_ns() - start_wait > timeout_ns: 
                 self.power_up_rx()
+                if self._recorder is not None:
+                    self._recorder.failed('send timeout')
+                raise TimeoutError('Timed out wating for send to complete.')
+
+            # Wait 250µs before checking again. That is the retransmit delay.
+            time.sleep(0.000250)
+
+
+    def exchange(self, data, timeout_ns=100000000):
+        # Send data and wait for the acknowledgement without leaving TX mode. Returns the acknowledgement payload as a
+        # list of bytes, an empty list if the acknowledgement carried no payload, or None if the package was lost.
+        # The pipe must be opened with RF24_PAYLOAD.ACK for acknowledgement payloads to be received.
+        self.send(data)
+
+        start_wait = time.monotonic_ns()
+        while True:
+            status = self.get_status()
+            if status & (self.TX_DS | self.MAX_RT):
+                break
+
+            if time.monotonic_ns() - start_wait > timeout_ns:
+                self.power_up_rx()
+                if self._recorder is not None:
+                    self._recorder.failed('send timeout')
                 raise TimeoutError('Timed out wating for send to complete.')
 
             # Wait 250µs before checking again. That is the retransmit delay.
             time.sleep(0.000250)
 
+        if status & self.MAX_RT:
+            return None
+
+        if status & self.RX_DR or self.data_ready():
+            return self.get_payload()
+
+        return []
+
 
     def is_sending(self):
         if self._power_tx > 0:
@@ -793,6 +1329,15 @@ class NRF24:
         if self._payload_size < RF24_PAYLOAD.MIN: 
             # dynamic payload
             bytes_count = self._nrf_command([self.R_RX_PL_WID, 0])[1]
+            if self._watchdog and not RF24_PAYLOAD.MIN <= bytes_count <= RF24_PAYLOAD.MAX:
+                # A width above 32 is corrupt and must be flushed. A width of 0 is what a module that does not answer
+                # returns.
+                if bytes_count > RF24_PAYLOAD.MAX:
+                    self._watchdog_statistics['faults'] += 1
+                    self._flush_rx_fifo(f'invalid payload width {bytes_count}')
+                else:
+                    self._watchdog_fault(f'invalid payload width {bytes_count}')
+                return []
         else:
             # fixed payload   
             bytes_count = self._payload_size
@@ -804,8 +1349,18 @@ class NRF24:
         return d
 
 
+    def get_fifo_status(self):
+        return self._nrf_read_reg(self.FIFO_STATUS, 1)[0]
+
+
     def get_status(self):
-        return self._nrf_command(self.NOP)[0]
+        status = self._nrf_command(self.NOP)[0]
+        if self._watchdog and ((status & 0x80) or (status & 0x0E) == 0x0C):
+            # Bit 7 is always 0 and RX_P_NO is never 110. A module that is browning out, or not answering with MISO
+            # pulled high, returns 0xFF.
+            if self._watchdog_fault(f'invalid STATUS 0x{status:02x}'):
+                status = self._nrf_command(self.NOP)[0]
+        return status
 
 
     def power_up_tx(self):
@@ -837,10 +1392,12 @@ class NRF24:
 
     def set_ce(self):
         self._pi.write(self._ce_pin, 1)
+        self._ce_level = 1
 
 
     def unset_ce(self):
         self._pi.write(self._ce_pin, 0)
+        self._ce_level = 0
 
 
     def flush_rx(self):
@@ -852,7 +1409,18 @@ class NRF24:
 
 
     def _nrf_xfer(self, data):
-        b, d = self._pi.spi_xfer(self._spi_handle, data)
+        recorder = self._recorder
+        if recorder is None:
+            b, d = self._pi.spi_xfer(self._spi_handle, data)
+            return d
+
+        try:
+            b, d = self._pi.spi_xfer(self._spi_handle, data)
+        except Exception as e:
+            recorder.record(data[0], len(data), FlightRecorder.FAILED, self._ce_level)
+            recorder.failed(f'{type(e).__name__}: {e}')
+            raise
+        recorder.record(data[0], len(data), d[0] if b > 0 else FlightRecorder.FAILED, self._ce_level)
         return d
 
 
@@ -875,6 +1443,8 @@ class NRF24:
         """
         if type(arg) is not list:
             arg = [arg]
+        if reg != self.STATUS:
+            self._shadow[reg] = list(arg)
         self._nrf_xfer([self.W_REGISTER | reg] + arg)
 
 
@@ -1273,3 +1843,15 @@ class NRF24:
             s += "W_TX_PAYLOAD_NOACK off"
 
         return s
+
+
+_REGISTER_NAMES = {getattr(NRF24, name): name for name in (
+    'CONFIG', 'EN_AA', 'EN_RXADDR', 'SETUP_AW', 'SETUP_RETR', 'RF_CH', 'RF_SETUP', 'STATUS', 'OBSERVE_TX', 'RPD',
+    'RX_ADDR_P0', 'RX_ADDR_P1', 'RX_ADDR_P2', 'RX_ADDR_P3', 'RX_ADDR_P4', 'RX_ADDR_P5', 'TX_ADDR', 'RX_PW_P0',
+    'RX_PW_P1', 'RX_PW_P2', 'RX_PW_P3', 'RX_PW_P4', 'RX_PW_P5', 'FIFO_STATUS', 'DYNPD', 'FEATURE')}
+
+# Bits of FIFO_STATUS that always read 0.
+_FIFO_STATUS_RESERVED = 0x8C
+
+_COMMAND_NAMES = {getattr(NRF24, name): name for name in (
+    'R_RX_PL_WID', 'R_RX_PAYLOAD', 'W_TX_PAYLOAD', 'W_TX_PAYLOAD_NO_ACK', 'FLUSH_TX', 'FLUSH_RX', 'REUSE_TX_PL', 'NOP')}
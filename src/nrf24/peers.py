@@ -0,0 +1,173 @@
+import collections
+
+
+#
+# Virtual pipe table mapping any number of peers onto the reading pipes of the NRF24L01.
+#
+# The NRF24L01 has six reading pipes. P0 is used for acknowledgements when sending, which leaves P1 to P5 for peers.
+# P1 has a full address, while P2 to P5 only have their own first byte and share the remaining bytes (the prefix) with
+# P1. Only peers whose address has the same prefix as P1 can be assigned to pipes at the same time.
+#
+# The PeerTable keeps the peers that currently hold a pipe in least recently used order. When a peer without a pipe
+# becomes active, the least recently used peer gives up its pipe. When the peer has a different prefix than the one
+# in P1, the pipes are reloaded with the most active peers sharing the new prefix. All changes are written to the
+# NRF24L01 in a single batch with open_reading_pipes(), and only the pipes whose peer changes are written.
+#
+# The peers activated together must fit in the pipes at the same time: at most five peers, all sharing one prefix.
+#
+
+_PIPES = (1, 2, 3, 4, 5)
+
+
+class PeerTable:
+
+    def __init__(self, nrf, size=None):
+        self._nrf = nrf
+        self._size = size
+
+        self._peers = {}                            # address -> number of times the peer has been active.
+        self._by_pipe = [None] * 6                  # pipe -> address
+        self._by_address = {}                       # address -> pipe
+        self._lru = collections.OrderedDict()       # address -> pipe, least recently used first.
+        self._prefix = None                         # Prefix of the address in P1.
+        self._changes = {}                          # pipe -> address (or None) waiting to be written.
+
+
+    def add_peer(self, address):
+        address = self._address(address)
+        self._peers.setdefault(address, 0)
+
+
+    def remove_peer(self, address):
+        address = self._address(address)
+        self._peers.pop(address, None)
+        pipe = self._by_address.get(address)
+        if pipe is not None:
+            self._release(pipe)
+            self._changes[pipe] = None
+            self.commit()
+
+
+    def get_peers(self):
+        return list(self._peers)
+
+
+    def get_pipe(self, address):
+        # Return the pipe assigned to the peer or None.
+        return self._by_address.get(self._address(address))
+
+
+    def lookup(self, pipe):
+        # Return the address of the peer assigned to the pipe, for example the pipe returned by data_pipe().
+        return self._by_pipe[pipe] if 0 <= pipe <= 5 else None
+
+
+    def received(self, pipe):
+        # Record that a payload was received on the pipe and return the address of the peer assigned to it.
+        address = self._by_pipe[pipe] if 0 <= pipe <= 5 else None
+        if address is not None:
+            self._peers[address] += 1
+            self._lru.move_to_end(address)
+        return address
+
+
+    def activate(self, *addresses):
+        # Make sure the peers given hold a reading pipe. Returns the pipe of each peer. Changes are written to the
+        # NRF24L01 in one batch. Raises ValueError if the peers cannot hold pipes at the same time.
+        addresses = [self._address(address) for address in addresses]
+        distinct = set(addresses)
+        if len(distinct) > len(_PIPES):
+            raise ValueError(f'Cannot activate more than {len(_PIPES)} peers at a time ({len(distinct)} given).')
+        if len({address[1:] for address in distinct}) > 1:
+            raise ValueError('Peers activated together must share the same address prefix.')
+
+        pipes = [self._activate(address) for address in addresses]
+        self.commit()
+        return pipes
+
+
+    def plan(self):
+        # Load the pipes with the most active peers sharing the prefix of the most active group of peers, and halve
+        # the activity counters so that the plan follows changes in traffic.
+        groups = collections.defaultdict(int)
+        for address, hits in self._peers.items():
+            groups[address[1:]] += hits
+
+        if groups:
+            prefix = max(groups, key=groups.get)
+            hot = sorted((a for a in self._peers if a[1:] == prefix), key=self._peers.get, reverse=True)
+            self._load(prefix, hot[:len(_PIPES)])
+            self.commit()
+
+        for address in self._peers:
+            self._peers[address] //= 2
+
+
+    def commit(self):
+        if self._changes:
+            self._nrf.open_reading_pipes(self._changes, self._size)
+            self._changes = {}
+
+
+    def _activate(self, address):
+        self._peers.setdefault(address, 0)
+        self._peers[address] += 1
+
+        pipe = self._by_address.get(address)
+        if pipe is not None:
+            self._lru.move_to_end(address)
+            return pipe
+
+        prefix = address[1:]
+        if prefix != self._prefix:
+            # Switch prefix, keeping the most active of the peers sharing it.
+            hot = sorted((a for a in self._peers if a[1:] == prefix and a != address), key=self._peers.get, reverse=True)
+            self._load(prefix, [address] + hot[:len(_PIPES) - 1])
+            self._lru.move_to_end(address)
+            return self._by_address[address]
+
+        # The first byte must be unique among the pipes, which it is since the prefix is shared.
+        free = [p for p in _PIPES if self._by_pipe[p] is None]
+        if free:
+            pipe = free[0]
+        else:
+            pipe = next(iter(self._lru.values()))
+            self._release(pipe)
+
+        self._assign(pipe, address)
+        return pipe
+
+
+    def _load(self, prefix, addresses):
+        # Assign the pipes to the peers given, the first one getting P1 when the prefix changes. With the same prefix,
+        # peers that already hold a pipe keep it.
+        for pipe in _PIPES:
+            address = self._by_pipe[pipe]
+            if prefix != self._prefix or address is not None and address not in addresses:
+                if address is not None:
+                    self._release(pipe)
+                self._changes[pipe] = None
+
+        self._prefix = prefix
+        free = [pipe for pipe in _PIPES if self._by_pipe[pipe] is None]
+        for address in addresses:
+            if address not in self._by_address:
+                self._assign(free.pop(0), address)
+
+
+    def _assign(self, pipe, address):
+        self._by_pipe[pipe] = address
+        self._by_address[address] = pipe
+        self._lru[address] = pipe
+        self._changes[pipe] = address
+
+
+    def _release(self, pipe):
+        address = self._by_pipe[pipe]
+        self._by_pipe[pipe] = None
+        del self._by_address[address]
+        del self._lru[address]
+
+
+    def _address(self, address):
+        return bytes(self._nrf.make_address(address))
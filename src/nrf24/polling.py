@@ -0,0 +1,237 @@
+import collections
+import heapq
+import itertools
+import struct
+import time
+
+from .aggregate import pack_records, iter_records
+from .nrf24 import RF24_PAYLOAD, RF24_RX_ADDR
+
+
+#
+# Gateway-polled collection of readings from many nodes.
+#
+# Instead of every node transmitting on its own timer (which collides as the number of nodes grows), the gateway
+# polls the nodes one at a time. A poll is a one-byte frame, and the node answers it with the readings it has
+# buffered in the acknowledgement payload. Each answer includes the number of readings still buffered on the node, so
+# the gateway can poll busy nodes again right away, and poll quiet nodes less often.
+#
+# The acknowledgement carrying a batch of readings may be lost, and the node cannot tell. Each batch therefore has a
+# sequence number, and each poll carries the sequence number of the last batch the gateway received from the node. The
+# node keeps the readings of the batch returned with a poll until the next poll it receives confirms them, and puts them
+# back at the front of its buffer otherwise.
+#
+#   Poll:     <BB  protocol (0xE6), sequence number of the last batch received (NONE before the first)>
+#   Data:     <BBB protocol (0xE5), sequence number, backlog> + records, each record being <B length> + bytes
+#
+
+DATA = 0xE5
+POLL = 0xE6
+
+_POLL = struct.Struct('<BB')
+_HEADER = struct.Struct('<BBB')
+
+MAX_RECORD = RF24_PAYLOAD.MAX - _HEADER.size - 1
+
+NONE = 0xFF                                         # Sequence numbers run from 0 to 254.
+
+
+class PolledNode:
+    """
+    Node side of the polling protocol. Readings are queued with queue() and are handed to the gateway in the
+    acknowledgement of a later poll. Call process() regularly: it handles the polls received and stages the next
+    batch of readings in the ACK payload. Readings are kept until the gateway has confirmed them.
+    """
+
+    def __init__(self, nrf, address, pipe=RF24_RX_ADDR.P1, queue_size=256):
+        self._nrf = nrf
+        self._pipe = pipe
+        self._buffer = collections.deque()
+        self._queue_size = queue_size
+        self._sequence = 0                  # Sequence number of the next batch.
+        self._staged = None                 # (sequence number, records) in the ACK payload.
+        self._in_flight = None              # (sequence number, records) returned with the last poll.
+
+        nrf.open_reading_pipe(pipe, address, RF24_PAYLOAD.ACK)
+
+
+    def queue(self, record):
+        # Queue a reading. Returns False if the buffer is full.
+        record = bytes(record)
+        if len(record) > MAX_RECORD:
+            raise ValueError(f'Record too long ({len(record)} > {MAX_RECORD} bytes).')
+        if len(self._buffer) >= self._queue_size:
+            return False
+        self._buffer.append(record)
+        return True
+
+
+    def pending(self):
+        # Return the number of readings not yet confirmed by the gateway.
+        return len(self._buffer) + sum(len(batch[1]) for batch in (self._staged, self._in_flight) if batch)
+
+
+    def process(self):
+        # Returns the number of polls received since the last call.
+        nrf = self._nrf
+        polls = 0
+
+        while nrf.data_ready():
+            poll = bytes(nrf.get_payload())
+            polls += 1
+            self._confirm(poll[1] if len(poll) >= _POLL.size and poll[0] == POLL else NONE)
+
+            # The staged batch, if any, was returned with this poll. Later polls got an empty acknowledgement.
+            self._in_flight = self._staged
+            self._staged = None
+
+        self._stage()
+        return polls
+
+
+    def _confirm(self, sequence):
+        if self._in_flight is None:
+            return
+        if self._in_flight[0] != sequence:
+            # The gateway did not get the batch, so its readings go out again first.
+            self._buffer.extendleft(reversed(self._in_flight[1]))
+        self._in_flight = None
+
+
+    def _stage(self):
+        if self._staged is not None or not self._buffer:
+            return
+
+        payload, count = pack_records(self._buffer, RF24_PAYLOAD.MAX - _HEADER.size)
+        records = [self._buffer.popleft() for _ in range(count)]
+
+        sequence = self._sequence
+        self._sequence = (sequence + 1) % NONE
+        self._nrf.ack_payload(self._pipe, _HEADER.pack(DATA, sequence, min(len(self._buffer), 255)) + payload)
+        self._staged = (sequence, records)
+
+
+class _Node:
+
+    def __init__(self, address, interval):
+        self.address = address
+        self.interval = interval
+        self.polls = 0
+        self.records = 0
+        self.lost = 0
+        self.received = NONE                # Sequence number of the last batch received.
+
+
+class PollingGateway:
+    """
+    Gateway side of the polling protocol. Nodes are polled when they are due. The interval between polls of a node
+    halves (down to min_interval) when the node answers with data and doubles (up to max_interval) when it does not.
+    """
+
+    def __init__(self, nrf, min_interval=0.01, max_interval=10.0):
+        assert 0 < min_interval <= max_interval
+
+        self._nrf = nrf
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+
+        self._nodes = {}
+        self._schedule = []                         # Heap of (due time, tie breaker, node).
+        self._order = itertools.count()
+        self._current = None                        # Address currently open as writing pipe.
+
+
+    def add_node(self, address):
+        address = bytes(self._nrf.make_address(address))
+        if address not in self._nodes:
+            node = self._nodes[address] = _Node(address, self._min_interval)
+            self._schedule_node(time.monotonic(), node)
+
+
+    def remove_node(self, address):
+        # The entry of the node in the schedule is skipped, and dropped when it reaches the top.
+        self._nodes.pop(bytes(self._nrf.make_address(address)), None)
+
+
+    def get_nodes(self):
+        return list(self._nodes)
+
+
+    def get_statistics(self, address):
+        node = self._nodes[bytes(self._nrf.make_address(address))]
+        return {'interval': node.interval, 'polls': node.polls, 'records': node.records, 'lost': node.lost}
+
+
+    def next_due(self):
+        # Return the number of seconds until the next node is due, or None if there are no nodes.
+        self._drop_removed()
+        if not self._schedule:
+            return None
+        return max(0.0, self._schedule[0][0] - time.monotonic())
+
+
+    def process(self):
+        # Poll every node that is due. Returns a list of (address, record) tuples collected.
+        collected = []
+        now = time.monotonic()
+
+        self._drop_removed()
+        while self._schedule and self._schedule[0][0] <= now:
+            _, _, node = heapq.heappop(self._schedule)
+            backlog = self._poll(node, collected)
+
+            if backlog:
+                # The node has more to give, so come back right away.
+                due = now
+            else:
+                due = now + node.interval
+            self._schedule_node(due, node)
+            self._drop_removed()
+
+            if backlog:
+                # Avoid spinning on one node, let the others have their turn first.
+                break
+
+        return collected
+
+
+    def _schedule_node(self, due, node):
+        heapq.heappush(self._schedule, (due, next(self._order), node))
+
+
+    def _drop_removed(self):
+        # Drop entries of removed nodes from the top of the schedule. A node removed and added again has a new entry,
+        # so its old one is dropped too.
+        schedule = self._schedule
+        while schedule and self._nodes.get(schedule[0][2].address) is not schedule[0][2]:
+            heapq.heappop(schedule)
+
+
+    def _poll(self, node, collected):
+        nrf = self._nrf
+        if node.address != self._current:
+            nrf.open_writing_pipe(node.address, RF24_PAYLOAD.ACK)
+            self._current = node.address
+
+        node.polls += 1
+        try:
+            ack = nrf.exchange(_POLL.pack(POLL, node.received))
+        except TimeoutError:
+            ack = None
+
+        if ack is None:
+            node.lost += 1
+            node.interval = min(node.interval * 2, self._max_interval)
+            return 0
+
+        if len(ack) < _HEADER.size or ack[0] != DATA:
+            # No data ready on the node.
+            node.interval = min(node.interval * 2, self._max_interval)
+            return 0
+
+        _, node.received, backlog = _HEADER.unpack_from(bytes(ack))
+        records = list(iter_records(ack[_HEADER.size:]))
+        node.records += len(records)
+        node.interval = max(node.interval / 2, self._min_interval)
+        collected.extend((node.address, record) for record in records)
+        return backlog
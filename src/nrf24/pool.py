@@ -0,0 +1,171 @@
+import collections
+import threading
+import time
+
+from .nrf24 import NRF24, SPI_CHANNEL
+
+
+#
+# Several NRF24 modules on one Raspberry PI, sharing one pigpio connection.
+#
+# The pool owns the radios and runs them from a single loop: process() sends the data queued for each radio and
+# returns what the radios have received as one stream. Sending does not block, so all radios transmit at the same
+# time, and each radio is drained in turn, the one with the fullest RX FIFO first, so that a busy radio is less likely
+# to drop packets because its FIFO is full.
+#
+# The radios on the main SPI bus (SPI_CHANNEL.MAIN_CE0 and MAIN_CE1) and on the aux SPI bus (SPI_CHANNEL.AUX_CE0 to
+# AUX_CE2) each share a lock, which is held for every operation on a radio of the bus, so that a sequence of transfers
+# to one radio (such as reading a payload) is not interleaved with transfers to another. Use lock() around any direct
+# use of a radio from another thread, such as a pigpio callback.
+#
+# Each radio should use its own channel or address, otherwise they will all receive (and acknowledge) the same
+# packets. The throughput of the pool is bounded by pigpiod: every SPI transfer is a round trip to it.
+#
+
+MAIN = 'main'
+AUX = 'aux'
+
+# Seconds before a send is given up (see NRF24.wait_until_sent()).
+SEND_TIMEOUT = 0.1
+
+
+class _Radio:
+
+    def __init__(self, nrf, lock):
+        self.nrf = nrf
+        self.lock = lock
+        self.queue = collections.deque()
+        self.sending = None                         # Time the current send started.
+        self.received = 0
+        self.sent = 0
+        self.lost = 0
+        self.full = 0                               # Times the RX FIFO was found full.
+
+
+class NRF24Pool:
+    """
+    A set of NRF24 instances on one pigpio connection, with a single send and receive API. Add radios with
+    add_radio() (or add() for an existing NRF24), queue data with send(), and call process() as often as possible; it
+    returns the payloads received as a list of (tick, radio, pipe, payload) tuples, where radio is the index of the
+    radio and tick the pigpio tick at which its RX FIFO was read.
+    """
+
+    def __init__(self, pi, queue_size=64):
+        self._pi = pi
+        self._queue_size = queue_size
+        self._radios = []
+        self._locks = {}
+        self._first = 0                             # Radio polled first, rotated to break ties fairly.
+
+
+    def add_radio(self, ce, spi_channel=SPI_CHANNEL.MAIN_CE0, **kwargs):
+        # Create an NRF24 on the connection of the pool and add it. Returns the index of the radio.
+        return self.add(NRF24(self._pi, ce, spi_channel, **kwargs))
+
+
+    def add(self, nrf):
+        bus = AUX if nrf.get_spi_channel() >= SPI_CHANNEL.AUX_CE0 else MAIN
+        self._radios.append(_Radio(nrf, self._locks.setdefault(bus, threading.RLock())))
+        return len(self._radios) - 1
+
+
+    def __len__(self):
+        return len(self._radios)
+
+
+    def get_radio(self, radio):
+        return self._radios[radio].nrf
+
+
+    def get_pi(self):
+        return self._pi
+
+
+    def lock(self, radio):
+        # The lock of the SPI bus of a radio.
+        return self._radios[radio].lock
+
+
+    def send(self, data, radio=None):
+        # Queue data to be sent by a radio, by default the one with the least data queued. Returns the index of the
+        # radio, or None if its queue is full.
+        if radio is None:
+            radio = min(range(len(self._radios)),
+                        key=lambda i: len(self._radios[i].queue) + (self._radios[i].sending is not None))
+        entry = self._radios[radio]
+        if len(entry.queue) >= self._queue_size:
+            return None
+        entry.queue.append(bytes(data))
+        return radio
+
+
+    def pending(self, radio=None):
+        if radio is None:
+            return sum(len(r.queue) for r in self._radios)
+        return len(self._radios[radio].queue)
+
+
+    def get_statistics(self, radio=None):
+        if radio is None:
+            return {'received': sum(r.received for r in self._radios), 'sent': sum(r.sent for r in self._radios),
+                    'lost': sum(r.lost for r in self._radios), 'full': sum(r.full for r in self._radios)}
+        r = self._radios[radio]
+        return {'received': r.received, 'sent': r.sent, 'lost': r.lost, 'full': r.full, 'queued': len(r.queue)}
+
+
+    def process(self):
+        self._transmit()
+        return self.receive()
+
+
+    def receive(self):
+        # Drain the RX FIFOs of the radios that are not sending, fullest first.
+        count = len(self._radios)
+        ready = []
+        for k in range(count):
+            index = (self._first + k) % count
+            r = self._radios[index]
+            if r.sending is not None:
+                continue
+            with r.lock:
+                fifo_status = r.nrf.get_fifo_status()
+            if not fifo_status & NRF24.FRX_EMPTY:
+                full = (fifo_status & NRF24.FRX_FULL) != 0
+                r.full += full
+                ready.append((not full, k, index))
+        self._first = (self._first + 1) % count if count else 0
+
+        received = []
+        for _, _, index in sorted(ready):
+            r = self._radios[index]
+            nrf = r.nrf
+            with r.lock:
+                tick = self._pi.get_current_tick()
+                while nrf.data_ready():
+                    pipe = nrf.data_pipe()
+                    received.append((tick, index, pipe, bytes(nrf.get_payload())))
+                    r.received += 1
+        return received
+
+
+    def _transmit(self):
+        # Start the next send on every radio that is done with the previous one.
+        for r in self._radios:
+            nrf = r.nrf
+            with r.lock:
+                if r.sending is not None:
+                    if nrf.is_sending():
+                        if time.monotonic() - r.sending < SEND_TIMEOUT:
+                            continue
+                        nrf.power_up_rx()
+                        r.lost += 1
+                    elif nrf.get_packages_lost() != 0:
+                        nrf.reset_packages_lost()
+                        r.lost += 1
+                    else:
+                        r.sent += 1
+                    r.sending = None
+
+                if r.queue:
+                    nrf.send(r.queue.popleft())
+                    r.sending = time.monotonic()
@@ -0,0 +1,237 @@
+import collections
+import random
+import struct
+import time
+
+from .nrf24 import NRF24, RF24_PAYLOAD
+
+
+#
+# Reliable delivery on top of NRF24.
+#
+# The auto-acknowledgement of the NRF24L01 confirms a single frame on a single hop. When a frame reaches MAX_RT it is
+# silently lost, and when the acknowledgement is lost the frame is delivered twice. The ReliableChannel adds a
+# sequence number to each frame so that frames can be retransmitted until they are acknowledged, and duplicates can
+# be dropped by the receiver.
+#
+# Frames are loaded into the TX FIFO back to back (up to "window" frames in flight), and a window is only confirmed
+# when the TX FIFO has been emptied without MAX_RT. When MAX_RT occurs, or the window times out, all frames in flight
+# are retransmitted and the window starts over from a single frame, doubling with every confirmed window. Frames that
+# had already been delivered are then dropped by the receiver, which keeps a bounded history of the most recent
+# sequence numbers received from each peer.
+#
+# Each ReliableChannel picks a random session number, which is sent with every frame. When a sender is restarted, its
+# sequence numbers start over, and the receiver would drop its first frames as duplicates of those it received before
+# the restart. A frame with a different session number therefore starts a new history for the source. The session
+# number is a single byte, so one restart in 256 still reuses the old history.
+#
+#   Frame:  <BBBB protocol (0xD0), source, session, sequence> + payload
+#
+
+DATA = 0xD0
+
+_HEADER = struct.Struct('<BBBB')
+
+MAX_PAYLOAD = RF24_PAYLOAD.MAX - _HEADER.size
+
+
+class _Peer:
+
+    def __init__(self, address):
+        self.address = address
+        self.sequence = 0
+        self.queue = collections.deque()            # [sequence, frame, failed attempts] waiting to be sent.
+        self.in_flight = []                         # [sequence, frame, failed attempts] loaded into the TX FIFO.
+        self.retry_at = 0                           # Time before which frames should not be retransmitted.
+        self.window = 1                             # Current window, grows on success and drops to 1 on failure.
+
+
+class ReliableChannel:
+
+    def __init__(self, nrf, source, window=8, timeout=0.05, max_attempts=5, history=64):
+        assert 0 <= source <= 255
+        assert 1 <= window < history <= 128, "Window must be smaller than history, and history at most 128."
+
+        self._nrf = nrf
+        self._source = source
+        self._window = window
+        self._timeout = timeout
+        self._max_attempts = max_attempts
+        self._history = history
+        self._session = random.randrange(256)
+
+        self._peers = collections.OrderedDict()     # address -> _Peer
+        self._current = None                        # Peer whose address is open as writing pipe.
+        self._loaded_at = None                      # Time of last progress on the frames in flight.
+        self._seen = {}                             # source -> OrderedDict of recently received sequence numbers.
+        self._sessions = {}                         # source -> session number of the history in _seen.
+        self._transmitting = False
+
+        self._failed = []
+        self._failures = 0
+        self._sent = 0
+        self._retransmitted = 0
+        self._duplicates = 0
+
+
+    def send(self, address, payload):
+        # Queue a payload for reliable delivery to the address given. Frames are sent by process().
+        payload = bytes(payload)
+        if len(payload) > MAX_PAYLOAD:
+            raise ValueError(f'Payload too long ({len(payload)} > {MAX_PAYLOAD} bytes).')
+
+        address = bytes(self._nrf.make_address(address))
+        peer = self._peers.get(address)
+        if peer is None:
+            peer = self._peers[address] = _Peer(address)
+
+        frame = _HEADER.pack(DATA, self._source, self._session, peer.sequence) + payload
+        peer.queue.append([peer.sequence, frame, 0])
+        peer.sequence = (peer.sequence + 1) & 0xFF
+
+
+    def pending(self):
+        return sum(len(p.queue) + len(p.in_flight) for p in self._peers.values())
+
+
+    def process(self):
+        # Advance transmission. Call this repeatedly until pending() returns 0. Returns True while frames are in
+        # flight.
+        nrf = self._nrf
+        peer = self._current
+
+        if peer is not None and peer.in_flight:
+            status = nrf.get_status()
+
+            if status & NRF24.MAX_RT:
+                # The frame at the head of the TX FIFO failed. Frames after it were never sent. Clear MAX_RT so the
+                # radio sends again.
+                nrf.flush_tx()
+                nrf.power_up_rx()
+                self._requeue(peer)
+            elif nrf.is_tx_empty():
+                # Everything loaded into the TX FIFO has been acknowledged.
+                self._sent += len(peer.in_flight)
+                peer.in_flight = []
+                peer.window = min(peer.window * 2, self._window)
+            elif time.monotonic() - self._loaded_at > self._timeout:
+                nrf.flush_tx()
+                nrf.power_up_rx()
+                self._requeue(peer)
+
+        if peer is None or not peer.in_flight and (not peer.queue or peer.retry_at > time.monotonic()):
+            # Only change the writing pipe when nothing is in flight. Frames queued again are held back until
+            # retry_at, and other peers are served meanwhile.
+            peer = self._next_peer()
+            if peer is None:
+                if self._transmitting and not self.pending():
+                    # Leave TX mode once the last window has been confirmed.
+                    nrf.power_up_rx()
+                    self._transmitting = False
+                return False
+
+        # Fill the TX FIFO up to the size of the window.
+        while peer.queue and len(peer.in_flight) < peer.window:
+            if nrf.is_tx_full():
+                break
+            entry = peer.queue.popleft()
+            nrf.load_payload(entry[1])
+            peer.in_flight.append(entry)
+            self._loaded_at = time.monotonic()
+            self._transmitting = True
+
+        return bool(peer.in_flight)
+
+
+    def flush(self, timeout=None):
+        # Process until all frames have been delivered or have failed. Returns True if nothing is pending.
+        start = time.monotonic()
+        while self.pending():
+            if timeout is not None and time.monotonic() - start > timeout:
+                return False
+            self.process()
+            time.sleep(0.00025)
+
+        self.process()
+        return True
+
+
+    def receive(self):
+        # Drain the RX FIFO and return a list of (source, payload) tuples with duplicates removed. Frames that are
+        # not reliable frames are returned with a source of None.
+        nrf = self._nrf
+        received = []
+
+        while nrf.data_ready():
+            frame = bytes(nrf.get_payload())
+            if len(frame) < _HEADER.size or frame[0] != DATA:
+                received.append((None, frame))
+                continue
+
+            _, source, session, sequence = _HEADER.unpack_from(frame)
+
+            seen = self._seen.get(source)
+            if seen is None or self._sessions[source] != session:
+                # First frame from the source, or the source has been restarted.
+                seen = self._seen[source] = collections.OrderedDict()
+                self._sessions[source] = session
+
+            if sequence in seen:
+                seen.move_to_end(sequence)
+                self._duplicates += 1
+                continue
+
+            seen[sequence] = None
+            if len(seen) > self._history:
+                seen.popitem(last=False)
+
+            received.append((source, frame[_HEADER.size:]))
+
+        return received
+
+
+    def get_failed(self):
+        # Return the (address, payload) of frames given up after max_attempts since the last call.
+        failed = self._failed
+        self._failed = []
+        return failed
+
+
+    def get_statistics(self):
+        return {'sent': self._sent, 'retransmitted': self._retransmitted, 'duplicates': self._duplicates, 'failed': self._failures}
+
+
+    def _requeue(self, peer):
+        # Put the frames in flight back at the front of the queue in their original order, and hold them back for
+        # the duration of the timeout before they are retransmitted. The window drops to a single frame, so that a
+        # frame failing again can be identified and have the attempt counted against it.
+        in_flight = peer.in_flight
+        peer.in_flight = []
+
+        if len(in_flight) == 1:
+            head = in_flight[0]
+            head[2] += 1
+            if head[2] >= self._max_attempts:
+                self._failed.append((peer.address, head[1][_HEADER.size:]))
+                self._failures += 1
+                in_flight = []
+
+        peer.window = 1
+
+        peer.queue.extendleft(reversed(in_flight))
+        self._retransmitted += len(in_flight)
+        peer.retry_at = time.monotonic() + self._timeout
+
+
+    def _next_peer(self):
+        # Pick the next peer with queued frames in round-robin order and open its address as writing pipe.
+        now = time.monotonic()
+        for address in list(self._peers):
+            self._peers.move_to_end(address)
+            peer = self._peers[address]
+            if peer.queue and peer.retry_at <= now:
+                if peer is not self._current:
+                    self._nrf.open_writing_pipe(address)
+                    self._current = peer
+                return peer
+        return None
@@ -0,0 +1,265 @@
+from enum import IntEnum
+import struct
+import time
+
+from .nrf24 import RF24_PAYLOAD, RF24_RX_ADDR
+
+
+#
+# Request/reply on top of NRF24 with correlated, pipelined requests.
+#
+# A request carries a request id, a command code, and the address the reply should be sent to. Replies carry the
+# request id of the request they answer, so a client can have several requests outstanding at the same time and match
+# replies as they arrive. The frames carry the length of the arguments and of the result, so they also work with a
+# fixed payload size, where the radio pads every frame:
+#
+#   Request:  <BBBBB protocol (0xE0), request id, command, reply-to length, arguments length> + reply-to address +
+#             arguments
+#   Reply:    <BBBB  protocol (0xE1), request id, status, result length> + result
+#
+# All clients write to the server address, so a client keeps its P0 closed while waiting for replies. Otherwise it
+# would acknowledge the requests of the other clients, and the acknowledgements would collide with those of the server.
+#
+
+REQUEST = 0xE0
+REPLY = 0xE1
+
+_REQUEST = struct.Struct('<BBBBB')
+_REPLY = struct.Struct('<BBBB')
+
+
+class RPC_STATUS(IntEnum):
+    OK = 0
+    UNKNOWN_COMMAND = 1
+    ERROR = 2
+    TIMEOUT = 3
+    NOT_SENT = 4
+
+
+class RpcError(Exception):
+
+    def __init__(self, request):
+        super().__init__(f'Request {request.request_id} (command 0x{request.command:02x}) failed with status {request.status}.')
+        self.request = request
+
+
+class RpcRequest:
+    """
+    An outstanding request. When done is True, status holds one of the RPC_STATUS values and result holds the bytes
+    returned by the server.
+    """
+
+    def __init__(self, request_id, command, deadline):
+        self.request_id = request_id
+        self.command = command
+        self.deadline = deadline
+        self.done = False
+        self.status = None
+        self.result = None
+
+
+class RpcClient:
+
+    def __init__(self, nrf, address, server, max_outstanding=8, timeout=1.0):
+        assert 1 <= max_outstanding <= 255
+
+        self._nrf = nrf
+        self._address = nrf.make_address(address)
+        self._max_outstanding = max_outstanding
+        self._timeout = timeout
+
+        self._next_id = 0
+        self._pending = {}                              # request id -> RpcRequest.
+        self._completed = []
+
+        # Requests go to the server, and replies are received on P1. P0 is only enabled while sending a request.
+        nrf.open_writing_pipe(server)
+        nrf.open_reading_pipe(RF24_RX_ADDR.P1, address)
+        nrf.close_reading_pipe(RF24_RX_ADDR.P0)
+
+
+    def outstanding(self):
+        return len(self._pending)
+
+
+    def request(self, command, args=b'', timeout=None):
+        # Send a request without waiting for the reply. Returns an RpcRequest that is completed by poll().
+        if len(self._pending) >= self._max_outstanding:
+            raise RuntimeError(f'Too many outstanding requests ({len(self._pending)}).')
+
+        if timeout is None:
+            timeout = self._timeout
+
+        args = bytes(args)
+        request_id = self._allocate_id()
+        frame = _REQUEST.pack(REQUEST, request_id, command, len(self._address), len(args)) + bytes(self._address) + args
+        if len(frame) > RF24_PAYLOAD.MAX:
+            raise ValueError(f'Request arguments too long ({len(args)} bytes).')
+
+        request = RpcRequest(request_id, command, time.monotonic() + timeout)
+
+        nrf = self._nrf
+        nrf.enable_reading_pipe(RF24_RX_ADDR.P0)
+        nrf.reset_packages_lost()
+        nrf.send(frame)
+        try:
+            nrf.wait_until_sent()
+            lost = nrf.get_packages_lost() != 0
+        except TimeoutError:
+            lost = True
+        nrf.close_reading_pipe(RF24_RX_ADDR.P0)
+
+        if lost:
+            self._complete(request, RPC_STATUS.NOT_SENT, None)
+        else:
+            self._pending[request_id] = request
+
+        return request
+
+
+    def poll(self):
+        # Match received replies with outstanding requests and expire requests past their deadline. Returns the
+        # requests completed since the last call.
+        self._update()
+
+        completed = self._completed
+        self._completed = []
+        return completed
+
+
+    def call(self, command, args=b'', timeout=None):
+        # Send a request and wait for the reply. Returns the result or raises RpcError.
+        request = self.request(command, args, timeout)
+        while not request.done:
+            self._update()
+            if not request.done:
+                time.sleep(0.0005)
+
+        # The request has been handled here, so make sure poll() does not return it as well.
+        self._completed.remove(request)
+
+        if request.status != RPC_STATUS.OK:
+            raise RpcError(request)
+        return request.result
+
+
+    def _update(self):
+        nrf = self._nrf
+        while nrf.data_ready():
+            frame = bytes(nrf.get_payload())
+            if len(frame) < _REPLY.size or frame[0] != REPLY:
+                continue
+
+            _, request_id, status, length = _REPLY.unpack_from(frame)
+            result = frame[_REPLY.size:_REPLY.size + length]
+            if len(result) != length:
+                continue
+
+            request = self._pending.pop(request_id, None)
+            if request is not None:
+                self._complete(request, status, result)
+
+        now = time.monotonic()
+        for request_id in [r.request_id for r in self._pending.values() if r.deadline <= now]:
+            self._complete(self._pending.pop(request_id), RPC_STATUS.TIMEOUT, None)
+
+
+    def _allocate_id(self):
+        for _ in range(256):
+            request_id = self._next_id
+            self._next_id = (self._next_id + 1) & 0xFF
+            if request_id not in self._pending:
+                return request_id
+        raise RuntimeError('No free request id.')
+
+
+    def _complete(self, request, status, result):
+        request.done = True
+        request.status = status
+        request.result = result
+        self._completed.append(request)
+
+
+class RpcServer:
+    """
+    Dispatches requests to handlers registered by command code. A handler is called with the argument bytes of the
+    request and returns the bytes of the result. Requests with a reply-to address that does not match the address
+    width of the radio cannot be answered, and are dropped, and so are requests shorter than their header says.
+    """
+
+    def __init__(self, nrf, address, pipe=RF24_RX_ADDR.P1):
+        self._nrf = nrf
+        self._handlers = {}
+        self._writing = None                            # Address currently open as writing pipe.
+        self._address_width = nrf.get_address_bytes()
+        self._handled = 0
+        self._dropped = 0
+        self._lost = 0
+
+        nrf.open_reading_pipe(pipe, address)
+
+
+    def register(self, command, handler):
+        assert 0 <= command <= 255
+        self._handlers[command] = handler
+
+
+    def get_statistics(self):
+        # The number of requests handled, of requests dropped because they were malformed, and of replies that were
+        # not acknowledged by the client.
+        return {'handled': self._handled, 'dropped': self._dropped, 'lost': self._lost}
+
+
+    def poll(self):
+        # Drain all requests from the RX FIFO before replying, so that the radio is only turned around once for a
+        # batch of requests. Returns the number of requests handled.
+        nrf = self._nrf
+        replies = []
+
+        while nrf.data_ready():
+            frame = bytes(nrf.get_payload())
+            if len(frame) < _REQUEST.size or frame[0] != REQUEST:
+                continue
+
+            _, request_id, command, width, length = _REQUEST.unpack_from(frame)
+            reply_to = frame[_REQUEST.size:_REQUEST.size + width]
+            args = frame[_REQUEST.size + width:_REQUEST.size + width + length]
+            if width != self._address_width or len(reply_to) != width or len(args) != length:
+                self._dropped += 1
+                continue
+            replies.append((reply_to, request_id, *self._dispatch(command, args)))
+
+        # Send replies grouped by address, so the writing pipe is only opened once per client.
+        replies.sort(key=lambda r: r[0])
+        for reply_to, request_id, status, result in replies:
+            if reply_to != self._writing:
+                nrf.open_writing_pipe(reply_to)
+                self._writing = reply_to
+
+            nrf.reset_packages_lost()
+            nrf.send(_REPLY.pack(REPLY, request_id, status, len(result)) + result)
+            try:
+                nrf.wait_until_sent()
+                if nrf.get_packages_lost():
+                    self._lost += 1
+            except TimeoutError:
+                self._lost += 1
+
+        self._handled += len(replies)
+        return len(replies)
+
+
+    def _dispatch(self, command, args):
+        handler = self._handlers.get(command)
+        if handler is None:
+            return RPC_STATUS.UNKNOWN_COMMAND, b''
+
+        try:
+            result = bytes(handler(args) or b'')
+        except Exception:
+            return RPC_STATUS.ERROR, b''
+
+        if len(result) > RF24_PAYLOAD.MAX - _REPLY.size:
+            return RPC_STATUS.ERROR, b''
+
+        return RPC_STATUS.OK, result
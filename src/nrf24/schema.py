@@ -0,0 +1,163 @@
+import re
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+#
+# Registry of message layouts keyed by protocol byte.
+#
+# The example programs identify their messages by the first byte of the payload, and unpack the rest by hand with
+# struct.unpack("<Bff", payload). A Schema holds the precompiled struct.Struct of such a layout, including the
+# protocol byte, together with field names. The SchemaRegistry looks up the schema from the first byte of a payload
+# and decodes it, or calls the handler registered for it.
+#
+# Batches of payloads with the same layout can be decoded into a NumPy structured array with a single np.frombuffer()
+# call. NumPy is optional and only needed for decode_batch().
+#
+
+_FIELD = re.compile(r'(\d*)([xcbB?hHiIlLqQefdsp])')
+
+_DTYPES = {
+    'c': 'S1', 'b': 'i1', 'B': 'u1', '?': '?', 'h': 'i2', 'H': 'u2', 'i': 'i4', 'I': 'u4', 'l': 'i4', 'L': 'u4',
+    'q': 'i8', 'Q': 'u8', 'e': 'f2', 'f': 'f4', 'd': 'f8',
+}
+
+_BYTE_ORDER = {'<': '<', '>': '>', '!': '>', '=': '='}
+
+
+class Schema:
+
+    def __init__(self, protocol, fmt, names, name=None):
+        # The format must use standard sizes (start with "<", ">", "!" or "=") and its first field must be the
+        # protocol byte ("B"), like "<Bff". The names are given for the fields following the protocol byte, not
+        # counting pad bytes. The protocol byte itself is named "protocol".
+        assert 0 <= protocol <= 255
+
+        if not fmt or fmt[0] not in _BYTE_ORDER:
+            raise ValueError(f'Format "{fmt}" must start with "<", ">", "!" or "=".')
+
+        self.protocol = protocol
+        self.struct = struct.Struct(fmt)
+        self.names = ('protocol',) + tuple(names)
+        self.name = name
+        self.size = self.struct.size
+
+        self._fields = _FIELD.findall(fmt[1:])
+        if not self._fields or self._fields[0] != ('', 'B'):
+            raise ValueError(f'Format "{fmt}" must start with the protocol byte "B".')
+
+        expected = sum(1 if c in 'sp' else int(n or 1) for n, c in self._fields if c != 'x')
+        if expected != len(self.names):
+            raise ValueError(f'Format "{fmt}" has {expected - 1} fields after the protocol byte, but {len(names)} names were given.')
+
+        self._dtype = None
+
+
+    def unpack(self, payload):
+        # Unpack the first size bytes of the payload; padding after them is ignored.
+        return self.struct.unpack_from(bytes(payload))
+
+
+    def unpack_dict(self, payload):
+        return dict(zip(self.names, self.struct.unpack_from(bytes(payload))))
+
+
+    def pack(self, *values):
+        # Pack the values following the protocol byte.
+        return self.struct.pack(self.protocol, *values)
+
+
+    def dtype(self):
+        # Return the NumPy dtype matching the layout. Repeated fields (for example "3f") have one name per value,
+        # just like they do in the names given to the constructor.
+        if np is None:
+            raise RuntimeError('NumPy is required for dtype().')
+
+        if self._dtype is None:
+            order = _BYTE_ORDER[self.struct.format[0]]
+            fields = []
+            names = iter(self.names)
+            pad = 0
+            for count, code in self._fields:
+                count = int(count or 1)
+                if code == 'x':
+                    fields.append((f'_pad{pad}', f'V{count}'))
+                    pad += 1
+                elif code in 'sp':
+                    fields.append((next(names), f'S{count}'))
+                else:
+                    for _ in range(count):
+                        fields.append((next(names), order + _DTYPES[code]))
+            self._dtype = np.dtype(fields)
+
+        return self._dtype
+
+
+class SchemaRegistry:
+
+    def __init__(self):
+        self._schemas = [None] * 256
+        self._handlers = [None] * 256
+
+
+    def register(self, schema, handler=None):
+        # Register a schema for its protocol byte, optionally with a handler called by dispatch() with the values.
+        self._schemas[schema.protocol] = schema
+        self._handlers[schema.protocol] = handler
+        return schema
+
+
+    def get(self, protocol):
+        return self._schemas[protocol]
+
+
+    def decode(self, payload):
+        # Return (schema, values) for a payload, or (None, None) if the protocol byte is unknown or the payload is
+        # shorter than the schema. Bytes after the schema, such as the padding of a fixed payload size, are ignored.
+        if len(payload) == 0:
+            return None, None
+
+        schema = self._schemas[payload[0]]
+        if schema is None or len(payload) < schema.size:
+            return None, None
+
+        return schema, schema.struct.unpack_from(bytes(payload))
+
+
+    def dispatch(self, payload):
+        # Decode the payload and call the handler registered for its protocol byte with the values. Returns True if
+        # a handler was called.
+        if len(payload) == 0:
+            return False
+
+        protocol = payload[0]
+        schema = self._schemas[protocol]
+        handler = self._handlers[protocol]
+        if schema is None or handler is None or len(payload) < schema.size:
+            return False
+
+        handler(*schema.struct.unpack_from(bytes(payload)))
+        return True
+
+
+    def decode_batch(self, protocol, payloads):
+        # Decode a list of payloads with the same protocol byte into a NumPy structured array in one call. All
+        # payloads must be at least the size of the schema; bytes after it are ignored.
+        if np is None:
+            raise RuntimeError('NumPy is required for decode_batch().')
+
+        schema = self._schemas[protocol]
+        if schema is None:
+            raise ValueError(f'No schema registered for protocol 0x{protocol:02x}.')
+
+        size = schema.size
+        if any(len(payload) < size for payload in payloads):
+            raise ValueError(f'All payloads must be at least {size} bytes.')
+
+        buffer = b''.join(bytes(payload[:size]) for payload in payloads)
+
+        return np.frombuffer(buffer, dtype=schema.dtype())
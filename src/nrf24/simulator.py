@@ -0,0 +1,1018 @@
+import collections
+import heapq
+import itertools
+import random
+
+import pigpio
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .airtime import AirtimeConfig, BITRATE, PCF_BITS, PREAMBLE, T_SETTLE
+from .nrf24 import NRF24, RF24_CRC, RF24_DATA_RATE, RF24_PAYLOAD
+
+
+#
+# Discrete-event simulation of networks of nRF24L01+ modules.
+#
+# The Simulator keeps a virtual clock and a heap of events, and runs as fast as the events can be processed. Radios
+# share the medium: a transmission occupies its channel for the time on air computed as in nrf24.airtime, and
+# transmissions overlapping on the same channel are lost at every receiver (there is no capture effect).
+#
+# A Radio emulates a module at the register level: the SPI commands, the register file, the 3 level RX and TX
+# FIFOs, CE, and Enhanced ShockBurst with auto acknowledgement, acknowledgement payloads, duplicate detection, ARD
+# and ARC. There are two ways to drive radios:
+#
+#   * SimulatedPi is a stand-in for pigpio.pi, so the NRF24 class (and everything built on it) runs unmodified
+#     against simulated radios. Every SPI transfer and GPIO write advances the virtual clock by the time it would take.
+#
+#   * TrafficNode and SinkNode drive radios directly from events, without any host code, and are meant for capacity
+#     studies with hundreds of nodes. report() returns the outcome of every packet as NumPy arrays.
+#
+# Example:
+#
+#   sim = Simulator(seed=1)
+#   sink = SinkNode(sim, 'GATEW')
+#   nodes = [TrafficNode(sim, 'GATEW', interval=10.0) for _ in range(500)]
+#   sim.run(3600)
+#   report = sim.report()
+#   print(report['delivered'].mean(), np.percentile(report['latency'][report['delivered']], 99))
+#
+# Packet loss, bit errors, SPI errors and pigpiod disconnects can be injected with sim.set_faults() (see nrf24.faults).
+#
+
+_EPSILON = 1e-9
+
+_IRQ_FLAGS = NRF24.RX_DR | NRF24.TX_DS | NRF24.MAX_RT
+
+_RESET = {
+    NRF24.CONFIG: 0x08,
+    NRF24.EN_AA: 0x3F,
+    NRF24.EN_RXADDR: 0x03,
+    NRF24.SETUP_AW: 0x03,
+    NRF24.SETUP_RETR: 0x03,
+    NRF24.RF_CH: 0x02,
+    NRF24.RF_SETUP: 0x0E,
+    NRF24.STATUS: 0x0E,
+}
+
+_ADDRESS_RESET = {
+    NRF24.RX_ADDR_P0: b'\xe7\xe7\xe7\xe7\xe7',
+    NRF24.RX_ADDR_P1: b'\xc2\xc2\xc2\xc2\xc2',
+    NRF24.RX_ADDR_P2: b'\xc3',
+    NRF24.RX_ADDR_P3: b'\xc4',
+    NRF24.RX_ADDR_P4: b'\xc5',
+    NRF24.RX_ADDR_P5: b'\xc6',
+    NRF24.TX_ADDR: b'\xe7\xe7\xe7\xe7\xe7',
+}
+
+
+class Packet:
+    """
+    A packet on air. Acknowledgements are packets too (ack=True), carrying the PID of the packet acknowledged.
+    """
+
+    __slots__ = ('sender', 'channel', 'data_rate', 'address', 'crc_bytes', 'pid', 'payload', 'no_ack', 'ack', 'start',
+                 'end', 'collided', 'corrupted')
+
+    def __init__(self, sender, channel, data_rate, address, crc_bytes, pid, payload, no_ack=False, ack=False):
+        self.sender = sender
+        self.channel = channel
+        self.data_rate = data_rate
+        self.address = address
+        self.crc_bytes = crc_bytes
+        self.pid = pid
+        self.payload = payload
+        self.no_ack = no_ack
+        self.ack = ack
+        self.start = 0.0
+        self.end = 0.0
+        self.collided = False
+        self.corrupted = False
+
+
+    def copy(self, payload):
+        # Return a copy of the packet with another payload, as received with bit errors.
+        packet = Packet(self.sender, self.channel, self.data_rate, self.address, self.crc_bytes, self.pid, payload,
+                        self.no_ack, self.ack)
+        packet.start = self.start
+        packet.end = self.end
+        return packet
+
+
+    def bits(self):
+        return 8 * (PREAMBLE + len(self.address) + len(self.payload) + self.crc_bytes) + PCF_BITS
+
+
+class Simulator:
+
+    def __init__(self, seed=None):
+        self.now = 0.0
+        self.random = random.Random(seed)
+
+        self._events = []
+        self._sequence = itertools.count()
+        self._on_air = collections.defaultdict(list)        # Channel -> packets on air.
+        self._listeners = collections.defaultdict(dict)     # Channel -> radios receiving (ordered, for repeatability).
+        self._radios = []
+        self._nodes = []
+
+        self._records = ([], [], [], [], [])                # node, created, finished, attempts, delivered
+        self._statistics = collections.Counter()
+
+        self.faults = None
+
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self._events, (self.now + delay, next(self._sequence), callback, args))
+
+
+    def run(self, duration=None, until=None):
+        # Process events for duration seconds of virtual time (or until the virtual time given). Returns the number of
+        # events processed.
+        if until is None:
+            until = self.now + duration if duration is not None else float('inf')
+
+        events = self._events
+        count = 0
+        while events and events[0][0] <= until:
+            time, _, callback, args = heapq.heappop(events)
+            self.now = time
+            callback(*args)
+            count += 1
+
+        if until != float('inf'):
+            self.now = until
+        self._statistics['events'] += count
+        return count
+
+
+    def advance(self, seconds):
+        # Move the virtual clock forward, processing the events that fall within.
+        self.run(until=self.now + seconds)
+
+
+    def set_faults(self, faults):
+        # Attach a nrf24.faults.Faults instance, or None to remove it.
+        self.faults = faults
+
+
+    def add_radio(self, radio):
+        self._radios.append(radio)
+
+
+    def get_radios(self):
+        return list(self._radios)
+
+
+    def is_busy(self, channel, exclude=None):
+        # True if anything but the radio excluded is transmitting on the channel.
+        for packet in self._on_air[channel]:
+            if packet.end > self.now and packet.sender is not exclude:
+                return True
+        return False
+
+
+    def get_statistics(self):
+        return dict(self._statistics)
+
+
+    def report(self):
+        # Return the outcome of every packet generated by the TrafficNodes as NumPy arrays: the index of the node, the
+        # time it was generated and when the sender was done with it, the latency, the number of attempts, and
+        # whether it was delivered.
+        if np is None:
+            raise RuntimeError('NumPy is required for report().')
+
+        node, created, finished, attempts, delivered = self._records
+        created = np.array(created, dtype=np.float64)
+        finished = np.array(finished, dtype=np.float64)
+        return {
+            'node': np.array(node, dtype=np.int32),
+            'created': created,
+            'finished': finished,
+            'latency': finished - created,
+            'attempts': np.array(attempts, dtype=np.int32),
+            'delivered': np.array(delivered, dtype=bool),
+        }
+
+
+    def node_report(self, duration):
+        # Return per node NumPy arrays of packets generated, packets delivered, throughput in packets per second over
+        # duration seconds, and loss ratio.
+        if np is None:
+            raise RuntimeError('NumPy is required for node_report().')
+
+        count = len(self._nodes)
+        node = np.array(self._records[0], dtype=np.int64)
+        delivered = np.array(self._records[4], dtype=bool)
+        generated = np.bincount(node, minlength=count)
+        received = np.bincount(node[delivered], minlength=count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            loss = np.where(generated > 0, 1 - received / generated, 0.0)
+        return {'generated': generated, 'delivered': received, 'throughput': received / duration, 'loss': loss}
+
+
+    def _record(self, node, created, attempts, delivered):
+        records = self._records
+        records[0].append(node)
+        records[1].append(created)
+        records[2].append(self.now)
+        records[3].append(attempts)
+        records[4].append(delivered)
+
+
+    def _transmit(self, packet):
+        # Put a packet on air. Receivers get it at the end of the transmission, if it did not collide.
+        packet.start = self.now
+        packet.end = self.now + packet.bits() / BITRATE[packet.data_rate]
+
+        on_air = self._on_air[packet.channel]
+        on_air[:] = [p for p in on_air if p.end > self.now]
+        for other in on_air:
+            other.collided = True
+            packet.collided = True
+        on_air.append(packet)
+
+        self._statistics['acks' if packet.ack else 'packets'] += 1
+        heapq.heappush(self._events, (packet.end, next(self._sequence), self._deliver, (packet,)))
+
+
+    def _deliver(self, packet):
+        if packet.collided:
+            self._statistics['collisions'] += 1
+            return
+
+        faults = self.faults
+        for radio in list(self._listeners[packet.channel]):
+            if radio is packet.sender:
+                continue
+            if faults is None:
+                radio._receive(packet)
+            else:
+                received = faults.deliver(packet, radio)
+                if received is not None:
+                    radio._receive(received)
+
+
+class Radio:
+    """
+    Register level emulation of an nRF24L01+ module attached to a Simulator. The host side is spi(), set_ce(), and the
+    irq callback, which is called with the radio whenever the IRQ pin is asserted (goes low).
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.irq = None
+
+        self._registers = bytearray(0x20)
+        for register, value in _RESET.items():
+            self._registers[register] = value
+        self._addresses = {register: bytearray(value) for register, value in _ADDRESS_RESET.items()}
+
+        self._ce = False
+        self._tx_fifo = collections.deque()         # (pipe, payload, no_ack), pipe is None unless an ACK payload.
+        self._rx_fifo = collections.deque()         # (pipe, payload)
+
+        self._channel = self._registers[NRF24.RF_CH]
+        self._listening = False
+        self._rx_since = 0.0
+        self._busy = False                          # Transmitting, or waiting for an acknowledgement.
+        self._waiting = None                        # Packet waiting for an acknowledgement.
+        self._deadline = 0.0
+        self._token = 0                             # Invalidates events scheduled for an earlier attempt.
+        self._pid = 0
+        self._arc_cnt = 0
+        self._plos_cnt = 0
+        self._last = [None] * 6                     # (pid, payload) of the last packet received on each pipe.
+
+        self._rate = RF24_DATA_RATE.RATE_2MBPS
+        self._width = 5
+        self._crc = 1
+        self._configured()
+
+        sim.add_radio(self)
+
+
+    # Host interface.
+
+    def set_ce(self, level):
+        self._ce = bool(level)
+        self._update()
+
+
+    def get_ce(self):
+        return self._ce
+
+
+    def spi(self, data):
+        # Execute an SPI transaction and return the bytes clocked out, the STATUS register first.
+        data = list(data)
+        command = data[0]
+        out = [self._status()] + [0] * (len(data) - 1)
+        registers = self._registers
+
+        if command < NRF24.W_REGISTER:
+            register = command & 0x1F
+            value = self._read_register(register, len(data) - 1)
+            out[1:] = value[:len(data) - 1] + [0] * (len(data) - 1 - len(value))
+
+        elif command < 0x40:
+            self._write_register(command & 0x1F, data[1:])
+
+        elif command == NRF24.R_RX_PL_WID:
+            if len(data) > 1:
+                out[1] = len(self._rx_fifo[0][1]) if self._rx_fifo else 0
+
+        elif command == NRF24.R_RX_PAYLOAD:
+            if self._rx_fifo:
+                _, payload = self._rx_fifo.popleft()
+                payload = list(payload)
+                out[1:] = (payload + [0] * len(data))[:len(data) - 1]
+
+        elif command in (NRF24.W_TX_PAYLOAD, NRF24.W_TX_PAYLOAD_NO_ACK):
+            if len(self._tx_fifo) < 3 and len(data) > 1:
+                no_ack = command == NRF24.W_TX_PAYLOAD_NO_ACK and (registers[NRF24.FEATURE] & NRF24.EN_DYN_ACK) != 0
+                self._tx_fifo.append((None, bytes(data[1:33]), no_ack))
+                self._update()
+
+        elif NRF24.W_ACK_PAYLOAD <= command <= NRF24.W_ACK_PAYLOAD + 5:
+            if len(self._tx_fifo) < 3 and len(data) > 1:
+                self._tx_fifo.append((command & 0x07, bytes(data[1:33]), False))
+
+        elif command == NRF24.FLUSH_TX:
+            if not self._busy:
+                self._tx_fifo.clear()
+            else:
+                # The packet being sent is kept until it is done.
+                while len(self._tx_fifo) > 1:
+                    self._tx_fifo.pop()
+
+        elif command == NRF24.FLUSH_RX:
+            self._rx_fifo.clear()
+
+        return out
+
+
+    # Configuration, as seen by the radio.
+
+    def get_channel(self):
+        return self._channel
+
+
+    def _configured(self):
+        # Cache the settings needed for every packet.
+        self._rate = self._data_rate()
+        self._width = self._address_width()
+        self._crc = int(self._crc_bytes())
+
+
+    def _powered(self):
+        return (self._registers[NRF24.CONFIG] & NRF24.PWR_UP) != 0
+
+
+    def _prim_rx(self):
+        return (self._registers[NRF24.CONFIG] & NRF24.PRIM_RX) != 0
+
+
+    def _data_rate(self):
+        rf_setup = self._registers[NRF24.RF_SETUP]
+        return RF24_DATA_RATE.from_value(((rf_setup & NRF24.RF_DR_LOW) >> 4) | ((rf_setup & NRF24.RF_DR_HIGH) >> 3))
+
+
+    def _address_width(self):
+        return (self._registers[NRF24.SETUP_AW] & 0x03) + 2
+
+
+    def _crc_bytes(self):
+        config = self._registers[NRF24.CONFIG]
+        if not config & NRF24.EN_CRC:
+            return RF24_CRC.DISABLED
+        return RF24_CRC.BYTES_2 if config & NRF24.CRCO else RF24_CRC.BYTES_1
+
+
+    def _pipe_address(self, pipe):
+        width = self._width
+        if pipe < 2:
+            return bytes(self._addresses[NRF24.RX_ADDR_P0 + pipe][:width])
+        return bytes(self._addresses[NRF24.RX_ADDR_P0 + pipe][:1] + self._addresses[NRF24.RX_ADDR_P1][1:width])
+
+
+    def _retransmission(self):
+        setup_retr = self._registers[NRF24.SETUP_RETR]
+        return ((setup_retr >> 4) + 1) * 250e-6, setup_retr & 0x0F
+
+
+    # Registers.
+
+    def _status(self):
+        status = self._registers[NRF24.STATUS] & _IRQ_FLAGS
+        status |= (self._rx_fifo[0][0] if self._rx_fifo else 7) << 1
+        if len(self._tx_fifo) >= 3:
+            status |= NRF24.TX_FULL
+        return status
+
+
+    def _read_register(self, register, count):
+        if register in self._addresses:
+            width = 1 if NRF24.RX_ADDR_P2 <= register <= NRF24.RX_ADDR_P5 else 5
+            return list(self._addresses[register][:width])
+
+        if register == NRF24.STATUS:
+            return [self._status()]
+        if register == NRF24.OBSERVE_TX:
+            return [(self._plos_cnt << 4) | self._arc_cnt]
+        if register == NRF24.RPD:
+            return [1 if self._listening and self._settled() and self.sim.is_busy(self._channel, self) else 0]
+        if register == NRF24.FIFO_STATUS:
+            value = 0
+            if len(self._tx_fifo) >= 3:
+                value |= NRF24.FTX_FULL
+            if not self._tx_fifo:
+                value |= NRF24.FTX_EMPTY
+            if len(self._rx_fifo) >= 3:
+                value |= NRF24.FRX_FULL
+            if not self._rx_fifo:
+                value |= NRF24.FRX_EMPTY
+            return [value]
+
+        return [self._registers[register]]
+
+
+    def _write_register(self, register, values):
+        if not values:
+            return
+
+        if register in self._addresses:
+            address = self._addresses[register]
+            for i, value in enumerate(values[:len(address)]):
+                address[i] = value
+            return
+
+        value = values[0] & 0xFF
+        if register == NRF24.STATUS:
+            # Interrupt flags are cleared by writing 1.
+            self._registers[NRF24.STATUS] &= ~(value & _IRQ_FLAGS) & 0xFF
+        elif register == NRF24.RF_CH:
+            self._registers[register] = value & 0x7F
+            self._plos_cnt = 0
+            self._set_channel(value & 0x7F)
+        elif register in (NRF24.OBSERVE_TX, NRF24.RPD, NRF24.FIFO_STATUS):
+            return
+        else:
+            self._registers[register] = value
+            if register in (NRF24.CONFIG, NRF24.SETUP_AW, NRF24.RF_SETUP):
+                self._configured()
+
+        self._update()
+
+
+    # Radio state.
+
+    def _set_channel(self, channel):
+        if channel != self._channel:
+            listening = self._listening
+            self._listen(False)
+            self._channel = channel
+            self._listen(listening)
+
+
+    def _listen(self, enable):
+        listeners = self.sim._listeners[self._channel]
+        if enable:
+            listeners[self] = None
+        else:
+            listeners.pop(self, None)
+        self._listening = enable
+
+
+    def _settled(self):
+        return self.sim.now + _EPSILON >= self._rx_since
+
+
+    def _interrupt(self, flags):
+        # The IRQ pin goes low (falling edge) when the first unmasked flag is set. The MASK_* bits of CONFIG are in the
+        # same positions as the flags in STATUS.
+        mask = ~self._registers[NRF24.CONFIG] & _IRQ_FLAGS
+        asserted = self._registers[NRF24.STATUS] & mask
+        self._registers[NRF24.STATUS] |= flags
+        if self.irq is not None and not asserted and flags & mask:
+            self.irq(self)
+
+
+    def get_state(self):
+        # Return the state of the radio as seen by the host: the registers, the addresses, CE, and the FIFO levels.
+        # Two radios in the same state behave the same, whatever SPI transactions brought them there.
+        registers = {f'{register:02x}': self._read_register(register, 1)[0]
+                     for register in range(NRF24.FEATURE + 1)
+                     if register not in self._addresses and register not in (NRF24.RPD, NRF24.OBSERVE_TX)
+                     and not (0x18 <= register <= 0x1B)}
+        width = self._width
+        addresses = {f'{register:02x}': bytes(value[:width if len(value) > 1 else 1]).hex()
+                     for register, value in self._addresses.items()}
+        return {'registers': registers, 'addresses': addresses, 'ce': int(self._ce), 'tx_fifo': len(self._tx_fifo),
+                'rx_fifo': len(self._rx_fifo)}
+
+
+    def _update(self):
+        # Called after anything that may change the mode of the radio.
+        if not self._powered():
+            if self._busy:
+                self._token += 1
+                self._busy = False
+                self._waiting = None
+            self._listen(False)
+            return
+
+        if self._busy:
+            return
+
+        receive = self._prim_rx() and self._ce
+        if receive and not self._listening:
+            self._rx_since = self.sim.now + T_SETTLE
+            self._listen(True)
+        elif not receive and self._listening:
+            self._listen(False)
+
+        if self._prim_rx() or not self._ce or not self._tx_fifo:
+            return
+        if self._registers[NRF24.STATUS] & NRF24.MAX_RT:
+            # Transmission is halted until MAX_RT is cleared.
+            return
+        if self._tx_fifo[0][0] is not None:
+            # An ACK payload left over from RX mode is not transmitted.
+            return
+
+        self._busy = True
+        self._arc_cnt = 0
+        self._pid = (self._pid + 1) & 0x03
+        self._token += 1
+        self.sim.schedule(T_SETTLE, self._start, self._token)
+
+
+    def _start(self, token):
+        if token != self._token:
+            return
+
+        _, payload, no_ack = self._tx_fifo[0]
+        packet = Packet(self, self._channel, self._rate, self._pipe_address_tx(), self._crc, self._pid, payload, no_ack)
+        self.sim._transmit(packet)
+        self.sim.schedule(packet.end - self.sim.now, self._sent, packet, token)
+
+
+    def _pipe_address_tx(self):
+        return bytes(self._addresses[NRF24.TX_ADDR][:self._width])
+
+
+    def _sent(self, packet, token):
+        if token != self._token:
+            return
+
+        if packet.no_ack or not (self._registers[NRF24.EN_AA] & NRF24.ENAA_P0):
+            self._done(NRF24.TX_DS)
+            return
+
+        # Listen for the acknowledgement on P0 until the retransmit delay has passed.
+        delay, _ = self._retransmission()
+        self._waiting = packet
+        self._deadline = packet.end + delay
+        self._rx_since = packet.end + T_SETTLE
+        self._listen(True)
+        self.sim.schedule(delay, self._timeout, token)
+
+
+    def _timeout(self, token):
+        if token != self._token:
+            return
+
+        self._waiting = None
+        self._listen(False)
+
+        _, retries = self._retransmission()
+        if self._arc_cnt < retries:
+            self._arc_cnt += 1
+            self._start(token)
+        else:
+            self._plos_cnt = min(self._plos_cnt + 1, 15)
+            self._busy = False
+            self._interrupt(NRF24.MAX_RT)
+            self._update()
+
+
+    def _acknowledged(self, ack, token):
+        if token != self._token:
+            return
+
+        flags = NRF24.TX_DS
+        if ack.payload and len(self._rx_fifo) < 3:
+            self._rx_fifo.append((0, ack.payload))
+            flags |= NRF24.RX_DR
+        self._done(flags)
+
+
+    def _done(self, flags):
+        self._tx_fifo.popleft()
+        self._waiting = None
+        self._busy = False
+        self._token += 1
+        self._interrupt(flags)
+        self._update()
+
+
+    def _receive(self, packet):
+        if packet.collided or packet.corrupted:
+            return
+        if packet.data_rate != self._rate or packet.crc_bytes != self._crc or len(packet.address) != self._width:
+            return
+
+        if packet.ack:
+            waiting = self._waiting
+            if waiting is not None and packet.pid == waiting.pid and packet.address == waiting.address and \
+                    packet.end <= self._deadline + _EPSILON and packet.start + _EPSILON >= self._rx_since:
+                self._waiting = None
+                self._token += 1
+                irq_delay = 6e-6 if waiting.data_rate == RF24_DATA_RATE.RATE_250KBPS else 8.2e-6
+                self.sim.schedule(irq_delay, self._acknowledged, packet, self._token)
+            return
+
+        if self._waiting is not None or not self._prim_rx() or packet.start + _EPSILON < self._rx_since:
+            return
+
+        en_rxaddr = self._registers[NRF24.EN_RXADDR]
+        for pipe in range(6):
+            if en_rxaddr & (1 << pipe) and self._pipe_address(pipe) == packet.address:
+                break
+        else:
+            return
+
+        if (self._registers[NRF24.DYNPD] & (1 << pipe)) and (self._registers[NRF24.FEATURE] & NRF24.EN_DPL):
+            payload = packet.payload
+        else:
+            width = self._registers[NRF24.RX_PW_P0 + pipe]
+            if width == 0:
+                return
+            payload = (packet.payload + bytes(width))[:width]
+
+        duplicate = self._last[pipe] == (packet.pid, packet.payload)
+        if not duplicate:
+            if len(self._rx_fifo) >= 3:
+                # No room, so the packet is neither stored nor acknowledged.
+                return
+            self._last[pipe] = (packet.pid, packet.payload)
+            self._rx_fifo.append((pipe, payload))
+            self._interrupt(NRF24.RX_DR)
+
+        if not packet.no_ack and self._registers[NRF24.EN_AA] & (1 << pipe):
+            self.sim.schedule(T_SETTLE, self._acknowledge, packet, pipe)
+
+
+    def _acknowledge(self, packet, pipe):
+        payload = b''
+        if self._registers[NRF24.FEATURE] & NRF24.EN_ACK_PAY:
+            for entry in self._tx_fifo:
+                if entry[0] == pipe:
+                    self._tx_fifo.remove(entry)
+                    payload = entry[1]
+                    break
+
+        self.sim._transmit(Packet(self, packet.channel, packet.data_rate, packet.address, packet.crc_bytes, packet.pid,
+                                  payload, ack=True))
+
+
+class SimulatedPi:
+    """
+    Stand-in for pigpio.pi connecting NRF24 instances to simulated radios. Add the radios with add_radio() before
+    creating the NRF24 instances. Every SPI transfer and GPIO write advances the virtual clock by overhead seconds
+    (the round trip to pigpiod), plus the time to clock the bytes at the SPI speed. Callbacks on the IRQ GPIO of a
+    radio are supported for the falling edge.
+    """
+
+    def __init__(self, sim, overhead=0.0001):
+        self.sim = sim
+        self._link = True
+        self._stopped = False
+        self._overhead = overhead
+        self._levels = {}
+        self._modes = {}
+        self._ce = {}                               # GPIO -> radios.
+        self._spi = {}                              # (aux, channel) -> radio.
+        self._handles = {}                          # handle -> (radio, baud).
+        self._next_handle = 0
+        self._callbacks = {}                        # GPIO -> callback functions.
+        self._pending = []                          # IRQ GPIOs with callbacks to call.
+        self._dispatching = False
+
+
+    def add_radio(self, radio=None, ce=25, spi_channel=0, aux=False, irq=None):
+        # Wire a radio to a CE GPIO, an SPI chip select, and optionally an IRQ GPIO. Returns the radio.
+        if radio is None:
+            radio = Radio(self.sim)
+        self._ce.setdefault(ce, []).append(radio)
+        self._spi[(aux, spi_channel)] = radio
+        if irq is not None:
+            radio.irq = lambda radio: self._pending.append(irq)
+        return radio
+
+
+    def callback(self, gpio, edge=0, func=None):
+        # Like pigpio, func is called with (gpio, level, tick) when the IRQ pin of a radio goes low. Callbacks are
+        # called after the SPI transfer, GPIO write or sleep() during which the interrupt happened, as pigpio calls
+        # them from a thread of its own.
+        callbacks = self._callbacks.setdefault(gpio, [])
+        callbacks.append(func)
+
+        class _Callback:
+            def cancel(self):
+                if func in callbacks:
+                    callbacks.remove(func)
+
+        return _Callback()
+
+
+    def sleep(self, seconds):
+        # Sleep in virtual time. Use in place of time.sleep() in code driving simulated radios.
+        self.sim.advance(seconds)
+        self._dispatch()
+
+
+    def _dispatch(self):
+        if self._dispatching:
+            return
+        self._dispatching = True
+        try:
+            while self._pending:
+                gpio = self._pending.pop(0)
+                tick = int(self.sim.now * 1000000) & 0xFFFFFFFF
+                for func in list(self._callbacks.get(gpio, ())):
+                    func(gpio, 0, tick)
+        finally:
+            self._dispatching = False
+
+
+    def _check(self):
+        # Raise ConnectionError while pigpiod is disconnected. When it is back, it has lost its state.
+        faults = self.sim.faults
+        if faults is None:
+            return
+
+        if faults.is_disconnected(self, self.sim.now):
+            self._link = False
+            raise ConnectionError('Connection to pigpiod lost.')
+
+        if not self._link:
+            self._link = True
+            self._handles.clear()
+            self._modes.clear()
+            for gpio, radios in self._ce.items():
+                self._levels[gpio] = 0
+                for radio in radios:
+                    radio.set_ce(False)
+
+
+    @property
+    def connected(self):
+        # Like pigpio.pi.connected, but also False while pigpiod is disconnected by faults.
+        if self._stopped:
+            return False
+        try:
+            self._check()
+        except ConnectionError:
+            return False
+        return True
+
+
+    def get_current_tick(self):
+        self._check()
+        return int(self.sim.now * 1000000) & 0xFFFFFFFF
+
+
+    def set_mode(self, gpio, mode):
+        self._modes[gpio] = mode
+
+
+    def get_mode(self, gpio):
+        return self._modes.get(gpio, 0)
+
+
+    def read(self, gpio):
+        return self._levels.get(gpio, 0)
+
+
+    def write(self, gpio, level):
+        self.sim.advance(self._overhead)
+        self._check()
+        self._levels[gpio] = 1 if level else 0
+        for radio in self._ce.get(gpio, ()):
+            radio.set_ce(level)
+        self._dispatch()
+
+
+    def spi_open(self, spi_channel, baud, spi_flags=0):
+        self._check()
+        radio = self._spi.get((bool(spi_flags & NRF24._AUX_SPI), spi_channel))
+        if radio is None:
+            raise ValueError(f'No simulated radio on SPI channel {spi_channel}.')
+        handle = self._next_handle
+        self._next_handle += 1
+        self._handles[handle] = (radio, baud)
+        return handle
+
+
+    def spi_close(self, handle):
+        del self._handles[handle]
+
+
+    def spi_xfer(self, handle, data):
+        data = list(data)
+        radio, baud = self._handles.get(handle, (None, 1000000))
+        self.sim.advance(self._overhead + len(data) * 8 / baud)
+        self._check()
+        if handle not in self._handles:
+            raise pigpio.error('Unknown SPI handle.')
+
+        out = radio.spi(data)
+        if self.sim.faults is not None:
+            out = self.sim.faults.spi_xfer(data, out)
+        self._dispatch()
+        return len(out), bytearray(out)
+
+
+    def stop(self):
+        self._stopped = True
+
+
+def _configure(radio, config, channel):
+    # Apply an AirtimeConfig to a radio the way NRF24 does, with dynamic payloads.
+    spi = radio.spi
+    config_reg = NRF24.PWR_UP
+    if config.crc_bytes != RF24_CRC.DISABLED:
+        config_reg |= NRF24.EN_CRC | (NRF24.CRCO if config.crc_bytes == RF24_CRC.BYTES_2 else 0)
+    rf_setup = 0x06 | {RF24_DATA_RATE.RATE_1MBPS: 0, RF24_DATA_RATE.RATE_2MBPS: NRF24.RF_DR_HIGH,
+                       RF24_DATA_RATE.RATE_250KBPS: NRF24.RF_DR_LOW}[config.data_rate]
+
+    spi([NRF24.W_REGISTER | NRF24.SETUP_AW, config.address_bytes - 2])
+    spi([NRF24.W_REGISTER | NRF24.SETUP_RETR, (config.delay << 4) | config.retries])
+    spi([NRF24.W_REGISTER | NRF24.RF_SETUP, rf_setup])
+    spi([NRF24.W_REGISTER | NRF24.RF_CH, channel])
+    spi([NRF24.W_REGISTER | NRF24.EN_AA, 0x3F if config.ack else 0])
+    spi([NRF24.W_REGISTER | NRF24.DYNPD, 0x3F])
+    spi([NRF24.W_REGISTER | NRF24.FEATURE, NRF24.EN_DPL | NRF24.EN_ACK_PAY | NRF24.EN_DYN_ACK])
+    spi([NRF24.W_REGISTER | NRF24.CONFIG, config_reg])
+
+
+def _address(address, width):
+    if isinstance(address, str):
+        address = address.encode('ascii')
+    address = bytes(address)
+    assert len(address) == width, f'Address must be {width} bytes.'
+    return list(address)
+
+
+class TrafficNode:
+    """
+    A node sending packets of length bytes to address, on average every interval seconds (Poisson arrivals, or
+    periodic with poisson=False). Packets queue up while the radio is busy. With csma=True the node listens before
+    talking like NRF24.set_csma(True) does.
+    """
+
+    def __init__(self, sim, address, interval=1.0, length=RF24_PAYLOAD.MAX, config=None, channel=76, poisson=True,
+                 csma=False, backoff=0.0005, max_backoff=0.016, attempts=5, queue_size=64):
+        self.sim = sim
+        self.index = len(sim._nodes)
+        sim._nodes.append(self)
+
+        self._config = config if config is not None else AirtimeConfig()
+        self._interval = interval
+        self._length = length
+        self._poisson = poisson
+        self._csma = csma
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._attempts = attempts
+        self._queue = collections.deque()
+        self._queue_size = queue_size
+        self._sending = None
+        self._counter = 0
+
+        self.dropped = 0
+        self.deferrals = 0
+
+        radio = self.radio = Radio(sim)
+        radio.irq = self._irq
+        _configure(radio, self._config, channel)
+        address = _address(address, self._config.address_bytes)
+        radio.spi([NRF24.W_REGISTER | NRF24.TX_ADDR] + address)
+        radio.spi([NRF24.W_REGISTER | NRF24.RX_ADDR_P0] + address)
+        radio.set_ce(True)
+
+        sim.schedule(sim.random.uniform(0, interval), self._arrival)
+
+
+    def _arrival(self):
+        sim = self.sim
+        sim.schedule(sim.random.expovariate(1 / self._interval) if self._poisson else self._interval, self._arrival)
+
+        if len(self._queue) >= self._queue_size:
+            self.dropped += 1
+            sim._record(self.index, sim.now, 0, False)
+            return
+
+        self._queue.append(sim.now)
+        if self._sending is None:
+            self._next()
+
+
+    def _next(self):
+        if not self._queue:
+            return
+        self._sending = self._queue.popleft()
+        if self._csma:
+            self._listen(self._backoff, 0)
+        else:
+            self._load()
+
+
+    def _listen(self, backoff, attempt):
+        # Sample the carrier after entering RX mode (170µs), and back off while the channel is busy.
+        def sample():
+            busy = self.sim.is_busy(self.radio.get_channel(), self.radio)
+            if not busy or attempt + 1 >= self._attempts:
+                self._load()
+                return
+            self.deferrals += 1
+            self.sim.schedule(self.sim.random.uniform(0, backoff), self._listen, min(backoff * 2, self._max_backoff),
+                              attempt + 1)
+
+        self.sim.schedule(0.000170, sample)
+
+
+    def _load(self):
+        self._counter += 1
+        payload = self._counter.to_bytes(4, 'little') + bytes(max(0, self._length - 4))
+        self.radio.spi([NRF24.W_TX_PAYLOAD] + list(payload[:max(self._length, 1)]))
+
+
+    def _irq(self, radio):
+        status = radio.spi([NRF24.NOP])[0]
+        if not status & (NRF24.TX_DS | NRF24.MAX_RT):
+            return
+
+        attempts = (radio.spi([NRF24.R_REGISTER | NRF24.OBSERVE_TX, 0])[1] & 0x0F) + 1
+        delivered = (status & NRF24.TX_DS) != 0
+        if not delivered:
+            radio.spi([NRF24.FLUSH_TX])
+        radio.spi([NRF24.W_REGISTER | NRF24.STATUS, _IRQ_FLAGS])
+
+        self.sim._record(self.index, self._sending, attempts, delivered)
+        self._sending = None
+        self._next()
+
+
+class SinkNode:
+    """
+    A receiving node (gateway) listening on address with pipe 1 (and optionally more addresses on pipes 2 to 5, which
+    must share all but the first byte with the first address). The RX FIFO is emptied service_time seconds after the
+    IRQ, modelling the time it takes the host to read it; packets arriving to a full RX FIFO are lost.
+    """
+
+    def __init__(self, sim, address, config=None, channel=76, service_time=0.0005, addresses=()):
+        self.sim = sim
+        self._config = config if config is not None else AirtimeConfig()
+        self._service_time = service_time
+        self._pending = False
+
+        self.received = 0
+        self.times = []
+
+        radio = self.radio = Radio(sim)
+        radio.irq = self._irq
+        _configure(radio, self._config, channel)
+        width = self._config.address_bytes
+        radio.spi([NRF24.W_REGISTER | NRF24.RX_ADDR_P1] + _address(address, width))
+        enable = 0x02
+        for i, extra in enumerate(addresses[:4]):
+            radio.spi([NRF24.W_REGISTER | (NRF24.RX_ADDR_P2 + i), _address(extra, width)[0]])
+            enable |= 1 << (i + 2)
+        radio.spi([NRF24.W_REGISTER | NRF24.EN_RXADDR, enable])
+        config_reg = radio.spi([NRF24.R_REGISTER | NRF24.CONFIG, 0])[1]
+        radio.spi([NRF24.W_REGISTER | NRF24.CONFIG, config_reg | NRF24.PRIM_RX])
+        radio.set_ce(True)
+
+
+    def _irq(self, radio):
+        if not self._pending:
+            self._pending = True
+            self.sim.schedule(self._service_time, self._drain)
+
+
+    def _drain(self):
+        radio = self.radio
+        self._pending = False
+        while radio.spi([NRF24.R_REGISTER | NRF24.FIFO_STATUS, 0])[1] & NRF24.FRX_EMPTY == 0:
+            width = radio.spi([NRF24.R_RX_PL_WID, 0])[1]
+            radio.spi([NRF24.R_RX_PAYLOAD] + [0] * width)
+            self.received += 1
+            self.times.append(self.sim.now)
+        radio.spi([NRF24.W_REGISTER | NRF24.STATUS, NRF24.RX_DR])
@@ -0,0 +1,155 @@
+import collections
+import struct
+import time
+
+import pigpio
+
+
+#
+# Supervision of the connection to pigpiod.
+#
+# NRF24 talks to the radio through pigpiod, usually over TCP. When the connection drops, or pigpiod is restarted, every
+# SPI transfer fails from then on: the socket is closed (OSError, or struct.error when pigpio reads an empty reply),
+# or the SPI handle is no longer known to pigpiod (pigpio.error).
+#
+# The Supervisor runs all radio operations for the application. When one fails because of the connection, it marks
+# the connection as lost and reconnects in the background of process(), with exponential backoff. Once connected it
+# calls NRF24.reconnect(), which sets the CE GPIO up, opens the SPI channel again and writes the configuration last
+# written back to the radio. Data queued with send() is kept while the connection is down, and sent when it is back.
+#
+# Example:
+#
+#   supervisor = Supervisor(nrf, connect=lambda: pigpio.pi(hostname, port))
+#   while True:
+#       for pipe, payload in supervisor.process():
+#           ...
+#       supervisor.send(b'...')
+#
+
+# Exceptions raised when the connection to pigpiod is lost.
+CONNECTION_ERRORS = (OSError, struct.error, pigpio.error)
+
+
+class Supervisor:
+    """
+    Runs an NRF24 over a pigpiod connection that may be lost. Call process() as often as possible; it sends queued
+    data, returns the payloads received as a list of (pipe, payload) tuples, and reconnects when needed. The connect
+    function must return a new pigpio.pi (or another pi, such as a SimulatedPi).
+    """
+
+    def __init__(self, nrf, connect, backoff=0.1, max_backoff=5.0, queue_size=64, callback=None):
+        assert 0 < backoff <= max_backoff
+        self._nrf = nrf
+        self._connect = connect
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._queue = collections.deque()
+        self._queue_size = queue_size
+        self._callback = callback                   # Called with True when connected, False when disconnected.
+
+        self._connected = True
+        self._delay = backoff
+        self._retry = 0.0
+
+        self._statistics = dict.fromkeys(('disconnects', 'attempts', 'reconnects', 'sent', 'lost', 'dropped'), 0)
+
+
+    def is_connected(self):
+        return self._connected
+
+
+    def send(self, data):
+        # Queue data to send. Returns False if the queue is full.
+        if len(self._queue) >= self._queue_size:
+            self._statistics['dropped'] += 1
+            return False
+        self._queue.append(bytes(data))
+        return True
+
+
+    def pending(self):
+        return len(self._queue)
+
+
+    def get_statistics(self):
+        return dict(self._statistics, queued=len(self._queue))
+
+
+    def call(self, method, *args):
+        # Call a method of the NRF24. Returns its result, or None if the connection was lost, in which case a
+        # reconnect is started.
+        if not self._connected:
+            return None
+        try:
+            return getattr(self._nrf, method)(*args)
+        except CONNECTION_ERRORS:
+            self._lost()
+            return None
+
+
+    def process(self):
+        if not self._connected:
+            if time.monotonic() < self._retry or not self._reconnect():
+                return []
+
+        try:
+            self._transmit()
+            return self._receive()
+        except CONNECTION_ERRORS:
+            self._lost()
+            return []
+
+
+    def _transmit(self):
+        nrf = self._nrf
+        while self._queue:
+            nrf.send(self._queue[0])
+            try:
+                nrf.wait_until_sent()
+                lost = nrf.get_packages_lost() != 0
+            except TimeoutError:
+                lost = True
+            if lost:
+                nrf.reset_packages_lost()
+                self._statistics['lost'] += 1
+            else:
+                self._statistics['sent'] += 1
+            # Only removed once the radio is done with it, so data is not lost with the connection.
+            self._queue.popleft()
+
+
+    def _receive(self):
+        nrf = self._nrf
+        received = []
+        while nrf.data_ready():
+            pipe = nrf.data_pipe()
+            received.append((pipe, bytes(nrf.get_payload())))
+        return received
+
+
+    def _lost(self):
+        self._connected = False
+        self._delay = self._backoff
+        self._retry = time.monotonic() + self._delay
+        self._statistics['disconnects'] += 1
+        if self._callback is not None:
+            self._callback(False)
+
+
+    def _reconnect(self):
+        self._statistics['attempts'] += 1
+        try:
+            pi = self._connect()
+            if pi is None or not pi.connected:
+                raise ConnectionError('Not connected to pigpiod.')
+            self._nrf.reconnect(pi)
+        except CONNECTION_ERRORS:
+            self._retry = time.monotonic() + self._delay
+            self._delay = min(self._delay * 2, self._max_backoff)
+            return False
+
+        self._connected = True
+        self._statistics['reconnects'] += 1
+        if self._callback is not None:
+            self._callback(True)
+        return True
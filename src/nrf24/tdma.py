@@ -0,0 +1,364 @@
+import random
+import struct
+
+import pigpio
+
+from .airtime import T_SETTLE, AirtimeConfig, attempt_time
+from .nrf24 import RF24_PAYLOAD, RF24_RX_ADDR
+
+
+#
+# Beacon based time division (TDMA) scheduling of node transmissions.
+#
+# The gateway divides time into superframes. Each superframe starts with a beacon, broadcast without acknowledgement,
+# which carries the slot map for the superframe: the node id owning each slot. Nodes synchronise to the beacon using
+# the pigpio tick, and only transmit in their own slots, so nodes never collide with each other. Slots not assigned
+# to any node are contention slots, used by nodes that are not yet known to the gateway.
+#
+# The gateway assigns slots in proportion to the recent traffic of each node, that is the frames received from it and
+# the backlog it reports. Every node gets at least one slot while there are enough slots. A number of slots (one by
+# default) is always left for contention, so new nodes can join a busy network.
+#
+# All nodes write to the gateway address, so a node keeps its P0 closed while listening for the beacon. Otherwise it
+# would acknowledge the frames of the other nodes, and the acknowledgements would collide with those of the gateway.
+# Before each frame a node lowers the auto retransmit count (ARC) if needed, so that the frame cannot overrun its slot
+# even when every retransmission fails.
+#
+# Slot i starts (i + 1) * slot_time after the beacon, leaving the first slot time for the beacon to be received. A
+# slot must be long enough for at least one attempt at a frame, plus the guard time at both ends. The default 4ms slot
+# leaves room for a full frame and 2 retransmissions at 1Mbps.
+#
+#   Beacon:  <BBHB protocol (0xA0), sequence, slot time in µs, slots> + node id of each slot
+#   Data:    <BBB  protocol (0xA1), node id, backlog> + data
+#
+
+BEACON = 0xA0
+DATA = 0xA1
+
+CONTENTION = 0xFF
+
+_BEACON = struct.Struct('<BBHB')
+_DATA = struct.Struct('<BBB')
+
+MAX_SLOTS = RF24_PAYLOAD.MAX - _BEACON.size
+MAX_DATA = RF24_PAYLOAD.MAX - _DATA.size
+
+# A beacon takes less than 2 ms on air at 250 kbps. If it has not gone out after this long the radio is stuck.
+BEACON_TIMEOUT_US = 10000
+
+
+def allocate(weights, slots):
+    # Assign slots to nodes in proportion to their weights, using the largest remainder method. Every node gets at
+    # least one slot if there are enough slots. Returns a list with the node id of each slot, the slots of each node
+    # spread as evenly as possible over the superframe. Unassigned slots are CONTENTION.
+    nodes = sorted(weights, key=lambda n: -weights[n])
+    counts = {}
+
+    if len(nodes) >= slots:
+        for node in nodes[:slots]:
+            counts[node] = 1
+    elif nodes:
+        for node in nodes:
+            counts[node] = 1
+        free = slots - len(nodes)
+        total = sum(weights[n] for n in nodes)
+        if total > 0:
+            shares = {n: free * weights[n] / total for n in nodes}
+            for node in nodes:
+                counts[node] += int(shares[node])
+            left = free - sum(int(s) for s in shares.values())
+            for node in sorted(nodes, key=lambda n: int(shares[n]) - shares[n])[:left]:
+                counts[node] += 1
+
+    # Spread the slots of each node: the k-th of n slots wants position (k + 0.5) / n of the superframe.
+    order = sorted(((k + 0.5) / count, node) for node, count in counts.items() for k in range(count))
+    schedule = [node for _, node in order]
+    return schedule + [CONTENTION] * (slots - len(schedule))
+
+
+class _Node:
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.frames = 0                             # Frames received in the current superframe.
+        self.backlog = 0                            # Last backlog reported.
+        self.load = 1.0                             # Average of frames + backlog per superframe.
+        self.received = 0
+
+
+class TdmaGateway:
+    """
+    Gateway side of the TDMA scheme. Call process() as often as possible; it sends a beacon at the start of each
+    superframe and returns the frames received from the nodes as a list of (node id, data) tuples.
+    """
+
+    def __init__(self, nrf, pi, address, beacon_address, slots=16, slot_time=0.004, pipe=RF24_RX_ADDR.P1,
+                 smoothing=0.5, contention=1):
+        assert 0 < slots <= MAX_SLOTS
+        assert 0 <= contention <= slots
+        assert 0 < slot_time < 0.065
+
+        self._nrf = nrf
+        self._pi = pi
+        self._slots = slots
+        self._slot_us = int(slot_time * 1000000)
+        self._smoothing = smoothing
+        self._contention = contention
+
+        self._nodes = {}
+        self._schedule = [CONTENTION] * slots
+        self._sequence = 0
+        self._beacon_tick = None
+        self._beacons = 0
+        self._missed = 0
+
+        nrf.set_dynamic_ack(True)
+        nrf.open_writing_pipe(beacon_address, RF24_PAYLOAD.DYNAMIC)
+        nrf.open_reading_pipe(pipe, address, RF24_PAYLOAD.DYNAMIC)
+
+
+    def add_node(self, node_id):
+        assert 0 <= node_id < CONTENTION
+        if node_id not in self._nodes:
+            self._nodes[node_id] = _Node(node_id)
+
+
+    def remove_node(self, node_id):
+        self._nodes.pop(node_id, None)
+
+
+    def get_nodes(self):
+        return list(self._nodes)
+
+
+    def get_schedule(self):
+        return list(self._schedule)
+
+
+    def get_superframe(self):
+        # Length of a superframe in seconds.
+        return (self._slots + 1) * self._slot_us / 1000000
+
+
+    def get_statistics(self, node_id=None):
+        if node_id is None:
+            return {'beacons': self._beacons, 'missed': self._missed, 'nodes': len(self._nodes),
+                    'contention': self._schedule.count(CONTENTION)}
+        node = self._nodes[node_id]
+        return {'slots': self._schedule.count(node_id), 'load': node.load, 'backlog': node.backlog,
+                'received': node.received}
+
+
+    def process(self):
+        received = self._receive()
+
+        if self._beacon_tick is None or pigpio.tickDiff(self._beacon_tick, self._pi.get_current_tick()) >= \
+                (self._slots + 1) * self._slot_us:
+            self._beacon()
+
+        return received
+
+
+    def _receive(self):
+        nrf = self._nrf
+        received = []
+
+        while nrf.data_ready():
+            frame = bytes(nrf.get_payload())
+            if len(frame) < _DATA.size or frame[0] != DATA:
+                continue
+
+            _, node_id, backlog = _DATA.unpack_from(frame)
+            node = self._nodes.get(node_id)
+            if node is None:
+                if not self._contention or node_id == CONTENTION:
+                    continue
+                node = self._nodes[node_id] = _Node(node_id)
+
+            node.frames += 1
+            node.received += 1
+            node.backlog = backlog
+            received.append((node_id, frame[_DATA.size:]))
+
+        return received
+
+
+    def _beacon(self):
+        # Update the load of each node from the superframe that ended, and allocate the slots of the next one.
+        a = self._smoothing
+        for node in self._nodes.values():
+            node.load = a * node.load + (1 - a) * (node.frames + node.backlog)
+            node.frames = 0
+
+        schedule = allocate({n.node_id: n.load for n in self._nodes.values()}, self._slots - self._contention)
+        self._schedule = schedule + [CONTENTION] * self._contention
+        self._sequence = (self._sequence + 1) & 0xFF
+
+        nrf = self._nrf
+        nrf.load_payload(_BEACON.pack(BEACON, self._sequence, self._slot_us, self._slots) + bytes(self._schedule),
+                         ack=False)
+        start = self._pi.get_current_tick()
+        while not nrf.is_tx_empty():
+            if pigpio.tickDiff(start, self._pi.get_current_tick()) > BEACON_TIMEOUT_US:
+                # The beacon did not go out. Drop it, and try again at the start of the next superframe.
+                nrf.flush_tx()
+                self._missed += 1
+                break
+        else:
+            self._beacons += 1
+
+        # The superframe is timed from the end of the beacon, as that is when the nodes receive it.
+        self._beacon_tick = self._pi.get_current_tick()
+        nrf.power_up_rx()
+
+
+class TdmaNode:
+    """
+    Node side of the TDMA scheme. Data is queued with queue(), and sent in the slots assigned to the node by the
+    latest beacon. Call process() as often as possible; the better the beacon tick, the smaller the guard time can be.
+    A node that is not in the slot map sends one frame in a random contention slot to make itself known. The
+    retransmission count set on the radio (see set_retransmission()) is an upper limit, lowered for frames sent close to
+    the end of a slot.
+    """
+
+    def __init__(self, nrf, pi, node_id, address, beacon_address, pipe=RF24_RX_ADDR.P1, guard=0.0005,
+                 queue_size=64):
+        assert 0 <= node_id < CONTENTION
+
+        self._nrf = nrf
+        self._pi = pi
+        self._node_id = node_id
+        self._guard_us = int(guard * 1000000)
+        self._queue = []
+        self._queue_size = queue_size
+
+        self._beacon_tick = None
+        self._slot_us = 0
+        self._slots = []                            # Slot numbers of this node in the current superframe.
+        self._superframe_us = 0
+        self._next = 0                              # Index into _slots of the next slot to use.
+
+        self._sent = 0
+        self._lost = 0
+        self._beacons = 0
+
+        nrf.open_writing_pipe(address, RF24_PAYLOAD.DYNAMIC)
+        nrf.open_reading_pipe(pipe, beacon_address, RF24_PAYLOAD.DYNAMIC)
+        nrf.close_reading_pipe(RF24_RX_ADDR.P0)
+
+        self._airtime = AirtimeConfig.from_nrf(nrf)
+        self._retries = self._airtime.retries       # ARC currently set.
+
+
+    def queue(self, data):
+        data = bytes(data)
+        if len(data) > MAX_DATA:
+            raise ValueError(f'Data too long ({len(data)} > {MAX_DATA} bytes).')
+        if len(self._queue) >= self._queue_size:
+            return False
+        self._queue.append(data)
+        return True
+
+
+    def pending(self):
+        return len(self._queue)
+
+
+    def is_synchronised(self):
+        # True while within the superframe of the last beacon received.
+        return self._beacon_tick is not None and \
+            pigpio.tickDiff(self._beacon_tick, self._pi.get_current_tick()) < self._superframe_us
+
+
+    def get_statistics(self):
+        return {'beacons': self._beacons, 'sent': self._sent, 'lost': self._lost, 'slots': len(self._slots)}
+
+
+    def process(self, tick=None):
+        # Check for a beacon and send queued data if one of our slots has started. The tick at which the beacon was
+        # received may be given, for example from a pigpio callback on the IRQ pin. Returns the number of frames sent.
+        self._listen(tick)
+
+        if not self._queue or not self.is_synchronised():
+            return 0
+
+        elapsed = pigpio.tickDiff(self._beacon_tick, self._pi.get_current_tick())
+        while self._next < len(self._slots):
+            slot = self._slots[self._next]
+            start = (slot + 1) * self._slot_us
+            if elapsed < start + self._guard_us:
+                return 0
+            if elapsed < start + self._slot_us - self._guard_us:
+                self._next += 1
+                return self._transmit(start + self._slot_us - self._guard_us)
+            # Slot missed.
+            self._next += 1
+
+        return 0
+
+
+    def _listen(self, tick):
+        nrf = self._nrf
+        while nrf.data_ready():
+            frame = bytes(nrf.get_payload())
+            if len(frame) < _BEACON.size or frame[0] != BEACON:
+                continue
+
+            _, _, slot_us, count = _BEACON.unpack_from(frame)
+            schedule = frame[_BEACON.size:_BEACON.size + count]
+
+            self._beacon_tick = tick if tick is not None else self._pi.get_current_tick()
+            self._slot_us = slot_us
+            self._superframe_us = (count + 1) * slot_us
+            self._slots = [i for i, n in enumerate(schedule) if n == self._node_id]
+            if not self._slots and self._queue:
+                contention = [i for i, n in enumerate(schedule) if n == CONTENTION]
+                if contention:
+                    self._slots = [random.choice(contention)]
+            self._next = 0
+            self._beacons += 1
+
+
+    def _retries_within(self, left, length):
+        # The largest ARC, up to the one configured, for which a frame of length bytes is sent or given up within
+        # left µs. Returns -1 if not even a single attempt fits.
+        config = self._airtime
+        attempts = int((left / 1000000 - T_SETTLE) / attempt_time(config, length))
+        return min(attempts - 1, config.retries)
+
+
+    def _transmit(self, end):
+        # Send queued frames until the slot ends (end is in µs after the beacon). P0 is only enabled meanwhile, to
+        # receive the acknowledgements of the gateway.
+        nrf = self._nrf
+        sent = 0
+
+        nrf.enable_reading_pipe(RF24_RX_ADDR.P0)
+        while self._queue:
+            frame = _DATA.pack(DATA, self._node_id, min(len(self._queue) - 1, 255)) + self._queue[0]
+            retries = self._retries_within(end - pigpio.tickDiff(self._beacon_tick, self._pi.get_current_tick()),
+                                           len(frame))
+            if retries < 0:
+                break
+            if retries != self._retries:
+                nrf.set_retransmission(self._airtime.delay, retries)
+                self._retries = retries
+
+            nrf.send(frame)
+            try:
+                nrf.wait_until_sent()
+            except TimeoutError:
+                self._lost += 1
+                break
+
+            if nrf.get_packages_lost() == 0:
+                self._queue.pop(0)
+                self._sent += 1
+                sent += 1
+            else:
+                nrf.reset_packages_lost()
+                self._lost += 1
+                break
+
+        nrf.close_reading_pipe(RF24_RX_ADDR.P0)
+        return sent
@@ -0,0 +1,445 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import runpy
+import sys
+import time
+
+import pigpio
+
+from .nrf24 import NRF24, RF24_CRC, RF24_DATA_RATE, RF24_PA, RF24_PAYLOAD, RF24_RX_ADDR
+from .simulator import Simulator, SimulatedPi, TrafficNode, SinkNode
+
+
+#
+# SPI trace recording, and a golden trace check of the NRF24 class.
+#
+# RecordingPi wraps a pigpio.pi (or a SimulatedPi) and records every GPIO mode change, GPIO write, and SPI transfer,
+# with the bytes sent and received. A transaction is a string:
+#
+#   m <gpio> <mode>                     set_mode()
+#   w <gpio> <level>                    write()
+#   o <channel> <baud> <flags> -> <h>   spi_open()
+#   c <handle>                          spi_close()
+#   x <handle> <out> -> <in>            spi_xfer(), bytes in hex
+#
+# The golden check runs a set of scenarios against simulated radios: each public method of NRF24, and each example
+# script in test/ (stopped after a few iterations of its main loop). For every scenario it records the transactions
+# and the state of the radios when done (registers, addresses, CE and FIFO levels, see Radio.get_state()). The
+# simulation is deterministic, so the same code gives the same trace.
+#
+# An optimisation of NRF24 (caching registers, batching transfers and so on) changes the trace, but must leave the
+# radios in the same state. The check reports the difference in the number of transactions for each scenario, and
+# fails if the state of any radio differs from the golden one, or if a public method of NRF24 has no scenario.
+#
+# Usage: python -m nrf24.trace record [--golden test/golden] [--scripts test]
+#        python -m nrf24.trace check  [--golden test/golden] [--scripts test] [-v]
+#
+
+METHODS = 'methods.json'
+SCRIPTS = 'scripts.json'
+
+# Iterations of the main loop (calls to time.sleep() from the script), and seconds of virtual time not spent sleeping,
+# after which a script is stopped.
+SCRIPT_SLEEPS = 2
+SCRIPT_TIME = 0.5
+
+# Virtual time to let the radios settle after a scenario, before their state is taken.
+SETTLE_TIME = 0.1
+
+_HOST = 'DUT01'
+_PEER = 'PEER1'
+_PI = object()                                  # Stands for the pigpio connection in the arguments of a scenario.
+
+
+class RecordingPi:
+    """
+    Wraps a pigpio.pi and records the GPIO and SPI transactions going through it. Everything else is passed on to
+    the wrapped instance.
+    """
+
+    def __init__(self, pi):
+        self._pi = pi
+        self.transactions = []
+
+
+    def __getattr__(self, name):
+        return getattr(self._pi, name)
+
+
+    def set_mode(self, gpio, mode):
+        result = self._pi.set_mode(gpio, mode)
+        self.transactions.append(f'm {gpio} {mode}')
+        return result
+
+
+    def write(self, gpio, level):
+        result = self._pi.write(gpio, level)
+        self.transactions.append(f'w {gpio} {level}')
+        return result
+
+
+    def spi_open(self, spi_channel, baud, spi_flags=0):
+        handle = self._pi.spi_open(spi_channel, baud, spi_flags)
+        self.transactions.append(f'o {spi_channel} {baud} {spi_flags} -> {handle}')
+        return handle
+
+
+    def spi_close(self, handle):
+        result = self._pi.spi_close(handle)
+        self.transactions.append(f'c {handle}')
+        return result
+
+
+    def spi_xfer(self, handle, data):
+        count, received = self._pi.spi_xfer(handle, data)
+        self.transactions.append(f'x {handle} {bytes(data).hex()} -> {bytes(received).hex()}')
+        return count, received
+
+
+    def clear(self):
+        self.transactions = []
+
+
+    def get_counts(self):
+        # The number of SPI transfers, GPIO writes, and bytes transferred over SPI.
+        xfers = [t for t in self.transactions if t[0] == 'x']
+        return {'spi': len(xfers), 'gpio': sum(1 for t in self.transactions if t[0] == 'w'),
+                'bytes': sum(len(t.split()[2]) // 2 for t in xfers)}
+
+
+def count(transactions):
+    # get_counts() for a list of recorded transactions.
+    recorder = RecordingPi(None)
+    recorder.transactions = transactions
+    return recorder.get_counts()
+
+
+class _Stop(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def _virtual_time(sim, sleep):
+    # Make time.sleep() and the monotonic clocks follow the virtual clock of the simulator.
+    saved = time.sleep, time.monotonic, time.monotonic_ns, time.perf_counter
+    time.sleep = sleep
+    time.monotonic = time.perf_counter = lambda: sim.now
+    time.monotonic_ns = lambda: int(sim.now * 1000000000)
+    try:
+        yield
+    finally:
+        time.sleep, time.monotonic, time.monotonic_ns, time.perf_counter = saved
+
+
+def _settle(sim, radios):
+    sim.advance(SETTLE_TIME)
+    return {name: radio.get_state() for name, radio in radios.items()}
+
+
+# Scenarios for the public methods of NRF24: name -> calls made after setting up. The host radio listens on _HOST
+# (pipe 1), where a peer sends it a packet every 10ms, and writes to _PEER, where another peer acknowledges. An argument
+# _PI is replaced by the pigpio connection.
+
+METHOD_SCENARIOS = {
+    'set_channel': [('set_channel', 90)],
+    'get_channel': [('get_channel',)],
+    'set_retransmission': [('set_retransmission', 2, 10)],
+    'get_retransmission': [('get_retransmission',)],
+    'set_payload_size': [('set_payload_size', 16), ('open_reading_pipe', RF24_RX_ADDR.P2, 'DUT02')],
+    'get_payload_size': [('get_payload_size',)],
+    'set_padding': [('set_padding', 0), ('set_payload_size', 16), ('send', b'pad')],
+    'set_address_bytes': [('set_address_bytes', 3)],
+    'get_address_bytes': [('get_address_bytes',)],
+    'disable_crc': [('disable_crc',)],
+    'enable_crc': [('disable_crc',), ('enable_crc',)],
+    'is_crc_enabled': [('is_crc_enabled',)],
+    'set_crc_bytes': [('set_crc_bytes', RF24_CRC.BYTES_1)],
+    'get_crc_bytes': [('get_crc_bytes',)],
+    'set_data_rate': [('set_data_rate', RF24_DATA_RATE.RATE_2MBPS)],
+    'get_data_rate': [('get_data_rate',)],
+    'set_pa_level': [('set_pa_level', RF24_PA.LOW)],
+    'get_pa_level': [('get_pa_level',)],
+    'get_spi_handle': [('get_spi_handle',)],
+    'get_spi_channel': [('get_spi_channel',)],
+    'show_registers': [('show_registers',)],
+    'send': [('send', b'hello')],
+    'set_csma': [('set_csma', True), ('send', b'hello'), ('wait_until_sent',)],
+    'get_csma_statistics': [('get_csma_statistics',)],
+    'reset_csma_statistics': [('reset_csma_statistics',)],
+    'is_carrier': [('is_carrier',)],
+    'load_payload': [('set_dynamic_ack', True), ('load_payload', b'one'), ('load_payload', b'two', False)],
+    'set_dynamic_ack': [('set_dynamic_ack', True)],
+    'set_auto_ack': [('set_auto_ack', False, RF24_RX_ADDR.P1)],
+    'get_auto_ack': [('set_auto_ack', False, RF24_RX_ADDR.P1), ('get_auto_ack', RF24_RX_ADDR.P1), ('get_auto_ack',)],
+    'is_tx_full': [('is_tx_full',)],
+    'is_tx_empty': [('is_tx_empty',)],
+    'get_fifo_status': [('send', b'hello'), ('get_fifo_status',)],
+    'get_retries': [('send', b'hello'), ('wait_until_sent',), ('get_retries',)],
+    'get_packages_lost': [('get_packages_lost',)],
+    'reset_packages_lost': [('reset_packages_lost',)],
+    'reset_plos': [('reset_plos',)],
+    'ack_payload': [('ack_payload', RF24_RX_ADDR.P1, b'ack')],
+    'make_address': [('make_address', 'ABC')],
+    'open_writing_pipe': [('open_writing_pipe', 'PEER2')],
+    'get_writing_address': [('get_writing_address',)],
+    'open_reading_pipe': [('open_reading_pipe', RF24_RX_ADDR.P2, 'DUT02', RF24_PAYLOAD.ACK)],
+    'open_reading_pipes': [('open_reading_pipes', {1: 'DUT01', 2: 'DUT02', 3: 'DUT03'})],
+    'close_reading_pipe': [('close_reading_pipe', RF24_RX_ADDR.P1)],
+    'enable_reading_pipe': [('close_reading_pipe', RF24_RX_ADDR.P0), ('enable_reading_pipe', RF24_RX_ADDR.P0)],
+    'close_all_reading_pipes': [('close_all_reading_pipes',)],
+    'reset_reading_pipes': [('reset_reading_pipes',)],
+    'get_reading_address': [('get_reading_address', RF24_RX_ADDR.P1)],
+    'data_ready_pipe': [('data_ready_pipe',)],
+    'data_pipe': [('data_pipe',)],
+    'data_ready': [('data_ready',)],
+    'wait_until_sent': [('send', b'hello'), ('wait_until_sent',)],
+    'exchange': [('open_writing_pipe', _PEER, RF24_PAYLOAD.ACK), ('exchange', b'ping')],
+    'is_sending': [('send', b'hello'), ('is_sending',)],
+    'get_payload': [('get_payload',)],
+    'get_status': [('get_status',)],
+    'power_up_tx': [('power_up_tx',)],
+    'power_up_rx': [('power_up_rx',)],
+    'power_down': [('power_down',)],
+    'set_ce': [('unset_ce',), ('set_ce',)],
+    'unset_ce': [('unset_ce',)],
+    'flush_rx': [('flush_rx',)],
+    'flush_tx': [('send', b'hello'), ('flush_tx',)],
+    'set_flight_recorder': [('set_flight_recorder', 16), ('send', b'hello'), ('wait_until_sent',)],
+    'get_flight_recorder': [('set_flight_recorder', 16), ('get_flight_recorder',)],
+    'dump_flight_recorder': [('set_flight_recorder', 16), ('send', b'hello'), ('dump_flight_recorder', os.devnull)],
+    'set_watchdog': [('set_watchdog', True, 0.02), ('data_ready',), ('get_payload',), ('get_status',)],
+    'check_radio': [('set_watchdog', True), ('check_radio',)],
+    'get_watchdog_statistics': [('set_watchdog', True), ('check_radio',), ('get_watchdog_statistics',)],
+    'reset_watchdog_statistics': [('set_watchdog', True), ('check_radio',), ('reset_watchdog_statistics',)],
+    'reconnect': [('set_channel', 90), ('reconnect', _PI)],
+}
+
+METHOD_SCENARIOS.update({name: [(name,)] for name in sorted(dir(NRF24)) if name.startswith('format_')})
+
+
+def uncovered():
+    # The public methods of NRF24 without a method scenario.
+    return sorted(name for name in dir(NRF24)
+                  if not name.startswith('_') and callable(getattr(NRF24, name)) and name not in METHOD_SCENARIOS)
+
+
+def run_method(steps):
+    # Run the calls of a method scenario. Returns the transactions and the state of the host radio.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim)
+    radio = pi.add_radio(irq=24)
+    TrafficNode(sim, _HOST, interval=0.01, length=8, poisson=False)
+    SinkNode(sim, _PEER)
+
+    recorder = RecordingPi(pi)
+    with _virtual_time(sim, pi.sleep), contextlib.redirect_stdout(io.StringIO()):
+        nrf = NRF24(recorder, ce=25, payload_size=RF24_PAYLOAD.DYNAMIC)
+        nrf.open_writing_pipe(_PEER)
+        nrf.open_reading_pipe(RF24_RX_ADDR.P1, _HOST)
+        pi.sleep(0.05)
+
+        recorder.clear()
+        for method, *args in steps:
+            getattr(nrf, method)(*(recorder if arg is _PI else arg for arg in args))
+
+    return recorder.transactions, _settle(sim, {'host': radio})
+
+
+class _ScriptPi(RecordingPi):
+    # A RecordingPi stopping the script when it has been busy (not sleeping) for too long.
+
+    def __init__(self, pi, session):
+        super().__init__(pi)
+        self._session = session
+
+
+    def spi_xfer(self, handle, data):
+        self._session.check()
+        return super().spi_xfer(handle, data)
+
+
+class _Session:
+
+    def __init__(self, sim, pi):
+        self.sim = sim
+        self.pi = pi
+        self.sleeps = 0
+        self.slept = 0.0
+        self.stopped = False
+
+
+    def stop(self):
+        # Raised once, as KeyboardInterrupt, so the script cleans up as it would on Ctrl-C.
+        if not self.stopped:
+            self.stopped = True
+            raise KeyboardInterrupt()
+
+
+    def check(self):
+        if self.sim.now - self.slept > SCRIPT_TIME:
+            self.stop()
+
+
+    def sleep(self, seconds):
+        # Calls from the script itself count as iterations of its main loop.
+        if sys._getframe(1).f_globals.get('__name__') == '__main__':
+            self.sleeps += 1
+            if self.sleeps > SCRIPT_SLEEPS:
+                self.stop()
+            self.slept += seconds
+        self.pi.sleep(seconds)
+
+
+def run_script(path):
+    # Run an example script against simulated radios: one on CE GPIO 25 and the main SPI CE0 with its IRQ on GPIO 24,
+    # and one on CE GPIO 12 and the aux SPI CE2. Returns the transactions and the state of the radios.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim)
+    radios = {'main': pi.add_radio(ce=25, spi_channel=0, irq=24), 'aux': pi.add_radio(ce=12, spi_channel=2, aux=True)}
+    session = _Session(sim, pi)
+    recorder = _ScriptPi(pi, session)
+
+    saved = pigpio.pi, sys.argv, random.getstate()
+    pigpio.pi = lambda *args, **kwargs: recorder
+    sys.argv = [os.path.basename(path)]
+    random.seed(1)
+    output = io.StringIO()
+    try:
+        with _virtual_time(sim, session.sleep), contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(output):
+            runpy.run_path(path, run_name='__main__')
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        pigpio.pi, sys.argv = saved[:2]
+        random.setstate(saved[2])
+
+    return recorder.transactions, _settle(sim, radios)
+
+
+def _scripts(directory):
+    # The example scripts of the directory. Unit tests (test_*.py) are run by pytest, not as scripts.
+    return sorted(name for name in os.listdir(directory) if name.endswith('.py') and not name.startswith('test_'))
+
+
+def run_all(scripts=None):
+    # Run all scenarios. Returns the results for the methods and for the scripts as dicts: name -> {'state',
+    # 'counts', 'transactions'}.
+    def result(transactions, state):
+        return {'state': state, 'counts': count(transactions), 'transactions': transactions}
+
+    methods = {name: result(*run_method(steps)) for name, steps in METHOD_SCENARIOS.items()}
+    results = {}
+    if scripts is not None:
+        for name in _scripts(scripts):
+            results[name] = result(*run_script(os.path.join(scripts, name)))
+    return methods, results
+
+
+def record(golden, scripts=None):
+    methods, results = run_all(scripts)
+    os.makedirs(golden, exist_ok=True)
+    for filename, scenarios in ((METHODS, methods), (SCRIPTS, results)):
+        with open(os.path.join(golden, filename), 'w') as f:
+            json.dump(scenarios, f, indent=1, sort_keys=True)
+            f.write('\n')
+    return len(methods) + len(results)
+
+
+def compare(golden, current):
+    # Compare the current results of a set of scenarios with the golden ones. Returns a list of (name, golden counts,
+    # current counts, problem) where problem is None when the state of the radios matches.
+    compared = []
+    for name in sorted(set(golden) | set(current)):
+        if name not in current:
+            compared.append((name, golden[name]['counts'], None, 'scenario missing'))
+        elif name not in golden:
+            compared.append((name, None, current[name]['counts'], 'no golden trace'))
+        else:
+            problem = None
+            for radio, state in golden[name]['state'].items():
+                now = current[name]['state'].get(radio)
+                if now != state:
+                    problem = f'state of {radio} radio differs: ' + _difference(state, now)
+                    break
+            compared.append((name, golden[name]['counts'], current[name]['counts'], problem))
+    return compared
+
+
+def _difference(expected, actual):
+    if actual is None:
+        return 'radio missing'
+    differences = []
+    for key in sorted(expected):
+        if isinstance(expected[key], dict):
+            for item in sorted(expected[key]):
+                if expected[key][item] != actual[key].get(item):
+                    differences.append(f'{key}[{item}] {expected[key][item]} != {actual[key].get(item)}')
+        elif expected[key] != actual.get(key):
+            differences.append(f'{key} {expected[key]} != {actual.get(key)}')
+    return ', '.join(differences)
+
+
+def check(golden, scripts=None, verbose=False, file=sys.stdout):
+    # Run the scenarios and compare them with the golden ones. Returns True if the state of all radios matches.
+    methods, results = run_all(scripts)
+    ok = True
+    totals = [0, 0]
+
+    for name in uncovered():
+        ok = False
+        print(f'methods/{name}: FAILED, no scenario', file=file)
+
+    for filename, current in ((METHODS, methods), (SCRIPTS, results)):
+        if filename == SCRIPTS and scripts is None:
+            continue
+        with open(os.path.join(golden, filename)) as f:
+            expected = json.load(f)
+
+        for name, before, after, problem in compare(expected, current):
+            if before is not None and after is not None:
+                totals[0] += before['spi'] + before['gpio']
+                totals[1] += after['spi'] + after['gpio']
+            if problem is not None:
+                ok = False
+                print(f'{filename[:-5]}/{name}: FAILED, {problem}', file=file)
+            elif verbose or before != after:
+                delta = (after['spi'] + after['gpio']) - (before['spi'] + before['gpio'])
+                print(f'{filename[:-5]}/{name}: {before["spi"]} -> {after["spi"]} SPI transfers, {before["gpio"]} -> '
+                      f'{after["gpio"]} GPIO writes, {before["bytes"]} -> {after["bytes"]} bytes ({delta:+d} '
+                      f'transactions)', file=file)
+
+    delta = totals[1] - totals[0]
+    percent = 100 * delta / totals[0] if totals[0] else 0.0
+    print(f'Total: {totals[0]} -> {totals[1]} transactions ({delta:+d}, {percent:+.1f}%), '
+          f'{"state OK" if ok else "STATE DIFFERS"}.', file=file)
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m nrf24.trace', description='Record or check golden SPI traces of NRF24.')
+    parser.add_argument('command', choices=['record', 'check'], help='Record new golden traces, or check against them.')
+    parser.add_argument('--golden', type=str, default=os.path.join('test', 'golden'), help='Directory of the golden traces.')
+    parser.add_argument('--scripts', type=str, default='test', help='Directory of the example scripts to run.')
+    parser.add_argument('--no-scripts', action='store_true', help='Only run the method scenarios.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Show every scenario, not only those that changed.')
+    args = parser.parse_args(argv)
+
+    scripts = None if args.no_scripts else args.scripts
+
+    try:
+        if args.command == 'record':
+            print(f'Recorded {record(args.golden, scripts)} scenarios in {args.golden}.')
+            return 0
+        return 0 if check(args.golden, scripts, args.verbose) else 1
+    except OSError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,337 @@
+from enum import IntEnum
+import random
+import struct
+import time
+import zlib
+
+from .nrf24 import NRF24, RF24_PAYLOAD, RF24_RX_ADDR
+
+
+#
+# Bulk transfer of buffers and files, for example configuration or firmware images.
+#
+# The buffer is split into chunks which are streamed through the TX FIFO without acknowledgement, so the sender never
+# waits for the receiver between chunks. The receiver tracks the chunks it has received in a bitmap. When all chunks
+# have been sent, the sender queries the receiver for the chunks it is missing and retransmits only those. This is
+# repeated until the receiver has every chunk and has verified the CRC32 of the whole buffer.
+#
+# The control frames (START and QUERY) are acknowledged, and the receiver returns its reports in the acknowledgement
+# payload, so the receiver never leaves RX mode. Both sides must use RF24_PAYLOAD.ACK for the pipes involved.
+#
+# A sender starts from a random transfer id, and the receiver takes a START as a new transfer when the transfer id,
+# size, number of chunks or CRC32 differ from the current one. A sender that is restarted in the middle of a transfer
+# therefore does not pick up the state of the old transfer.
+#
+#   Start:   <BBIHI protocol (0xB1), transfer, size, chunks, crc32>
+#   Data:    <BBH   protocol (0xB0), transfer, chunk> + data
+#   Query:   <BBBH  protocol (0xB2), transfer, query, base>
+#   Report:  <BBBBHH protocol (0xB3), transfer, query, state, missing, base> + bitmap of chunks from base
+#
+
+DATA = 0xB0
+START = 0xB1
+QUERY = 0xB2
+REPORT = 0xB3
+
+_START = struct.Struct('<BBIHI')
+_DATA = struct.Struct('<BBH')
+_QUERY = struct.Struct('<BBBH')
+_REPORT = struct.Struct('<BBBBHH')
+
+CHUNK_SIZE = RF24_PAYLOAD.MAX - _DATA.size
+BITMAP_CHUNKS = (RF24_PAYLOAD.MAX - _REPORT.size) * 8
+
+NONE = 0xFFFF
+
+
+class TRANSFER_STATE(IntEnum):
+    RECEIVING = 0
+    COMPLETE = 1
+    CHECKSUM_ERROR = 2
+    UNKNOWN = 3
+
+
+class TransferError(Exception):
+    pass
+
+
+class BulkSender:
+    """
+    Sending side of a bulk transfer. send() blocks until the receiver has verified the whole buffer, or raises
+    TransferError, or TimeoutError if the radio stops sending. The NRF24 is left in RX mode when done.
+    """
+
+    def __init__(self, nrf, address, attempts=20, timeout=1.0):
+        self._nrf = nrf
+        self._attempts = attempts
+        self._timeout = timeout
+        self._transfer = random.randrange(256)
+        self._query = random.randrange(256)
+
+        nrf.set_dynamic_ack(True)
+        nrf.open_writing_pipe(address, RF24_PAYLOAD.ACK)
+
+
+    def send_file(self, path, progress=None):
+        with open(path, 'rb') as f:
+            return self.send(f.read(), progress)
+
+
+    def send(self, data, progress=None):
+        # Send the buffer and return a dict with statistics. The progress callback, if given, is called with the
+        # number of chunks confirmed, the total number of chunks, and the throughput in bytes per second so far.
+        data = bytes(data)
+        chunks = -(-len(data) // CHUNK_SIZE)
+        if chunks >= NONE:
+            raise ValueError(f'Buffer too large ({len(data)} bytes).')
+
+        self._transfer = (self._transfer + 1) & 0xFF
+        start = time.monotonic()
+
+        if not self._control(_START.pack(START, self._transfer, len(data), chunks, zlib.crc32(data))):
+            raise TransferError('Receiver did not acknowledge start of transfer.')
+
+        missing = list(range(chunks))
+        sent = 0
+        rounds = 0
+
+        while True:
+            rounds += 1
+            if rounds > self._attempts:
+                raise TransferError(f'Transfer incomplete after {self._attempts} rounds.')
+
+            self._stream(data, missing)
+            sent += len(missing)
+
+            state, missing = self._missing(chunks)
+            if state == TRANSFER_STATE.COMPLETE:
+                break
+            if state == TRANSFER_STATE.CHECKSUM_ERROR:
+                raise TransferError('Receiver reported a checksum error.')
+            if state == TRANSFER_STATE.UNKNOWN:
+                raise TransferError('Receiver does not know the transfer.')
+
+            if progress is not None:
+                elapsed = time.monotonic() - start
+                progress(chunks - len(missing), chunks, (chunks - len(missing)) * CHUNK_SIZE / elapsed if elapsed else 0)
+
+        elapsed = time.monotonic() - start
+        if progress is not None:
+            progress(chunks, chunks, len(data) / elapsed if elapsed else 0)
+
+        self._nrf.power_up_rx()
+        return {'bytes': len(data), 'chunks': chunks, 'sent': sent, 'retransmitted': sent - chunks, 'rounds': rounds,
+                'seconds': elapsed, 'throughput': len(data) / elapsed if elapsed else 0}
+
+
+    def _stream(self, data, chunks):
+        # Load the chunks into the TX FIFO as fast as it accepts them.
+        nrf = self._nrf
+        header = _DATA.pack
+        transfer = self._transfer
+
+        for chunk in chunks:
+            frame = header(DATA, transfer, chunk) + data[chunk * CHUNK_SIZE:(chunk + 1) * CHUNK_SIZE]
+            self._wait_for_fifo(empty=False)
+            nrf.load_payload(frame, ack=False)
+
+        self._wait_for_fifo(empty=True)
+
+
+    def _wait_for_fifo(self, empty):
+        # Wait until the TX FIFO has room for another chunk, or until it is empty. MAX_RT, left by an acknowledged
+        # frame, halts the radio: it is cleared and the chunks in the TX FIFO are dropped, to be reported missing by
+        # the receiver. Raises TimeoutError if the radio sends nothing within the timeout, for example after a
+        # brown-out.
+        nrf = self._nrf
+        start = time.monotonic()
+        while True:
+            status = nrf.get_status()
+            if status & NRF24.MAX_RT:
+                nrf.flush_tx()
+                nrf.power_up_rx()
+                return
+            if nrf.is_tx_empty() if empty else not status & NRF24.TX_FULL:
+                return
+            if time.monotonic() - start > self._timeout:
+                nrf.flush_tx()
+                nrf.power_up_rx()
+                raise TimeoutError('Timed out waiting for the TX FIFO.')
+            # A chunk takes at least 200µs on air at 2Mbps.
+            time.sleep(0.0001)
+
+
+    def _missing(self, chunks):
+        # Ask the receiver for the chunks it is missing. Returns the state of the receiver and the missing chunks.
+        missing = []
+        base = 0
+        while True:
+            report = self._report(base)
+            if report is None:
+                raise TransferError('Receiver did not answer query.')
+
+            state, count, base, bitmap = report
+            if state != TRANSFER_STATE.RECEIVING or base == NONE:
+                return state, missing
+
+            for i in range(min(BITMAP_CHUNKS, chunks - base)):
+                if bitmap[i >> 3] & (1 << (i & 7)):
+                    missing.append(base + i)
+
+            base += BITMAP_CHUNKS
+            if base >= chunks or len(missing) >= count:
+                return state, missing
+
+
+    def _report(self, base):
+        # The first query makes the receiver stage its report, which is returned with the acknowledgement of the
+        # following query.
+        self._query = (self._query + 1) & 0xFF
+        frame = _QUERY.pack(QUERY, self._transfer, self._query, base)
+
+        for _ in range(self._attempts):
+            ack = self._exchange(frame)
+            if ack and len(ack) >= _REPORT.size and ack[0] == REPORT:
+                _, transfer, query, state, count, report_base = _REPORT.unpack_from(ack)
+                if transfer == self._transfer and query == self._query:
+                    return state, count, report_base, ack[_REPORT.size:]
+        return None
+
+
+    def _control(self, frame):
+        for _ in range(self._attempts):
+            if self._exchange(frame) is not None:
+                return True
+        return False
+
+
+    def _exchange(self, frame):
+        try:
+            ack = self._nrf.exchange(frame)
+        except TimeoutError:
+            return None
+        return bytes(ack) if ack is not None else None
+
+
+class BulkReceiver:
+    """
+    Receiving side of a bulk transfer. Call process() regularly; it returns True when a transfer has been completed
+    and verified, after which get_data() returns the buffer.
+    """
+
+    def __init__(self, nrf, address, pipe=RF24_RX_ADDR.P1):
+        self._nrf = nrf
+        self._pipe = pipe
+
+        self._transfer = None
+        self._size = 0
+        self._chunks = 0
+        self._crc = 0
+        self._buffer = None
+        self._bitmap = None
+        self._missing = 0
+        self._state = TRANSFER_STATE.UNKNOWN
+        self._started = None
+
+        nrf.open_reading_pipe(pipe, address, RF24_PAYLOAD.ACK)
+
+
+    def get_state(self):
+        return self._state
+
+
+    def get_progress(self):
+        # Return the number of chunks received and the total number of chunks.
+        return self._chunks - self._missing, self._chunks
+
+
+    def get_data(self):
+        # Return the buffer received once the transfer is complete, otherwise None.
+        return bytes(self._buffer) if self._state == TRANSFER_STATE.COMPLETE else None
+
+
+    def process(self):
+        # Handle received frames. Returns True when a transfer has completed.
+        nrf = self._nrf
+        completed = False
+
+        while nrf.data_ready():
+            frame = bytes(nrf.get_payload())
+            if len(frame) < 2:
+                continue
+
+            protocol = frame[0]
+            if protocol == DATA and frame[1] == self._transfer and len(frame) >= _DATA.size:
+                self._data(frame)
+            elif protocol == START and len(frame) == _START.size:
+                self._start(frame)
+            elif protocol == QUERY and len(frame) == _QUERY.size:
+                completed |= self._verify()
+                self._report(frame)
+
+        return completed
+
+
+    def _start(self, frame):
+        _, transfer, size, chunks, crc = _START.unpack(frame)
+        if (transfer, size, chunks, crc) == (self._transfer, self._size, self._chunks, self._crc):
+            # Retransmitted start of the current transfer.
+            return
+
+        self._transfer = transfer
+        self._size = size
+        self._chunks = chunks
+        self._crc = crc
+        self._buffer = bytearray(size)
+        self._bitmap = bytearray(b'\xff' * (chunks >> 3) + (bytes([(1 << (chunks & 7)) - 1]) if chunks & 7 else b''))
+        self._missing = chunks
+        self._state = TRANSFER_STATE.RECEIVING
+        self._started = time.monotonic()
+
+
+    def _data(self, frame):
+        _, _, chunk = _DATA.unpack_from(frame)
+        if chunk >= self._chunks:
+            return
+
+        mask = 1 << (chunk & 7)
+        if self._bitmap[chunk >> 3] & mask:
+            offset = chunk * CHUNK_SIZE
+            self._buffer[offset:offset + len(frame) - _DATA.size] = frame[_DATA.size:]
+            self._bitmap[chunk >> 3] &= ~mask & 0xFF
+            self._missing -= 1
+
+
+    def _verify(self):
+        if self._state != TRANSFER_STATE.RECEIVING or self._missing:
+            return False
+
+        if zlib.crc32(self._buffer) == self._crc:
+            self._state = TRANSFER_STATE.COMPLETE
+        else:
+            self._state = TRANSFER_STATE.CHECKSUM_ERROR
+        return True
+
+
+    def _report(self, frame):
+        _, transfer, query, base = _QUERY.unpack(frame)
+        if transfer != self._transfer:
+            state = TRANSFER_STATE.UNKNOWN
+        else:
+            state = self._state
+
+        # Report from the first missing chunk at or after the base asked for.
+        bitmap = b''
+        report_base = NONE
+        if state == TRANSFER_STATE.RECEIVING:
+            for i in range(base >> 3, len(self._bitmap)):
+                if self._bitmap[i]:
+                    report_base = i << 3
+                    start = report_base >> 3
+                    bitmap = bytes(self._bitmap[start:start + BITMAP_CHUNKS // 8])
+                    break
+
+        # Replace any stale report with the new one.
+        self._nrf.flush_tx()
+        report = _REPORT.pack(REPORT, transfer, query, state, min(self._missing, 0xFFFF), report_base)
+        self._nrf.ack_payload(self._pipe, report + bitmap)
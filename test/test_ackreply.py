@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from nrf24 import NRF24, RF24_PAYLOAD, RF24_RX_ADDR
+from nrf24.ackreply import MAX_BODY, AckReplyClient, AckReplyServer
+from nrf24.faults import Faults
+from nrf24.rpc import RPC_STATUS
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+def _link(monkeypatch, handler):
+    # A client and a server on one simulated pigpio connection, in virtual time. The server is polled whenever the
+    # client sleeps.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    faults = Faults(seed=2)
+    sim.set_faults(faults)
+    radios = [pi.add_radio(ce=25, spi_channel=0), pi.add_radio(ce=22, spi_channel=1)]
+
+    server = AckReplyServer(NRF24(pi, 25, 0, payload_size=RF24_PAYLOAD.ACK, spi_speed=8e6), handler)
+    server.open_reading_pipe(RF24_RX_ADDR.P1, 'SERVR')
+    client = AckReplyClient(NRF24(pi, 22, 1, payload_size=RF24_PAYLOAD.ACK, spi_speed=8e6), 'SERVR')
+
+    def sleep(seconds):
+        pi.sleep(seconds)
+        server.poll()
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return faults, radios, server, client
+
+
+def test_replies(monkeypatch):
+    # The reply to a request comes with the acknowledgement of the next frame.
+    _, _, server, client = _link(monkeypatch, lambda pipe, body: body.upper())
+
+    assert client.request(b'abc') == (0, None)
+    assert client.request(b'def') == (1, (0, RPC_STATUS.OK, b'ABC'))
+    assert client.fetch() == (1, RPC_STATUS.OK, b'DEF')
+    assert server.get_statistics() == {'handled': 2, 'replayed': 0, 'errors': 0}
+
+
+def test_retransmitted_request(monkeypatch):
+    # The acknowledgements of a request are lost, so the client retries it. The server answers the retry with the
+    # reply it made the first time, without calling the handler again.
+    calls = []
+
+    def handler(pipe, body):
+        calls.append(body)
+        return bytes([len(calls)])
+
+    faults, radios, server, client = _link(monkeypatch, handler)
+    faults.set_link(radios[0], radios[1], ack_loss=1.0, symmetric=False)
+    with pytest.raises(ConnectionError):
+        client.request(b'abc')
+    faults.set_link(radios[0], radios[1], symmetric=False)
+
+    assert client.request(b'abc')[0] == 0
+    assert client.fetch() == (0, RPC_STATUS.OK, b'\x01')
+    assert calls == [b'abc']
+    assert server.get_statistics()['replayed'] == 1
+
+    # A new request with the same body is a new request.
+    assert client.request(b'abc')[0] == 1
+    assert client.fetch() == (1, RPC_STATUS.OK, b'\x02')
+
+
+def test_error_status(monkeypatch):
+    # A reply that does not fit, and a handler that raises, are answered with an error status. Requests received
+    # after them in the same poll are still handled.
+    def handler(pipe, body):
+        if body == b'long':
+            return bytes(MAX_BODY + 1)
+        if body == b'raise':
+            raise RuntimeError(body)
+        return body
+
+    _, _, server, client = _link(monkeypatch, handler)
+    replies = [client.request(body)[1] for body in (b'long', b'raise', b'ok')] + [client.fetch()]
+
+    assert replies == [None, (0, RPC_STATUS.ERROR, b''), (1, RPC_STATUS.ERROR, b''), (2, RPC_STATUS.OK, b'ok')]
+    assert server.get_statistics() == {'handled': 3, 'replayed': 0, 'errors': 2}
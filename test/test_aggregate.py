@@ -0,0 +1,65 @@
+import struct
+import time
+
+import pytest
+
+from nrf24 import NRF24, RF24_PAYLOAD
+from nrf24.aggregate import Coalescer, unpack
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+def _link(monkeypatch, payload_size):
+    # A sender and a receiver on one simulated pigpio connection, in virtual time.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'sleep', pi.sleep)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    pi.add_radio(ce=25, spi_channel=0)
+    pi.add_radio(ce=22, spi_channel=1)
+    sender = NRF24(pi, 25, 0, payload_size=payload_size, spi_speed=8e6)
+    receiver = NRF24(pi, 22, 1, payload_size=payload_size, spi_speed=8e6)
+    sender.open_writing_pipe('AGGR1')
+    receiver.open_reading_pipe(1, 'AGGR1')
+    return sender, receiver
+
+
+@pytest.mark.parametrize('payload_size', [RF24_PAYLOAD.MAX, 20, RF24_PAYLOAD.DYNAMIC])
+def test_round_trip(monkeypatch, payload_size):
+    sender, receiver = _link(monkeypatch, payload_size)
+    coalescer = Coalescer(sender)
+
+    # Readings like those of simple-sender.py, and records of other lengths, including an empty one.
+    records = [struct.pack('<Bff', 1, i, i / 2) for i in range(10)] + [b'', b'x', bytes(range(12))]
+    payloads = []
+
+    def receive():
+        # The RX FIFO holds 3 frames, so it is emptied after every record.
+        while receiver.data_ready():
+            payloads.append(bytes(receiver.get_payload()))
+
+    for record in records:
+        coalescer.send(record)
+        receive()
+    coalescer.flush()
+    receive()
+
+    if payload_size == RF24_PAYLOAD.DYNAMIC:
+        assert all(len(payload) <= RF24_PAYLOAD.MAX for payload in payloads)
+    else:
+        assert all(len(payload) == payload_size for payload in payloads)
+    assert [record for payload in payloads for record in unpack(payload)] == records
+    assert len(payloads) == coalescer.get_statistics()['frames']
+    assert len(payloads) < len(records)
+
+
+def test_padding_is_not_a_record():
+    # An aggregated frame padded with spaces up to a fixed payload size.
+    payload = bytes([0xC0, 2, 1, 0x41, 2, 0x42, 0x43]) + b' ' * 25
+    assert list(unpack(payload)) == [b'A', b'BC']
+
+
+def test_record_too_long(monkeypatch):
+    sender, _ = _link(monkeypatch, 20)
+    with pytest.raises(ValueError):
+        Coalescer(sender).send(bytes(18))
@@ -0,0 +1,51 @@
+import pytest
+
+from nrf24 import NRF24, RF24_DATA_RATE, RF24_RX_ADDR
+from nrf24.airtime import T_SETTLE, AirtimeConfig, ack_time, exchange_time, packet_time
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+RATES = [RF24_DATA_RATE.RATE_250KBPS, RF24_DATA_RATE.RATE_1MBPS, RF24_DATA_RATE.RATE_2MBPS]
+
+
+def _turnaround(data_rate, ack_length):
+    # Time from the end of a packet until the end of its acknowledgement, which the ARD must cover.
+    return T_SETTLE + ack_time(AirtimeConfig(data_rate), ack_length)
+
+
+@pytest.mark.parametrize('data_rate, expected', list(zip(RATES, [1316e-6, 329e-6, 164.5e-6])))
+def test_packet_time(data_rate, expected):
+    # Time on air of a 32 byte payload with a 5 byte address and a 2 byte CRC: (8 * (1 + 5 + 32 + 2) + 9) bits.
+    assert packet_time(AirtimeConfig(data_rate)) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('data_rate, tirq', list(zip(RATES, [6.0e-6, 8.2e-6, 8.2e-6])))
+def test_exchange_time(data_rate, tirq):
+    # Tesb = 2 * Tstby2a + Toa + Toa_ack + Tirq, without the time to upload the payload.
+    config = AirtimeConfig(data_rate)
+    assert exchange_time(config) == pytest.approx(2 * 130e-6 + packet_time(config) + ack_time(config) + tirq)
+
+
+def test_retransmit_delay_minimums():
+    # Product specification, 7.4.2: the ARD has to be 500µs or more at 250kbps, at 1Mbps when the acknowledgement
+    # payload is larger than 5 bytes, and at 2Mbps when it is larger than 15 bytes.
+    assert 250e-6 < _turnaround(RF24_DATA_RATE.RATE_250KBPS, 0) <= 500e-6
+    assert _turnaround(RF24_DATA_RATE.RATE_1MBPS, 5) <= 250e-6 < _turnaround(RF24_DATA_RATE.RATE_1MBPS, 6)
+    assert _turnaround(RF24_DATA_RATE.RATE_2MBPS, 15) <= 250e-6 < _turnaround(RF24_DATA_RATE.RATE_2MBPS, 32)
+    assert _turnaround(RF24_DATA_RATE.RATE_1MBPS, 32) <= 500e-6
+    assert _turnaround(RF24_DATA_RATE.RATE_2MBPS, 32) <= 500e-6
+
+
+def test_from_nrf():
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim)
+    pi.add_radio(ce=25, spi_channel=0)
+    nrf = NRF24(pi, 25, 0, data_rate=RF24_DATA_RATE.RATE_250KBPS)
+    nrf.set_retransmission(3, 5)
+    nrf.open_writing_pipe('AIRTM')
+
+    config = AirtimeConfig.from_nrf(nrf)
+    assert (config.data_rate, config.delay, config.retries, config.ack) == (RF24_DATA_RATE.RATE_250KBPS, 3, 5, True)
+
+    nrf.set_auto_ack(False, RF24_RX_ADDR.P0)
+    assert not AirtimeConfig.from_nrf(nrf).ack
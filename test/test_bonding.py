@@ -0,0 +1,79 @@
+import time
+
+from nrf24 import NRF24, RF24_PAYLOAD
+from nrf24.bonding import BondedReceiver
+from nrf24.pool import NRF24Pool
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+CHANNELS = [10, 20]
+
+
+def _bonded(monkeypatch):
+    # A receiver bonding two radios with their IRQ pins wired, and a sender, on one simulated pigpio connection in
+    # virtual time.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'sleep', pi.sleep)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    pi.add_radio(ce=25, spi_channel=0, irq=5)
+    pi.add_radio(ce=22, spi_channel=1, irq=6)
+    pi.add_radio(ce=12, spi_channel=0, aux=True)
+
+    pool = NRF24Pool(pi)
+    for ce, channel in [(25, 0), (22, 1)]:
+        pool.add_radio(ce, channel, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+    receiver = BondedReceiver(pool, 'BOND1', CHANNELS, irq=[5, 6], latency=0.001)
+
+    sender = NRF24(pi, 12, 2, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+    sender.open_writing_pipe('BOND1')
+    return pi, pool, receiver, sender
+
+
+def _send(pi, sender, channel, payload):
+    sender.set_channel(channel)
+    sender.send(payload)
+    sender.wait_until_sent()
+    assert sender.get_packages_lost() == 0
+    pi.sleep(0.0005)
+
+
+def test_tick_order(monkeypatch):
+    # Both radios are read in the same pass, the radio on channel 10 first, but the packet on channel 20 arrived first
+    # and is returned first.
+    pi, _, receiver, sender = _bonded(monkeypatch)
+
+    _send(pi, sender, 20, b'first')
+    _send(pi, sender, 10, b'second')
+    pi.sleep(0.002)
+    received = receiver.process()
+
+    assert [(channel, payload) for _, channel, payload in received] == [(20, b'first'), (10, b'second')]
+    assert received[0][0] < received[1][0]
+    assert receiver.get_statistics()['late'] == 0
+
+
+def test_late(monkeypatch):
+    # The radio on channel 10 is sending while a later packet on channel 20 is returned, so its own packet is read,
+    # and returned, out of order.
+    pi, pool, receiver, sender = _bonded(monkeypatch)
+    _send(pi, sender, 10, b'early')
+
+    busy = pool.get_radio(0)
+    busy.set_retransmission(15, 15)
+    busy.open_writing_pipe('NOONE')
+    pool.send(b'down', radio=0)
+    assert receiver.process() == []
+
+    _send(pi, sender, 20, b'later')
+    pi.sleep(0.002)
+    assert [payload for _, _, payload in receiver.process()] == [b'later']
+
+    pi.sleep(0.1)
+    assert [payload for _, _, payload in receiver.process()] == [b'early']
+
+    statistics = receiver.get_statistics()
+    assert statistics['late'] == 1
+    assert statistics['channels'][10]['received'] == statistics['channels'][20]['received'] == 1
+    assert pool.get_statistics(0)['lost'] == 1
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from nrf24 import RF24_PAYLOAD
+from nrf24.codec import SeriesDecoder, SeriesEncoder
+
+
+SCALES = (100, 10, 1)
+
+
+def _readings(count):
+    # Slowly changing temperature and humidity, and a counter with the occasional large jump.
+    rng = random.Random(1)
+    readings = []
+    temperature, humidity, counter = 21.5, 45.0, 0
+    for _ in range(count):
+        temperature = round(temperature + rng.uniform(-0.3, 0.3), 2)
+        humidity = round(humidity + rng.uniform(-1, 1), 1)
+        counter += rng.choice([1, 1, 1, -5, 100000])
+        readings.append((temperature, humidity, counter))
+    return readings
+
+
+def test_round_trip():
+    encoder = SeriesEncoder(SCALES, stream=7)
+    decoder = SeriesDecoder(SCALES)
+    readings = _readings(100)
+
+    decoded = []
+    while len(decoded) < len(readings):
+        frame, count = encoder.encode_frame(readings[len(decoded):])
+        assert count > 0 and len(frame) <= RF24_PAYLOAD.MAX
+        stream, values = decoder.decode_frame(frame)
+        assert stream == 7 and len(values) == count
+        decoded += values
+
+    assert decoded == pytest.approx(readings)
+
+
+def test_padded_frame():
+    # Padding after the last reading, as added to fixed size payloads, is ignored.
+    frame, count = SeriesEncoder(SCALES).encode_frame(_readings(3))
+    assert SeriesDecoder(SCALES).decode_frame(frame + b' ' * (RF24_PAYLOAD.MAX - len(frame))) == \
+        SeriesDecoder(SCALES).decode_frame(frame)
+
+
+def test_truncated_frame():
+    frame, count = SeriesEncoder(SCALES).encode_frame(_readings(20))
+    decoder = SeriesDecoder(SCALES)
+
+    # Within a multi-byte varint, and a whole reading short.
+    multi_byte = next(i for i in range(3, len(frame)) if frame[i] & 0x80)
+    for length in (multi_byte + 1, len(frame) - 1, 3):
+        with pytest.raises(ValueError):
+            decoder.decode_frame(frame[:length])
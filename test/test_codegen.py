@@ -0,0 +1,141 @@
+import importlib.util
+import json
+import re
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from nrf24 import codegen
+
+
+SCHEMA = {
+    'messages': [
+        {'name': 'dht22', 'protocol': 1, 'fields': [['temperature', 'float'], ['humidity', 'float']]},
+        {'name': 'status', 'protocol': 2, 'fields': [['node', 'uint8'], ['rssi', 'int16'], ['uptime', 'uint32'],
+                                                     ['ok', 'bool'], ['tag', 'bytes[4]'], ['level', 'int8']]},
+    ]
+}
+
+VALUES = {
+    'dht22': (21.5, 40.25),
+    'status': (7, -42, 123456, True, b'ABCD', -3),
+}
+
+# Sketch side of the round trip: decodes the payload given in hex with the generated structs, prints the fields, and
+# prints the payload of each struct filled in from the decoded values.
+PROGRAM = r'''
+#include <cstdio>
+#include <cstring>
+#include "messages.h"
+
+static void read_hex(const char *hex, uint8_t *buffer, size_t size) {
+  for (size_t i = 0; i < size; i++) sscanf(hex + 2 * i, "%2hhx", &buffer[i]);
+}
+
+static void print_hex(const void *data, size_t size) {
+  for (size_t i = 0; i < size; i++) printf("%02x", ((const uint8_t *) data)[i]);
+  printf("\n");
+}
+
+int main(int argc, char **argv) {
+  dht22_t dht22;
+  read_hex(argv[1], (uint8_t *) &dht22, DHT22_SIZE);
+  printf("%d %g %g\n", dht22.protocol, dht22.temperature, dht22.humidity);
+
+  status_t status;
+  read_hex(argv[2], (uint8_t *) &status, STATUS_SIZE);
+  printf("%d %d %d %u %d %.4s %d\n", status.protocol, status.node, status.rssi, status.uptime, status.ok,
+         (const char *) status.tag, status.level);
+
+  dht22_t out1;
+  out1.protocol = DHT22_PROTOCOL;
+  out1.temperature = dht22.temperature;
+  out1.humidity = dht22.humidity;
+  print_hex(&out1, sizeof(out1));
+
+  status_t out2;
+  out2.protocol = STATUS_PROTOCOL;
+  out2.node = status.node;
+  out2.rssi = status.rssi;
+  out2.uptime = status.uptime;
+  out2.ok = status.ok;
+  memcpy(out2.tag, status.tag, sizeof(out2.tag));
+  out2.level = status.level;
+  print_hex(&out2, sizeof(out2));
+  return 0;
+}
+'''
+
+
+@pytest.fixture
+def generated(tmp_path):
+    # Generate the Python module and the C header from the schema, and import the module.
+    schema = tmp_path / 'schema.json'
+    schema.write_text(json.dumps(SCHEMA))
+    assert codegen.main([str(schema), '--python', str(tmp_path / 'messages.py'),
+                         '--header', str(tmp_path / 'messages.h')]) == 0
+
+    spec = importlib.util.spec_from_file_location('messages', tmp_path / 'messages.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return tmp_path, module
+
+
+def test_header_matches_python(generated):
+    # The sizes and offsets asserted by the header are those of the generated Python schemas.
+    path, module = generated
+    header = (path / 'messages.h').read_text()
+
+    for message in SCHEMA['messages']:
+        name = message['name']
+        schema = getattr(module, name.upper())
+        assert module.registry.get(message['protocol']) is schema
+        assert re.search(rf'#define {name.upper()}_SIZE (\d+)', header).group(1) == str(schema.size)
+
+        offsets = dict((field, int(offset)) for field, offset in
+                       re.findall(rf'offsetof\({name}_t, (\w+)\) == (\d+)', header))
+        fmt = schema.struct.format
+        fields = re.findall(r'\d*[a-zA-Z?]', fmt[1:])
+        expected = {'protocol': 0}
+        for i, field in enumerate(message['fields'], 1):
+            expected[field[0]] = struct.calcsize(fmt[0] + ''.join(fields[:i]))
+        assert offsets == expected
+
+
+def test_plain_c(generated):
+    # The header compiles as C too, where static_assert comes from assert.h.
+    compiler = shutil.which('gcc') or shutil.which('cc')
+    if compiler is None:
+        pytest.skip('No C compiler.')
+
+    path, _ = generated
+    (path / 'messages.c').write_text('#include "messages.h"\n')
+    subprocess.run([compiler, '-std=c11', '-Wall', '-Werror', '-fsyntax-only', str(path / 'messages.c')],
+                   check=True, cwd=path)
+
+
+def test_round_trip(generated, tmp_path):
+    # Payloads packed in Python are decoded by the generated C structs, and payloads filled in by the C structs are
+    # decoded by the generated Python schemas.
+    compiler = shutil.which('g++') or shutil.which('c++')
+    if compiler is None:
+        pytest.skip('No C++ compiler.')
+
+    path, module = generated
+    (path / 'roundtrip.cpp').write_text(PROGRAM)
+    subprocess.run([compiler, '-std=c++11', '-Wall', '-o', str(path / 'roundtrip'), str(path / 'roundtrip.cpp')],
+                   check=True, cwd=path)
+
+    payloads = [getattr(module, name.upper()).pack(*values) for name, values in VALUES.items()]
+    output = subprocess.run([str(path / 'roundtrip')] + [p.hex() for p in payloads], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout.split('\n')
+
+    assert output[0] == '1 21.5 40.25'
+    assert output[1] == '2 7 -42 123456 1 ABCD -3'
+    for line, payload in zip(output[2:4], payloads):
+        returned = bytes.fromhex(line)
+        assert returned == payload
+        schema, values = module.registry.decode(returned)
+        assert values[1:] == VALUES[schema.name]
@@ -0,0 +1,74 @@
+import random
+import time
+
+from nrf24 import NRF24, RF24_DATA_RATE, RF24_PAYLOAD, RF24_RX_ADDR
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+# (CE GPIO, SPI channel, aux) of the receiver radio and of the radio of each sender.
+WIRING = [(25, 0, False), (22, 1, False), (12, 0, True), (13, 1, True)]
+
+
+def _network(monkeypatch, senders=3):
+    # A receiver and a number of senders on one simulated pigpio connection, in virtual time. The receiver is drained
+    # whenever a sender sleeps, and the payloads it receives are collected in a list.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    nrfs = []
+    for ce, channel, aux in WIRING[:senders + 1]:
+        pi.add_radio(ce=ce, spi_channel=channel, aux=aux)
+        nrfs.append(NRF24(pi, ce, channel + (2 if aux else 0), payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6))
+
+    receiver = nrfs[0]
+    receiver.open_reading_pipe(RF24_RX_ADDR.P1, 'RECV1')
+    for nrf in nrfs[1:]:
+        nrf.open_writing_pipe('RECV1')
+
+    received = []
+
+    def sleep(seconds):
+        pi.sleep(seconds)
+        while receiver.data_ready():
+            received.append(bytes(receiver.get_payload()))
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return sim, nrfs[1:], received
+
+
+def _contend(monkeypatch, csma):
+    # Every 10ms all senders send a frame at about the same time. Returns the number of collisions and of frames
+    # received.
+    sim, senders, received = _network(monkeypatch)
+    random.seed(1)
+    for nrf in senders:
+        nrf.set_csma(csma)
+
+    for n in range(50):
+        for i in random.sample(range(len(senders)), len(senders)):
+            senders[i].send(bytes([i, n]) * 16)
+        time.sleep(0.01)
+
+    assert all(nrf.get_csma_statistics()['samples'] >= (50 if csma else 0) for nrf in senders)
+    return sim.get_statistics()['collisions'], len(set(received))
+
+
+def test_carrier_after_power_down(monkeypatch):
+    # A powered down radio is put in RX mode to sample the carrier.
+    _, senders, _ = _network(monkeypatch, 2)
+    senders[0].power_down()
+    senders[1].set_data_rate(RF24_DATA_RATE.RATE_250KBPS)
+    senders[1].send(bytes(32))
+    time.sleep(0.0002)
+
+    assert senders[0].is_carrier()
+
+
+def test_fewer_collisions(monkeypatch):
+    collisions, delivered = _contend(monkeypatch, False)
+    csma_collisions, csma_delivered = _contend(monkeypatch, True)
+
+    # Without listen before talk the senders collide, and keep colliding as they retransmit with the same delay.
+    assert csma_collisions < collisions / 4
+    assert csma_delivered > delivered
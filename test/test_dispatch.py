@@ -0,0 +1,97 @@
+import time
+
+from nrf24 import NRF24, RF24_PAYLOAD
+from nrf24.dispatch import Dispatcher
+from nrf24.faults import Faults
+from nrf24.pool import NRF24Pool
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+# (channel, address) of the destinations: two on the node on channel 10, two on the node on channel 20.
+DESTINATIONS = [(10, 'ANODE'), (10, 'BNODE'), (20, 'CNODE'), (20, 'DNODE')]
+
+
+def _network(monkeypatch, loss=0.0):
+    # A dispatcher with two radios and two nodes on one simulated pigpio connection, in virtual time, with loss in both
+    # directions between every radio and node. The nodes are drained whenever the dispatcher sleeps, and what they
+    # receive is collected per destination.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    faults = Faults(seed=2)
+    sim.set_faults(faults)
+    radios = [pi.add_radio(ce=25, spi_channel=0), pi.add_radio(ce=22, spi_channel=1)]
+    nodes = [pi.add_radio(ce=12, spi_channel=0, aux=True), pi.add_radio(ce=13, spi_channel=1, aux=True)]
+    for radio in radios:
+        for node in nodes:
+            faults.set_link(radio, node, loss=loss)
+
+    pool = NRF24Pool(pi)
+    for ce, channel in [(25, 0), (22, 1)]:
+        pool.add_radio(ce, channel, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+        pool.get_radio(len(pool) - 1).set_retransmission(1, 2)
+
+    nrfs = []
+    for n, ce in enumerate([12, 13]):
+        nrf = NRF24(pi, ce, n + 2, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+        channel, _ = DESTINATIONS[2 * n]
+        nrf.set_channel(channel)
+        for pipe in (1, 2):
+            nrf.open_reading_pipe(pipe, DESTINATIONS[2 * n + pipe - 1][1])
+        nrf.power_up_rx()
+        nrfs.append(nrf)
+
+    received = {destination: [] for destination in DESTINATIONS}
+
+    def sleep(seconds):
+        pi.sleep(seconds)
+        for n, nrf in enumerate(nrfs):
+            while nrf.data_ready():
+                pipe = nrf.data_pipe()
+                received[DESTINATIONS[2 * n + pipe - 1]].append(bytes(nrf.get_payload()))
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return faults, radios, nodes, Dispatcher(pool), received
+
+
+def test_unreachable_node(monkeypatch):
+    # The three packets loaded together fail on MAX_RT and are queued again. Sent one at a time they fail on their own,
+    # and are given up in order.
+    faults, radios, nodes, dispatcher, received = _network(monkeypatch)
+    for radio in radios:
+        faults.set_link(radio, nodes[0], loss=1.0)
+    payloads = [bytes([n]) for n in range(3)]
+    for payload in payloads:
+        dispatcher.send(10, 'ANODE', payload)
+
+    assert dispatcher.flush(timeout=1.0)
+    assert dispatcher.get_failed() == [(10, b'ANODE', payload) for payload in payloads]
+    assert dispatcher.get_failed() == []
+
+    statistics = dispatcher.get_statistics()
+    assert (statistics['sent'], statistics['lost'], statistics['retransmitted']) == (0, 3, 3)
+    assert received[(10, 'ANODE')] == []
+
+
+def test_order_per_destination(monkeypatch):
+    # With loss, packets are queued again and some are given up, but every destination receives its packets in the
+    # order sent: a packet queued again may arrive twice, but never before a packet sent before it. A packet given up
+    # may still have arrived, with its acknowledgements lost.
+    _, _, _, dispatcher, received = _network(monkeypatch, loss=0.3)
+    payloads = {destination: [bytes([d, n]) for n in range(40)] for d, destination in enumerate(DESTINATIONS)}
+    for n in range(40):
+        for destination in DESTINATIONS:
+            assert dispatcher.send(*destination, payloads[destination][n]) is not None
+
+    assert dispatcher.flush(timeout=5.0)
+    failed = dispatcher.get_failed()
+    statistics = dispatcher.get_statistics()
+    assert statistics['retransmitted'] > 0
+    assert statistics['sent'] + statistics['lost'] == 160 and statistics['lost'] == len(failed)
+
+    for channel, address in DESTINATIONS:
+        given_up = [payload for c, a, payload in failed if (c, a) == (channel, address.encode())]
+        first = list(dict.fromkeys(received[(channel, address)]))
+        assert first == [payload for payload in payloads[(channel, address)] if payload in first]
+        assert set(payloads[(channel, address)]) - set(given_up) <= set(first)
@@ -0,0 +1,88 @@
+import time
+
+from nrf24 import NRF24, RF24_PAYLOAD, RF24_RX_ADDR
+from nrf24.diversity import DiversityReceiver
+from nrf24.faults import Faults
+from nrf24.pool import NRF24Pool
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+def _diversity(monkeypatch):
+    # A receiver with two radios and a sender on one simulated pigpio connection, in virtual time. The receiver is
+    # processed whenever the sender sleeps, and what it delivers is collected in a list.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    faults = Faults(seed=2)
+    sim.set_faults(faults)
+    radios = [pi.add_radio(ce=25, spi_channel=0), pi.add_radio(ce=22, spi_channel=1),
+              pi.add_radio(ce=12, spi_channel=0, aux=True)]
+
+    pool = NRF24Pool(pi)
+    for ce, channel in [(25, 0), (22, 1)]:
+        pool.add_radio(ce, channel, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+    receiver = DiversityReceiver(pool, 'DIVR1')
+
+    sender = NRF24(pi, 12, 2, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+    sender.set_channel(76)
+    sender.open_writing_pipe('DIVR1')
+
+    delivered = []
+
+    def sleep(seconds):
+        pi.sleep(seconds)
+        delivered.extend(receiver.process())
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return faults, radios, pool, receiver, sender, delivered
+
+
+def _send(sender, payloads, attempts=1):
+    # Send the payloads, each up to the number of attempts given, and return how many of them were acknowledged.
+    acknowledged = 0
+    for payload in payloads:
+        for _ in range(attempts):
+            sender.send(payload)
+            sender.wait_until_sent()
+            time.sleep(0.001)
+            if sender.get_packages_lost() == 0:
+                acknowledged += 1
+                break
+            sender.reset_packages_lost()
+            sender.flush_tx()
+    return acknowledged
+
+
+def test_duplicates_dropped(monkeypatch):
+    # Both radios receive every packet, and every packet is delivered once.
+    _, _, _, receiver, sender, delivered = _diversity(monkeypatch)
+    payloads = [bytes([n]) * 4 for n in range(20)]
+
+    assert _send(sender, payloads) == 20
+    assert delivered == [(1, payload) for payload in payloads]
+
+    statistics = receiver.get_statistics()
+    assert statistics['delivered'] == 20 and statistics['duplicates'] == 20
+    assert [radio['copies'] for radio in statistics['radios']] == [20, 20]
+    assert sum(radio['wins'] for radio in statistics['radios']) == 20
+
+
+def test_only_first_radio_acknowledges(monkeypatch):
+    # With the first radio out of reach, the second one still delivers every packet, but none is acknowledged. The
+    # radio drops the automatic retransmissions itself, and the packets sent again by the sender are dropped as copies.
+    faults, radios, pool, receiver, sender, delivered = _diversity(monkeypatch)
+    assert pool.get_radio(0).get_auto_ack(RF24_RX_ADDR.P1)
+    assert not pool.get_radio(1).get_auto_ack(RF24_RX_ADDR.P1)
+
+    faults.set_link(radios[2], radios[0], loss=1.0)
+    sender.set_retransmission(1, 3)
+    payloads = [bytes([n]) * 4 for n in range(10)]
+
+    assert _send(sender, payloads, attempts=2) == 0
+    assert delivered == [(1, payload) for payload in payloads]
+
+    statistics = receiver.get_statistics()
+    assert statistics['duplicates'] == 10
+    assert [radio['copies'] for radio in statistics['radios']] == [0, 20]
+    assert [radio['wins'] for radio in statistics['radios']] == [0, 10]
@@ -0,0 +1,77 @@
+import time
+
+from nrf24 import NRF24, RF24_DATA_RATE, RF24_PAYLOAD
+from nrf24.faults import Faults
+from nrf24.mesh import MeshNode
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+# A chain of 3 hops: 0111 -> 011 -> 01 -> master (octal). (CE GPIO, SPI channel, aux) of each radio.
+CHAIN = [0, 0o1, 0o11, 0o111]
+WIRING = [(25, 0, False), (22, 1, False), (12, 0, True), (13, 1, True)]
+
+
+def _mesh(monkeypatch, loss):
+    # The radios of the chain on one simulated pigpio connection, in virtual time. Each node only hears its neighbours
+    # in the chain, with the loss given on those links.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'sleep', pi.sleep)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    faults = Faults(seed=2)
+    sim.set_faults(faults)
+    radios = [pi.add_radio(ce=ce, spi_channel=channel, aux=aux) for ce, channel, aux in WIRING]
+    for i, radio in enumerate(radios):
+        for j in range(i + 1, len(radios)):
+            faults.set_link(radio, radios[j], loss=loss if j == i + 1 else 1.0)
+
+    nodes = []
+    for node, (ce, channel, aux) in zip(CHAIN, WIRING):
+        nrf = NRF24(pi, ce, channel + (2 if aux else 0), payload_size=RF24_PAYLOAD.DYNAMIC,
+                    data_rate=RF24_DATA_RATE.RATE_2MBPS, spi_speed=8e6)
+        nodes.append(MeshNode(nrf, node))
+    return pi, nodes
+
+
+def _run(pi, nodes, source, destination, count, interval=0.005, timeout=5.0):
+    # Send count messages from source to destination, one every interval seconds. Returns the latency of each message
+    # received, in order of arrival.
+    sent = {}
+    latencies = []
+    start = time.monotonic()
+    while len(latencies) < count and time.monotonic() - start < timeout:
+        if len(sent) < count and time.monotonic() - start >= len(sent) * interval:
+            sent[len(sent)] = time.monotonic()
+            source.send(destination.get_node(), len(sent).to_bytes(2, 'little'))
+        for node in nodes:
+            node.update()
+        while destination.available():
+            message = destination.read()
+            latencies.append(message.received - sent[int.from_bytes(message.payload, 'little') - 1])
+        pi.sleep(0.0002)
+    return latencies
+
+
+def test_three_hops_up(monkeypatch):
+    pi, nodes = _mesh(monkeypatch, 0.0)
+    latencies = _run(pi, nodes, nodes[-1], nodes[0], 50)
+
+    assert len(latencies) == 50
+    assert nodes[1].get_statistics()['forwarded'] == 50
+    assert nodes[2].get_statistics()['forwarded'] == 50
+    # Three hops of a few hundred microseconds each, plus the time each relay takes to poll.
+    assert sum(latencies) / len(latencies) < 0.01
+
+
+def test_three_hops_down_with_loss(monkeypatch):
+    # With 20% loss on every link some windows end in MAX_RT. The hop retransmits them after its timeout, and
+    # forwarding goes on. The backoff after each failure dominates the latency, and the worst case varies with the
+    # pattern of losses, up to about 2.3s with other seeds.
+    pi, nodes = _mesh(monkeypatch, 0.2)
+    latencies = _run(pi, nodes, nodes[0], nodes[-1], 50)
+
+    assert len(latencies) == 50
+    assert sum(node.get_statistics()['retransmitted'] for node in nodes) > 0
+    assert sum(node.get_statistics()['failed'] for node in nodes) == 0
+    assert max(latencies) < 2.5
@@ -0,0 +1,76 @@
+import time
+
+from nrf24 import NRF24, RF24_PAYLOAD, RF24_RX_ADDR
+from nrf24.migration import MigrationGateway, MigrationNode
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+# (CE GPIO, SPI channel, aux) of the gateway radio and of the radio of each node.
+WIRING = [(25, 0, False), (22, 1, False), (12, 0, True), (13, 1, True)]
+CHANNELS = [76, 90, 110]
+
+
+def _network(monkeypatch, nodes=3):
+    # A gateway and a number of nodes on one simulated pigpio connection, in virtual time, all on channel 76. The
+    # gateway is polled whenever a node sleeps, and the payloads it receives are collected in a list.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    nrfs = []
+    for ce, channel, aux in WIRING[:nodes + 1]:
+        pi.add_radio(ce=ce, spi_channel=channel, aux=aux)
+        nrfs.append(NRF24(pi, ce, channel + (2 if aux else 0), payload_size=RF24_PAYLOAD.ACK, spi_speed=8e6))
+
+    nrfs[0].open_reading_pipe(RF24_RX_ADDR.P1, 'GATE1', RF24_PAYLOAD.ACK)
+    gateway = MigrationGateway(nrfs[0], switch_delay=0.1)
+
+    migration_nodes = []
+    for i, nrf in enumerate(nrfs[1:], 1):
+        nrf.open_writing_pipe('GATE1', RF24_PAYLOAD.ACK)
+        migration_nodes.append(MigrationNode(nrf, f'NODE{i}', CHANNELS))
+
+    received = []
+
+    def sleep(seconds):
+        pi.sleep(seconds)
+        received.extend(bytes(payload) for _, payload in gateway.poll())
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return nrfs, gateway, migration_nodes, received
+
+
+def test_queue_full(monkeypatch):
+    _, _, nodes, _ = _network(monkeypatch, 1)
+    node = MigrationNode(nodes[0]._nrf, 'NODE9', CHANNELS, queue_size=2)
+
+    assert node.queue(b'\x01a') and node.queue(b'\x01b')
+    assert not node.queue(b'\x01c')
+    assert node.pending() == 2
+
+
+def test_migration(monkeypatch):
+    # Three nodes keep sending while the gateway moves from channel 76 to 90. Nothing is lost, and every node follows
+    # the gateway and checks in on the new channel.
+    nrfs, gateway, nodes, received = _network(monkeypatch)
+    messages = {i: [bytes([1, i, n]) for n in range(200)] for i in range(len(nodes))}
+    queued = dict.fromkeys(messages, 0)
+
+    # Each node queues a message every 2ms, as long as its queue has room. The migration is announced after 0.1s.
+    start = time.monotonic()
+    while (any(queued[i] < len(messages[i]) or node.pending() for i, node in enumerate(nodes))
+           and time.monotonic() - start < 3.0):
+        elapsed = time.monotonic() - start
+        if gateway.get_epoch() == 0 and elapsed > 0.1:
+            gateway.migrate(90)
+        for i, node in enumerate(nodes):
+            while queued[i] < min(len(messages[i]), elapsed / 0.002) and node.queue(messages[i][queued[i]]):
+                queued[i] += 1
+            node.process()
+        time.sleep(0.0005)
+
+    assert [nrf.get_channel() for nrf in nrfs] == [90] * 4
+    assert sorted(gateway.confirmed_nodes()) == [b'NODE1', b'NODE2', b'NODE3']
+    for i, node in enumerate(nodes):
+        assert node.pending() == 0
+        assert [payload for payload in received if payload[1] == i] == messages[i]
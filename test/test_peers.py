@@ -0,0 +1,67 @@
+import pytest
+
+from nrf24 import NRF24
+from nrf24.peers import PeerTable
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+def _table():
+    # A peer table on a simulated radio. Returns the table and a list of the batches written to the radio.
+    pi = SimulatedPi(Simulator(seed=1))
+    pi.add_radio(ce=25, spi_channel=0)
+    nrf = NRF24(pi, 25, 0)
+
+    batches = []
+    open_reading_pipes = nrf.open_reading_pipes
+
+    def record(addresses, size=None):
+        batches.append(dict(addresses))
+        open_reading_pipes(addresses, size)
+
+    nrf.open_reading_pipes = record
+    return PeerTable(nrf), batches
+
+
+def test_activate():
+    table, _ = _table()
+    addresses = [f'{n}PEER' for n in range(5)]
+    pipes = table.activate(*addresses)
+
+    assert sorted(pipes) == [1, 2, 3, 4, 5]
+    assert [table.get_pipe(address) for address in addresses] == pipes
+    assert [table.lookup(pipe) for pipe in pipes] == [address.encode() for address in addresses]
+
+    # A new prefix: the peer goes to P1, and the known peers sharing its prefix fill the other pipes.
+    table.add_peer('1NODE')
+    assert table.activate('0NODE', '2NODE') == [1, 3]
+    assert table.get_pipe('1NODE') == 2
+    assert table.get_pipe('0PEER') is None
+
+
+def test_activate_too_many():
+    table, batches = _table()
+    with pytest.raises(ValueError):
+        table.activate(*[f'{n}PEER' for n in range(6)])
+    with pytest.raises(ValueError):
+        table.activate('0PEER', '0NODE')
+    assert batches == []
+
+
+def test_plan_writes_changed_pipes():
+    table, batches = _table()
+    pipes = table.activate(*[f'{n}PEER' for n in range(5)])
+
+    # 1PEER is the busiest peer, but the least recently used one when 5PEER takes its pipe.
+    for pipe in [pipes[1]] * 3 + pipes[2:] + pipes[:1]:
+        table.received(pipe)
+    table.activate('5PEER')
+    assert table.get_pipe('5PEER') == pipes[1]
+    batches.clear()
+
+    # The plan gives the pipe back to 1PEER, and leaves the others alone.
+    table.plan()
+    assert batches == [{pipes[1]: b'1PEER'}]
+
+    # Nothing changes, nothing is written.
+    table.plan()
+    assert batches == [{pipes[1]: b'1PEER'}]
@@ -0,0 +1,86 @@
+import time
+
+from nrf24 import NRF24, RF24_PAYLOAD
+from nrf24.faults import Faults
+from nrf24.polling import PolledNode, PollingGateway
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+# (CE GPIO, SPI channel, aux) of the gateway radio and of the radio of each node.
+WIRING = [(25, 0, False), (22, 1, False), (12, 0, True)]
+
+
+def _network(monkeypatch, nodes=1, ack_loss=0.0):
+    # A gateway and a number of nodes on one simulated pigpio connection, in virtual time, with the acknowledgements of
+    # the nodes lost with the probability given. The gateway does not retransmit, so every lost acknowledgement makes a
+    # poll fail. The nodes are processed whenever the gateway sleeps.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    faults = Faults(seed=2)
+    sim.set_faults(faults)
+    nrfs = []
+    for ce, channel, aux in WIRING[:nodes + 1]:
+        radio = pi.add_radio(ce=ce, spi_channel=channel, aux=aux)
+        if nrfs:
+            faults.set_link(radio, sim.get_radios()[0], ack_loss=ack_loss, symmetric=False)
+        nrfs.append(NRF24(pi, ce, channel + (2 if aux else 0), payload_size=RF24_PAYLOAD.ACK, spi_speed=8e6))
+
+    nrfs[0].set_retransmission(1, 0)
+    gateway = PollingGateway(nrfs[0], min_interval=0.005, max_interval=0.1)
+    polled = [PolledNode(nrf, f'NODE{i}') for i, nrf in enumerate(nrfs[1:], 1)]
+
+    def sleep(seconds):
+        pi.sleep(seconds)
+        for node in polled:
+            node.process()
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return gateway, polled
+
+
+def _run(gateway, duration):
+    collected = []
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        collected += gateway.process()
+        time.sleep(0.001)
+    return collected
+
+
+def test_lost_acknowledgements(monkeypatch):
+    # Readings returned with a lost acknowledgement are sent again, and none is delivered twice.
+    gateway, nodes = _network(monkeypatch, ack_loss=0.3)
+    gateway.add_node('NODE1')
+    records = [bytes([n]) * 4 for n in range(100)]
+    for record in records:
+        assert nodes[0].queue(record)
+
+    collected = _run(gateway, 1.0)
+
+    assert nodes[0].pending() == 0
+    assert sorted(record for _, record in collected) == records
+    assert gateway.get_statistics('NODE1')['lost'] > 0
+
+
+def test_queue_full(monkeypatch):
+    _, nodes = _network(monkeypatch)
+    node = PolledNode(nodes[0]._nrf, 'NODE9', queue_size=2)
+
+    assert node.queue(b'a') and node.queue(b'b')
+    assert not node.queue(b'c')
+    assert node.pending() == 2
+
+
+def test_remove_and_add_node(monkeypatch):
+    # A node removed and added again is polled as often as a node that was never removed.
+    gateway, _ = _network(monkeypatch, nodes=2)
+    gateway.add_node('NODE1')
+    gateway.add_node('NODE2')
+    gateway.remove_node('NODE1')
+    gateway.add_node('NODE1')
+
+    _run(gateway, 1.0)
+
+    assert gateway.get_statistics('NODE1')['polls'] == gateway.get_statistics('NODE2')['polls']
@@ -0,0 +1,60 @@
+import time
+
+from nrf24 import NRF24, RF24_PAYLOAD
+from nrf24.pool import NRF24Pool
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+def _pool(monkeypatch):
+    # A pool of two radios listening on POOL0 and POOL1, and a sender, on one simulated pigpio connection in virtual
+    # time.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'sleep', pi.sleep)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    pi.add_radio(ce=25, spi_channel=0)
+    pi.add_radio(ce=22, spi_channel=1)
+    pi.add_radio(ce=12, spi_channel=0, aux=True)
+
+    pool = NRF24Pool(pi)
+    for ce, channel in [(25, 0), (22, 1)]:
+        radio = pool.add_radio(ce, channel, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+        pool.get_radio(radio).open_reading_pipe(1, f'POOL{radio}')
+    return pool, NRF24(pi, 12, 2, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+
+
+def _send(sender, address, payloads):
+    sender.open_writing_pipe(address)
+    for payload in payloads:
+        sender.send(payload)
+        sender.wait_until_sent()
+        assert sender.get_packages_lost() == 0
+
+
+def test_fullest_first(monkeypatch):
+    # The radio with a full RX FIFO is drained first, whichever radio the rotation starts with.
+    pool, sender = _pool(monkeypatch)
+
+    _send(sender, 'POOL0', [b'a0'])
+    _send(sender, 'POOL1', [b'b0', b'b1', b'b2'])
+    assert [(radio, payload) for _, radio, _, payload in pool.receive()] == \
+        [(1, b'b0'), (1, b'b1'), (1, b'b2'), (0, b'a0')]
+
+    _send(sender, 'POOL1', [b'b3'])
+    _send(sender, 'POOL0', [b'a1', b'a2', b'a3'])
+    assert [(radio, payload) for _, radio, _, payload in pool.receive()] == \
+        [(0, b'a1'), (0, b'a2'), (0, b'a3'), (1, b'b3')]
+
+    assert pool.get_statistics(0)['full'] == 1 and pool.get_statistics(1)['full'] == 1
+    assert pool.get_statistics()['received'] == 8
+
+
+def test_ties_rotate(monkeypatch):
+    # Radios with the same fill are drained in turn, starting with the next radio on each call.
+    pool, sender = _pool(monkeypatch)
+
+    for expected in ([0, 1], [1, 0], [0, 1]):
+        _send(sender, 'POOL0', [b'a'])
+        _send(sender, 'POOL1', [b'b'])
+        assert [radio for _, radio, _, _ in pool.receive()] == expected
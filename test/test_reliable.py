@@ -0,0 +1,78 @@
+import random
+import time
+
+from nrf24 import NRF24, RF24_DATA_RATE, RF24_PAYLOAD
+from nrf24.faults import Faults
+from nrf24.reliable import ReliableChannel
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+def _link(monkeypatch, loss):
+    # A sender and a receiver on one simulated pigpio connection, in virtual time, with loss in both directions.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'sleep', pi.sleep)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    faults = Faults(seed=2)
+    sim.set_faults(faults)
+    radios = [pi.add_radio(ce=25, spi_channel=0), pi.add_radio(ce=22, spi_channel=1)]
+    faults.set_link(radios[0], radios[1], loss=loss)
+
+    sender = NRF24(pi, 25, 0, payload_size=RF24_PAYLOAD.DYNAMIC, data_rate=RF24_DATA_RATE.RATE_2MBPS, spi_speed=8e6)
+    receiver = NRF24(pi, 22, 1, payload_size=RF24_PAYLOAD.DYNAMIC, data_rate=RF24_DATA_RATE.RATE_2MBPS, spi_speed=8e6)
+    receiver.open_reading_pipe(1, 'RECV1')
+    return pi, ReliableChannel(sender, 1, timeout=0.005), ReliableChannel(receiver, 2)
+
+
+def _run(pi, sender, receiver, count, timeout=5.0):
+    for i in range(count):
+        sender.send('RECV1', i.to_bytes(2, 'little'))
+
+    received = []
+    start = time.monotonic()
+    while (sender.pending() or sender.process()) and time.monotonic() - start < timeout:
+        sender.process()
+        received += receiver.receive()
+        pi.sleep(0.0002)
+    pi.sleep(0.001)
+    received += receiver.receive()
+    return received
+
+
+def test_delivery_without_loss(monkeypatch):
+    pi, sender, receiver = _link(monkeypatch, 0.0)
+    received = _run(pi, sender, receiver, 40)
+
+    assert [int.from_bytes(p, 'little') for _, p in received] == list(range(40))
+    assert sender.get_statistics()['failed'] == 0
+
+
+def test_delivery_with_loss(monkeypatch):
+    # At 50% loss each way many windows end in MAX_RT. The radio must be restarted after each of them, and frames
+    # retransmitted until they get through, in order and without duplicates.
+    pi, sender, receiver = _link(monkeypatch, 0.5)
+    received = _run(pi, sender, receiver, 40)
+
+    statistics = sender.get_statistics()
+    assert statistics['retransmitted'] > 0
+    delivered = [int.from_bytes(p, 'little') for _, p in received]
+    assert len(delivered) == len(set(delivered))
+    assert delivered == sorted(delivered)
+    failed = [int.from_bytes(p, 'little') for _, p in sender.get_failed()]
+    assert set(delivered) | set(failed) == set(range(40))
+    assert len(failed) <= 2
+    assert sender.pending() == 0
+    assert not sender._nrf.get_status() & NRF24.MAX_RT
+
+
+def test_restarted_sender(monkeypatch):
+    # A restarted sender starts over from sequence number 0. Its frames are new frames, not duplicates of those sent
+    # before the restart.
+    random.seed(1)
+    pi, sender, receiver = _link(monkeypatch, 0.0)
+    restarted = ReliableChannel(sender._nrf, 1, timeout=0.005)
+    received = _run(pi, sender, receiver, 10) + _run(pi, restarted, receiver, 10)
+
+    assert [int.from_bytes(p, 'little') for _, p in received] == list(range(10)) * 2
+    assert receiver.get_statistics()['duplicates'] == 0
@@ -0,0 +1,88 @@
+import time
+
+from nrf24 import NRF24, RF24_PAYLOAD
+from nrf24.rpc import RPC_STATUS, RpcClient, RpcServer
+from nrf24.simulator import SimulatedPi, Simulator
+
+
+# (CE GPIO, SPI channel, aux) of the server radio and of the radio of each client.
+WIRING = [(25, 0, False), (22, 1, False), (12, 0, True), (13, 1, True)]
+
+
+def _network(monkeypatch, clients=1, payload_size=RF24_PAYLOAD.MAX):
+    # A server and a number of clients on one simulated pigpio connection, in virtual time. The server echoes the
+    # arguments of command 1.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'sleep', pi.sleep)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    nrfs = []
+    for ce, channel, aux in WIRING[:clients + 1]:
+        pi.add_radio(ce=ce, spi_channel=channel, aux=aux)
+        nrfs.append(NRF24(pi, ce, channel + (2 if aux else 0), payload_size=payload_size, spi_speed=8e6))
+
+    server = RpcServer(nrfs[0], 'SERVR')
+    server.register(1, lambda args: args)
+    clients = [RpcClient(nrf, f'CLNT{i}', 'SERVR', timeout=0.1) for i, nrf in enumerate(nrfs[1:], 1)]
+    return pi, server, clients
+
+
+def _run(pi, server, clients, requests):
+    # Poll the server and the clients until all requests are done.
+    start = time.monotonic()
+    while not all(r.done for r in requests) and time.monotonic() - start < 1.0:
+        server.poll()
+        for client in clients:
+            client.poll()
+        pi.sleep(0.0005)
+
+
+def test_fixed_payload_size(monkeypatch):
+    # The padding of fixed size payloads is neither passed to the handler nor returned with the result.
+    pi, server, clients = _network(monkeypatch)
+    requests = [clients[0].request(1, b'abc'), clients[0].request(1, b''), clients[0].request(2)]
+    _run(pi, server, clients, requests)
+
+    assert [(r.status, r.result) for r in requests] == \
+        [(RPC_STATUS.OK, b'abc'), (RPC_STATUS.OK, b''), (RPC_STATUS.UNKNOWN_COMMAND, b'')]
+
+
+def test_three_clients(monkeypatch):
+    # The clients do not acknowledge each other's requests, so every request gets through and is answered.
+    pi, server, clients = _network(monkeypatch, 3, RF24_PAYLOAD.DYNAMIC)
+    requests = []
+    for i in range(10):
+        for n, client in enumerate(clients):
+            requests.append(client.request(1, bytes([n, i])))
+        _run(pi, server, clients, requests)
+
+    assert all(r.status == RPC_STATUS.OK for r in requests)
+    assert sorted(r.result for r in requests) == sorted(bytes([n, i]) for n in range(3) for i in range(10))
+    assert server.get_statistics() == {'handled': 30, 'dropped': 0, 'lost': 0}
+
+
+def test_lost_reply(monkeypatch):
+    # The client stops listening after sending its request: the request times out, and the server counts the reply
+    # as lost.
+    pi, server, clients = _network(monkeypatch)
+    request = clients[0].request(1, b'abc')
+    clients[0]._nrf.close_reading_pipe(1)
+    _run(pi, server, clients, [request])
+
+    assert request.status == RPC_STATUS.TIMEOUT
+    assert server.get_statistics()['lost'] == 1
+
+
+def test_malformed_requests(monkeypatch):
+    # A reply-to address of the wrong width, and a request shorter than its header says, are dropped.
+    pi, server, clients = _network(monkeypatch)
+    nrf = clients[0]._nrf
+    nrf.enable_reading_pipe(0)
+    for frame in (bytes([0xE0, 1, 1, 3, 0]) + b'CLN', bytes([0xE0, 2, 1, 5, 30]) + b'CLNT1abc'):
+        nrf.send(frame)
+        nrf.wait_until_sent()
+    pi.sleep(0.001)
+
+    assert server.poll() == 0
+    assert server.get_statistics()['dropped'] == 2
@@ -0,0 +1,41 @@
+import pytest
+
+from nrf24.schema import Schema, SchemaRegistry
+
+
+def _registry():
+    registry = SchemaRegistry()
+    registry.register(Schema(0x01, '<Bff', ('temperature', 'humidity'), name='reading'))
+    return registry
+
+
+def test_decode_padded_payload():
+    # A payload received on a pipe with a fixed payload size of 32 bytes, padded with spaces.
+    registry = _registry()
+    payload = registry.get(0x01).pack(21.5, 40.0) + b' ' * 23
+
+    schema, values = registry.decode(payload)
+    assert schema.name == 'reading'
+    assert values == (0x01, 21.5, 40.0)
+    assert registry.decode(payload[:8]) == (None, None)
+
+
+def test_dispatch_padded_payload():
+    registry = SchemaRegistry()
+    received = []
+    registry.register(Schema(0x01, '<Bff', ('temperature', 'humidity')), lambda *values: received.append(values))
+
+    assert registry.dispatch(registry.get(0x01).pack(1.0, 2.0) + bytes(23))
+    assert received == [(0x01, 1.0, 2.0)]
+
+
+def test_decode_batch_padded_payloads():
+    np = pytest.importorskip('numpy')
+    registry = _registry()
+    schema = registry.get(0x01)
+    payloads = [schema.pack(i, i / 2) + b' ' * 23 for i in range(4)] + [schema.pack(4, 2.0)]
+
+    batch = registry.decode_batch(0x01, payloads)
+    assert np.array_equal(batch['temperature'], np.arange(5, dtype=np.float32))
+    with pytest.raises(ValueError):
+        registry.decode_batch(0x01, [schema.pack(1, 2)[:8]])
@@ -0,0 +1,180 @@
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import pigpio
+
+from nrf24 import NRF24, RF24_PAYLOAD, RF24_RX_ADDR
+from nrf24.simulator import SimulatedPi, Simulator
+from nrf24.supervisor import Supervisor
+
+
+# pigpiod socket commands used by pigpio.pi and NRF24. Any other command succeeds with a result of 0.
+MODES, READ, WRITE, TICK, NC, SPIO, SPIC, SPIX = 0, 3, 4, 16, 21, 71, 72, 75
+BAD_HANDLE = -25
+
+
+class FakePigpiod(socketserver.ThreadingTCPServer):
+    """
+    A pigpiod on localhost that runs the socket commands of pigpio.pi against a SimulatedPi. kill() drops the command
+    connection in the middle of the next SPI transfers, as if pigpiod had been restarted: connections are refused for
+    a while, and SPI handles opened before are invalid.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, pi):
+        super().__init__(('localhost', 0), _Connection)
+        self.pi = pi
+        self.port = self.server_address[1]
+        self.handles = set()
+        self.kill_after = None              # Number of SPI transfers left before the connection is dropped.
+        self.downtime = 0.0
+        self.down_until = 0.0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+
+    def kill(self, transfers, downtime):
+        self.kill_after = transfers
+        self.downtime = downtime
+
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Connection(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server
+        if server.pi.sim.now < server.down_until:
+            return
+
+        while True:
+            header = self._recv(16)
+            if header is None:
+                return
+            command, p1, p2, p3 = struct.unpack('IIII', header)
+            extension = self._recv(p3) if p3 else b''
+
+            if command == SPIX and server.kill_after is not None:
+                if server.kill_after == 0:
+                    server.kill_after = None
+                    server.down_until = server.pi.sim.now + server.downtime
+                    server.handles.clear()
+                    self.request.shutdown(socket.SHUT_RDWR)
+                    return
+                server.kill_after -= 1
+
+            if command == NC:
+                return
+
+            result, data = self._execute(command, p1, p2, extension)
+            self.request.sendall(struct.pack('IIII', command, p1, p2, result & 0xFFFFFFFF) + data)
+
+
+    def _execute(self, command, p1, p2, extension):
+        server = self.server
+        pi = server.pi
+        if command == MODES:
+            pi.set_mode(p1, p2)
+        elif command == WRITE:
+            pi.write(p1, p2)
+        elif command == READ:
+            return pi.read(p1), b''
+        elif command == TICK:
+            return pi.get_current_tick(), b''
+        elif command == SPIO:
+            handle = pi.spi_open(p1, p2, struct.unpack('I', extension)[0])
+            server.handles.add(handle)
+            return handle, b''
+        elif command == SPIC:
+            server.handles.discard(p1)
+        elif command == SPIX:
+            if p1 not in server.handles:
+                return BAD_HANDLE, b''
+            count, data = pi.spi_xfer(p1, extension)
+            return count, bytes(data)
+        return 0, b''
+
+
+    def _recv(self, count):
+        data = b''
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+
+def test_reconnect(monkeypatch):
+    # The sender talks to its radio through a fake pigpiod, which drops the connection in the middle of a send. The
+    # radio loses its configuration with it. The queue survives, and once the supervisor has reconnected, the radio
+    # is configured again and the rest of the queue is delivered. The receiver is drained whenever the sender sleeps.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    radio = pi.add_radio(ce=25, spi_channel=0)
+    pi.add_radio(ce=22, spi_channel=1)
+    receiver = NRF24(pi, 22, 1, channel=100, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+    receiver.open_reading_pipe(RF24_RX_ADDR.P1, 'RECV1')
+    received = []
+
+    def sleep(seconds):
+        pi.sleep(seconds)
+        while receiver.data_ready():
+            received.append(bytes(receiver.get_payload()))
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+
+    server = FakePigpiod(pi)
+    connections = []
+
+    def connect():
+        connections.append(pigpio.pi('localhost', server.port, show_errors=False))
+        return connections[-1]
+
+    try:
+        nrf = NRF24(connect(), 25, 0, channel=100, payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6)
+        nrf.open_writing_pipe('RECV1')
+        supervisor = Supervisor(nrf, connect, backoff=0.05)
+
+        messages = [bytes([n]) * 8 for n in range(10)]
+        for message in messages:
+            supervisor.send(message)
+
+        # Drop the connection after the first few SPI transfers of the first send, and power cycle the radio.
+        server.kill(3, downtime=0.2)
+        supervisor.process()
+        assert not supervisor.is_connected()
+        assert supervisor.pending() == len(messages)
+        radio.spi([NRF24.W_REGISTER | NRF24.CONFIG, 0x08])
+        radio.spi([NRF24.W_REGISTER | NRF24.RF_CH, 0x02])
+        radio.spi([NRF24.W_REGISTER | NRF24.TX_ADDR] + [0xE7] * 5)
+
+        start = time.monotonic()
+        while (supervisor.pending() or not supervisor.is_connected()) and time.monotonic() - start < 2.0:
+            supervisor.process()
+            time.sleep(0.01)
+
+        statistics = supervisor.get_statistics()
+        assert statistics['disconnects'] == 1
+        assert statistics['reconnects'] == 1
+        assert statistics['attempts'] > 1
+        assert statistics['sent'] == len(messages)
+
+        assert radio.spi([NRF24.RF_CH, 0])[1] == 100
+        assert radio.spi([NRF24.CONFIG, 0])[1] & NRF24.PWR_UP
+        assert bytes(radio.spi([NRF24.TX_ADDR] + [0] * 5)[1:]) == b'RECV1'
+        assert list(dict.fromkeys(received)) == messages
+    finally:
+        for connection in connections:
+            connection.stop()
+        server.close()
@@ -0,0 +1,99 @@
+import time
+
+from nrf24 import NRF24, RF24_PAYLOAD
+from nrf24.faults import Faults
+from nrf24.simulator import SimulatedPi, Simulator
+from nrf24.tdma import TdmaGateway, TdmaNode
+
+
+# (CE GPIO, SPI channel, aux) of the gateway radio and of the radio of each node.
+WIRING = [(25, 0, False), (22, 1, False), (12, 0, True), (13, 1, True)]
+
+
+def _network(monkeypatch, nodes=1, faults=None):
+    # A gateway and a number of nodes (ids 1, 2, ...) on one simulated pigpio connection, in virtual time. Returns the
+    # simulated radios as well, gateway first.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'sleep', pi.sleep)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+    if faults is not None:
+        sim.set_faults(faults)
+
+    radios = []
+    nrfs = []
+    for ce, channel, aux in WIRING[:nodes + 1]:
+        radios.append(pi.add_radio(ce=ce, spi_channel=channel, aux=aux))
+        nrfs.append(NRF24(pi, ce, channel + (2 if aux else 0), payload_size=RF24_PAYLOAD.DYNAMIC, spi_speed=8e6))
+
+    gateway = TdmaGateway(nrfs[0], pi, 'GATE1', 'BEACN')
+    return pi, radios, gateway, [TdmaNode(nrf, pi, i, 'GATE1', 'BEACN') for i, nrf in enumerate(nrfs[1:], 1)]
+
+
+def _run(pi, gateway, nodes, seconds):
+    received = []
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        received += gateway.process()
+        for node in nodes:
+            node.process()
+        pi.sleep(0.0002)
+    return received
+
+
+def test_slots(monkeypatch):
+    pi, _, gateway, nodes = _network(monkeypatch)
+    for i in range(20):
+        nodes[0].queue(bytes([i]))
+    received = _run(pi, gateway, nodes, 1.0)
+
+    assert received == [(1, bytes([i])) for i in range(20)]
+    assert gateway.get_statistics()['beacons'] > 0
+    assert gateway.get_statistics()['missed'] == 0
+
+
+def test_three_nodes(monkeypatch):
+    # The nodes do not acknowledge each other's frames, so every frame arrives once, in order.
+    pi, _, gateway, nodes = _network(monkeypatch, 3)
+    for node in nodes:
+        for i in range(30):
+            node.queue(bytes([i]))
+    received = _run(pi, gateway, nodes, 3.0)
+
+    for node_id, node in enumerate(nodes, 1):
+        assert [data for n, data in received if n == node_id] == [bytes([i]) for i in range(30)]
+        assert node.get_statistics()['sent'] == 30
+    assert len(received) == 90
+
+
+def test_frames_stay_in_their_slot(monkeypatch):
+    # Node 1 has slots, but cannot reach the gateway. With 15 retransmissions its frames would take 13ms to fail,
+    # overrunning its 4ms slots into those of nodes 2 and 3. The retransmissions are cut to fit the slot instead.
+    faults = Faults(seed=2)
+    pi, radios, gateway, nodes = _network(monkeypatch, 3, faults)
+    faults.set_link(radios[1], radios[0], loss=1.0, symmetric=False)
+    for node_id in (1, 2, 3):
+        gateway.add_node(node_id)
+    for node in nodes:
+        for i in range(30):
+            node.queue(bytes([i]))
+    received = _run(pi, gateway, nodes, 3.0)
+
+    assert nodes[0].get_statistics()['sent'] == 0
+    assert nodes[0].get_statistics()['lost'] > 0
+    assert pi.sim.get_statistics().get('collisions', 0) == 0
+    for node_id in (2, 3):
+        assert [data for n, data in received if n == node_id] == [bytes([i]) for i in range(30)]
+
+
+def test_beacon_timeout(monkeypatch):
+    # A gateway radio with CE stuck low never sends. Each beacon is dropped after the timeout, and the gateway goes on.
+    pi, radios, gateway, nodes = _network(monkeypatch)
+    radios[0].set_ce(False)
+    monkeypatch.setattr(radios[0], 'set_ce', lambda level: None)
+    _run(pi, gateway, nodes, 0.5)
+
+    statistics = gateway.get_statistics()
+    assert statistics['beacons'] == 0
+    assert statistics['missed'] > 0
+    assert gateway._nrf.is_tx_empty()
@@ -0,0 +1,21 @@
+import io
+import os
+
+from nrf24 import trace
+
+
+GOLDEN = os.path.join(os.path.dirname(__file__), 'golden')
+
+
+def test_every_method_has_a_scenario():
+    assert trace.uncovered() == []
+
+
+def test_check_fails_without_scenario(monkeypatch):
+    # A public method of NRF24 without a scenario fails the check, even though every radio state matches.
+    monkeypatch.delitem(trace.METHOD_SCENARIOS, 'get_fifo_status')
+    output = io.StringIO()
+
+    assert not trace.check(GOLDEN, file=output)
+    assert 'methods/get_fifo_status: FAILED, no scenario' in output.getvalue()
+    assert 'state OK' not in output.getvalue()
@@ -0,0 +1,71 @@
+import random
+import time
+
+import pytest
+
+from nrf24 import NRF24, RF24_CRC, RF24_DATA_RATE, RF24_PAYLOAD
+from nrf24.faults import Faults
+from nrf24.simulator import SimulatedPi, Simulator
+from nrf24.transfer import CHUNK_SIZE, TRANSFER_STATE, BulkReceiver, BulkSender, TransferError
+
+
+IMAGE_A = bytes(random.Random(1).randrange(256) for _ in range(100 * CHUNK_SIZE))
+IMAGE_B = bytes(random.Random(2).randrange(256) for _ in range(100 * CHUNK_SIZE))
+
+
+def _link(monkeypatch, crc_bytes=RF24_CRC.BYTES_2, **impairments):
+    # A sender and a receiver on one simulated pigpio connection, in virtual time, with the impairments given on the
+    # link from the sender to the receiver. The receiver is processed whenever the sender sleeps.
+    sim = Simulator(seed=1)
+    pi = SimulatedPi(sim, overhead=0.00005)
+    monkeypatch.setattr(time, 'monotonic', lambda: sim.now)
+
+    faults = Faults(seed=2)
+    sim.set_faults(faults)
+    radios = [pi.add_radio(ce=25, spi_channel=0), pi.add_radio(ce=22, spi_channel=1)]
+    faults.set_link(radios[0], radios[1], symmetric=False, **impairments)
+
+    settings = dict(payload_size=RF24_PAYLOAD.ACK, data_rate=RF24_DATA_RATE.RATE_2MBPS, crc_bytes=crc_bytes,
+                    spi_speed=8e6)
+    sender = NRF24(pi, 25, 0, **settings)
+    receiver = BulkReceiver(NRF24(pi, 22, 1, **settings), 'BULK1')
+
+    def sleep(seconds):
+        pi.sleep(seconds)
+        receiver.process()
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return sender, receiver
+
+
+def test_lost_chunks(monkeypatch):
+    sender, receiver = _link(monkeypatch, loss=0.2)
+    result = BulkSender(sender, 'BULK1').send(IMAGE_A)
+
+    assert receiver.get_state() == TRANSFER_STATE.COMPLETE
+    assert receiver.get_data() == IMAGE_A
+    assert result['retransmitted'] > 0
+    assert result['rounds'] > 1
+
+
+def test_restarted_sender(monkeypatch):
+    # A restarted sender starts from the same transfer id as the one before it, as both draw it from the same seed. A
+    # START with a different image is a new transfer all the same.
+    sender, receiver = _link(monkeypatch)
+    random.seed(3)
+    BulkSender(sender, 'BULK1').send(IMAGE_A)
+    assert receiver.get_data() == IMAGE_A
+
+    random.seed(3)
+    BulkSender(sender, 'BULK1').send(IMAGE_B)
+    assert receiver.get_data() == IMAGE_B
+
+
+def test_checksum_error(monkeypatch):
+    # Without CRC, bit errors go unnoticed by the radios, and are caught by the CRC32 of the whole buffer.
+    sender, receiver = _link(monkeypatch, crc_bytes=RF24_CRC.DISABLED, ber=0.0002)
+    with pytest.raises(TransferError, match='checksum'):
+        BulkSender(sender, 'BULK1').send(IMAGE_A)
+
+    assert receiver.get_state() == TRANSFER_STATE.CHECKSUM_ERROR
+    assert receiver.get_data() is None